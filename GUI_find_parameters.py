@@ -13,6 +13,9 @@ class FindParametersWindow:
         self.current_theme = globals.CURRENT_THEME
         self.entries = {}
         self.search_var = tk.StringVar(value="grid")
+        self.selection_metric_var = tk.StringVar(value="final_g_loss")
+        self.auto_batch_size_var = tk.BooleanVar(value=False)
+        self.warm_start_var = tk.BooleanVar(value=False)
         
         # Create window
         self.window = tk.Toplevel(parent)
@@ -70,6 +73,17 @@ class FindParametersWindow:
         )
         random_radio.pack(pady=2)
         
+        pbt_radio = tk.Radiobutton(
+            radio_frame, 
+            text="Population-Based Training (evolves a population of GANs)",
+            variable=self.search_var,
+            command=self.on_search_type_change,
+            value="pbt",
+            font=("Arial", 9), 
+            bg='lightgray'
+        )
+        pbt_radio.pack(pady=2)
+        
         self.info_label = tk.Label(
             radio_frame, 
             text="Grid search will try ALL parameter combinations",
@@ -102,6 +116,34 @@ class FindParametersWindow:
              "Batch size for training the GAN. Provide multiple values separated by commas for grid search.")
         ])
         
+        auto_batch_size_check = tk.Checkbutton(
+            left_column,
+            text="Benchmark batch sizes and skip slow ones",
+            variable=self.auto_batch_size_var,
+            font=("Arial", 8),
+            bg=self.current_theme['bg'],
+            fg=self.current_theme['text'],
+            selectcolor=self.current_theme['bg']
+        )
+        auto_batch_size_check.pack(pady=(0, 10), anchor='w')
+        ToolTip(auto_batch_size_check, "Measure the training speed of each batch size before the search and drop "
+                                       "those reaching less than half of the best samples per second. "
+                                       "With an empty batch size field 32 to 1024 are benchmarked.")
+        
+        warm_start_check = tk.Checkbutton(
+            left_column,
+            text="Warm start trials from compatible finished trials",
+            variable=self.warm_start_var,
+            font=("Arial", 8),
+            bg=self.current_theme['bg'],
+            fg=self.current_theme['text'],
+            selectcolor=self.current_theme['bg']
+        )
+        warm_start_check.pack(pady=(0, 10), anchor='w')
+        ToolTip(warm_start_check, "Trials with the same latent dimension and layers start from the weights of the best "
+                                  "finished trial instead of random initialization, only the optimizer settings change. "
+                                  "The weights of every trial are saved in its trial directory.")
+        
         # Right column entries
         self.create_column_entries(right_column, [
             ("learning_rate", "Learning rate values (Comma separated):",
@@ -124,6 +166,28 @@ class FindParametersWindow:
         self.numIterations_entry.pack(pady=(0, 10), fill='x')
         self.entries['iterations'] = self.numIterations_entry
         
+        # Metric used to pick the best trial
+        selection_metric_label = tk.Label(
+            right_column, 
+            text="Best trial selected by:",
+            font=("Arial", 8), 
+            bg=self.current_theme['bg'], 
+            fg=self.current_theme['text']
+        )
+        selection_metric_label.pack(pady=(10, 2), anchor='w')
+        
+        selection_metric_box = ttk.Combobox(
+            right_column,
+            textvariable=self.selection_metric_var,
+            values=["final_g_loss", "final_d_loss", "best_loss", "quality_score"],
+            state="readonly",
+            font=("Arial", 8)
+        )
+        selection_metric_box.pack(pady=(0, 10), fill='x')
+        ToolTip(selection_metric_box, "final_g_loss / final_d_loss: loss of the final (restored) models\n"
+                                      "best_loss: best smoothed early stopping loss\n"
+                                      "quality_score: distance between generated samples and the real data")
+        
         # Layer configurations (full width)
         self.create_layer_config_fields(right_column)
     
@@ -272,6 +336,18 @@ class FindParametersWindow:
                 text="Grid search will try ALL parameter combinations",
                 font=("Arial", 9, 'bold')
             )
+        elif search_type == "pbt":
+            # For population-based training, the iterations entry is the population size
+            self.numIterations_entry.config(state="normal", bg='white')
+            self.numIterations_label.config(
+                text="Population size (required for population-based training)",
+                fg=self.current_theme['text']
+            )
+            # Update info label
+            self.info_label.config(
+                text="Population-based training copies and perturbs the best GANs while training",
+                font=("Arial", 9, 'bold')
+            )
         else:  # random search
             # For random search, enable iterations entry and update label
             self.numIterations_entry.config(state="normal", bg='white')
@@ -345,7 +421,8 @@ class FindParametersWindow:
         # Parse all parameters
         return {
             'latent_dim': parse_int_list(self.entries['latent_dim'].get(), "Latent dimension"),
-            'batch_size': parse_int_list(self.entries['batch_size'].get(), "Batch size"),
+            'batch_size': (parse_int_list(self.entries['batch_size'].get(), "Batch size")
+                           if self.entries['batch_size'].get().strip() or not self.auto_batch_size_var.get() else []),
             'learning_rate': parse_float_list(self.entries['learning_rate'].get(), "Learning rate"),
             'beta1': parse_float_list(self.entries['beta1'].get(), "Beta1"),
             'gen_layers': parse_layer_config(self.entries['gen_layers'].get()),
@@ -377,13 +454,14 @@ class FindParametersWindow:
                 messagebox.showerror("Error", "Invalid epoch count! Please enter an integer.")
                 return
             
-            # Parse and validate iterations (only for random search)
+            # Parse and validate iterations (random search) or population size (population-based training)
             search_type = self.search_var.get()
             num_iterations = 0
-            if search_type == "random":
+            if search_type in ("random", "pbt"):
                 iterations_str = self.entries['iterations'].get().strip()
                 if not iterations_str:
-                    messagebox.showerror("Error", "Please enter number of iterations for random search!")
+                    what = "population size" if search_type == "pbt" else "number of iterations for random search"
+                    messagebox.showerror("Error", f"Please enter {what}!")
                     return
                 num_iterations = int(iterations_str)
             
@@ -434,6 +512,11 @@ class FindParametersWindow:
                 integer_columns=globals.INTEGER_COLUMNS,
                 gen_layers=params['gen_layers'],
                 disc_layers=params['disc_layers'],
+                selection_metric=self.selection_metric_var.get(),
+                auto_batch_size=self.auto_batch_size_var.get(),
+                warm_start=self.warm_start_var.get(),
+                intra_op_threads=globals.INTRA_OP_THREADS,
+                inter_op_threads=globals.INTER_OP_THREADS,
                 progress_callback=lambda current, total: self.update_progress(
                     progress_var, progress_label, current, total
                 )
@@ -40,7 +40,8 @@ class GenerateSamplesWindow:
         
         # Target class input
         target_entry = self.create_labeled_entry("target_class", "Target class (optional)", font_size=10)
-        ToolTip(target_entry, "Specific class to generate. Leave empty to generate mixed classes.")
+        ToolTip(target_entry, "Specific class to generate, or an exact class mix such as '0:400, 1:400, 2:200' "
+                              "(the sample size is then the sum). Leave empty to generate mixed classes.")
         
         # Sample size input
         sample_entry = self.create_labeled_entry("sample_size", "Number of samples to generate", 
@@ -59,7 +60,7 @@ class GenerateSamplesWindow:
         # Create optional parameter entries
         optional_params = [
             ("epochs", "Epochs", "Number of training epochs for the GAN. Default is 1000."),
-            ("batch_size", "Batch size", "Batch size for training the GAN. Default is 96."),
+            ("batch_size", "Batch size", "Batch size for training the GAN. Default is 96. Enter 'auto' to benchmark and pick a fast batch size."),
             ("latent_dim", "Latent dimension", "Dimensionality of the latent space. Default is 20."),
             ("learning_rate", "Learning rate", "Learning rate for the GAN optimizer. Default is 0.0001."),
             ("beta1", "Beta1", "Beta1 parameter for the Adam optimizer. Default is 0.5.")
@@ -143,6 +144,17 @@ class GenerateSamplesWindow:
         except ValueError:
             raise ValueError("Layer configuration must be comma-separated integers (e.g., '256,512,1024')")
     
+    def parse_class_counts(self, counts_string):
+        """Parse 'label:count' pairs into a dictionary of class counts"""
+        class_counts = {}
+        for pair in counts_string.split(','):
+            label, _, count = pair.partition(':')
+            try:
+                class_counts[label.strip()] = int(count)
+            except ValueError:
+                raise ValueError("Class mix must be comma-separated label:count pairs (e.g., '0:400, 1:400, 2:200')")
+        return class_counts
+    
     def start_generation(self):
         """Start the sample generation process"""
         try:
@@ -159,15 +171,23 @@ class GenerateSamplesWindow:
                 messagebox.showerror("Error", "Please enter a class column name!")
                 return
             
-            sample_size = int(self.entries['sample_size'].get())
+            # A class mix sets the sample size, a single target class uses the sample size field
+            target_string = self.entries['target_class'].get().strip()
+            class_counts = self.parse_class_counts(target_string) if ':' in target_string else None
+            if class_counts is not None:
+                sample_size = sum(class_counts.values())
+            else:
+                sample_size = int(self.entries['sample_size'].get())
             if sample_size <= 0:
                 messagebox.showerror("Error", "Sample size must be a positive integer!")
                 return
             
             # Get optional parameters with defaults
-            target_class = int(self.entries['target_class'].get()) if self.entries['target_class'].get() else None
+            target_class = int(target_string) if target_string and class_counts is None else None
             epochs = int(self.entries['epochs'].get()) if self.entries['epochs'].get() else 1000
-            batch_size = int(self.entries['batch_size'].get()) if self.entries['batch_size'].get() else 96
+            batch_size_str = self.entries['batch_size'].get().strip()
+            auto_batch_size = batch_size_str.lower() == 'auto'
+            batch_size = int(batch_size_str) if batch_size_str and not auto_batch_size else 96
             latent_dim = int(self.entries['latent_dim'].get()) if self.entries['latent_dim'].get() else 20
             learning_rate = float(self.entries['learning_rate'].get()) if self.entries['learning_rate'].get() else 0.0001
             beta1 = float(self.entries['beta1'].get()) if self.entries['beta1'].get() else 0.5
@@ -195,23 +215,26 @@ class GenerateSamplesWindow:
                 integer_columns=globals.INTEGER_COLUMNS,
                 latent_dim=latent_dim,
                 learning_rate=learning_rate,
-                beta1=beta1
+                beta1=beta1,
+                gen_layers=gen_layers,
+                disc_layers=disc_layers,
+                intra_op_threads=globals.INTRA_OP_THREADS,
+                inter_op_threads=globals.INTER_OP_THREADS
             )
             
-            # Rebuild GAN with custom layers if specified
-            if gen_layers is not None or disc_layers is not None:
-                gan.rebuild_with_params(
-                    gen_layers=gen_layers,
-                    disc_layers=disc_layers,
-                    learning_rate=learning_rate,
-                    beta1=beta1
-                )
+            if auto_batch_size:
+                batch_size = gan.recommend_batch_size()
+                progress_label.config(text=f"Training GAN with batch size {batch_size}...")
+                self.window.update()
             
             # Train the GAN
             history = gan.train(epochs=epochs, batch_size=batch_size, verbose=1)
             
             # Generate samples
-            generated_samples = gan.generate_samples(sample_size, target_class=target_class)
+            if class_counts is not None:
+                generated_samples = gan.generate_samples(class_counts=class_counts)
+            else:
+                generated_samples = gan.generate_samples(sample_size, target_class=target_class)
             
             # Save generated samples
             output_filename = f"Generated_Samples_{sample_size}.csv"
@@ -1,7 +1,11 @@
 # Global variables to store application state
 FILENAME = ""
 SAVEPATH = ""
-INTEGER_COLUMNS = []
+# None detects the integer columns from the data
+INTEGER_COLUMNS = None
+# TensorFlow thread pool sizes: None for the default, an integer or 'auto'
+INTRA_OP_THREADS = None
+INTER_OP_THREADS = None
 
 LIGHT_MODE = {
     'bg': 'white',
@@ -16,7 +16,7 @@ class SetupPathsWindow:
         # Create window
         self.window = tk.Toplevel(parent)
         self.window.title("Setup File and Save Path")
-        self.window.geometry("1300x700")
+        self.window.geometry("1300x850")
         self.window.configure(bg=self.current_theme['bg'])
         self.window.resizable(width=False, height=False)
         
@@ -28,6 +28,8 @@ class SetupPathsWindow:
         self.file_status_label = None
         self.path_status_label = None
         self.integer_entry = None
+        self.intra_threads_entry = None
+        self.inter_threads_entry = None
         
         self.setup_ui()
     
@@ -47,6 +49,7 @@ class SetupPathsWindow:
         self.create_file_section()
         self.create_integer_columns_section()
         self.create_save_path_section()
+        self.create_threads_section()
         self.create_control_buttons()
     
     def create_file_section(self):
@@ -97,7 +100,7 @@ class SetupPathsWindow:
         
         integer_info_label = tk.Label(
             integer_frame, 
-            text="Enter column names that should be treated as integers, separated by commas:",
+            text="Enter column names that should be treated as integers, separated by commas (empty detects them from the data):",
             font=("Arial", 10), 
             bg=self.current_theme['bg'], 
             fg=self.current_theme['text']
@@ -140,6 +143,57 @@ class SetupPathsWindow:
         )
         self.path_status_label.pack(pady=5)
     
+    def create_threads_section(self):
+        threads_frame = tk.Frame(self.window, bg=self.current_theme['bg'])
+        threads_frame.pack(pady=20, padx=20, fill='x')
+        
+        threads_section_label = tk.Label(
+            threads_frame, 
+            text="4. CPU Threads (Optional)",
+            font=("Arial", 12, "bold"), 
+            bg=self.current_theme['bg'], 
+            fg=self.current_theme['text']
+        )
+        threads_section_label.pack(anchor='w', pady=(0, 10))
+        
+        threads_info_label = tk.Label(
+            threads_frame, 
+            text="Intra-op and inter-op thread counts for TensorFlow. Leave empty for the default, "
+                 "enter 'auto' to benchmark and remember the fastest setting for this machine:",
+            font=("Arial", 10), 
+            bg=self.current_theme['bg'], 
+            fg=self.current_theme['text']
+        )
+        threads_info_label.pack(anchor='w', pady=(0, 5))
+        
+        entries_frame = tk.Frame(threads_frame, bg=self.current_theme['bg'])
+        entries_frame.pack(anchor='w')
+        for label_text, attribute, value in (("Intra-op:", 'intra_threads_entry', globals.INTRA_OP_THREADS),
+                                             ("Inter-op:", 'inter_threads_entry', globals.INTER_OP_THREADS)):
+            tk.Label(
+                entries_frame, 
+                text=label_text,
+                font=("Arial", 10), 
+                bg=self.current_theme['bg'], 
+                fg=self.current_theme['text']
+            ).pack(side='left', padx=(0, 5))
+            entry = tk.Entry(entries_frame, font=("Arial", 10), width=10)
+            if value is not None:
+                entry.insert(0, str(value))
+            entry.pack(side='left', padx=(0, 20))
+            setattr(self, attribute, entry)
+    
+    def parse_threads(self, entry, name):
+        """Parse a thread count entry: empty, 'auto' or a positive integer"""
+        value = entry.get().strip().lower()
+        if not value:
+            return None
+        if value == 'auto':
+            return 'auto'
+        if not value.isdigit() or int(value) <= 0:
+            raise ValueError(f"{name} threads must be a positive integer or 'auto'")
+        return int(value)
+    
     def create_control_buttons(self):
         button_frame = tk.Frame(self.window, bg=self.current_theme['bg'])
         button_frame.pack(pady=30)
@@ -190,12 +244,22 @@ class SetupPathsWindow:
     
     def close_setup(self):
         """Close setup window and save configuration"""
+        try:
+            intra_threads = self.parse_threads(self.intra_threads_entry, "Intra-op")
+            inter_threads = self.parse_threads(self.inter_threads_entry, "Inter-op")
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        globals.INTRA_OP_THREADS = intra_threads
+        globals.INTER_OP_THREADS = inter_threads
+        
         # Process integer columns input
         integer_input = self.integer_entry.get().strip()
         if integer_input:
             globals.INTEGER_COLUMNS = [col.strip() for col in integer_input.split(',') if col.strip()]
         else:
-            globals.INTEGER_COLUMNS = []
+            # Detected from the data file's schema
+            globals.INTEGER_COLUMNS = None
         
         if globals.FILENAME and globals.SAVEPATH:
             messagebox.showinfo(
@@ -203,7 +267,7 @@ class SetupPathsWindow:
                 f"Configuration saved!\n\n"
                 f"Data file: {os.path.basename(globals.FILENAME)}\n"
                 f"Save location: {globals.SAVEPATH}\n"
-                f"Integer columns: {', '.join(globals.INTEGER_COLUMNS) if globals.INTEGER_COLUMNS else 'None'}"
+                f"Integer columns: {', '.join(globals.INTEGER_COLUMNS) if globals.INTEGER_COLUMNS else 'detected from the data'}"
             )
             self.window.destroy()
         else:
@@ -246,15 +310,15 @@ def closeSetup(window, integer_entry):
     if integer_input:
         globals.INTEGER_COLUMNS = [col.strip() for col in integer_input.split(',') if col.strip()]
     else:
-        globals.INTEGER_COLUMNS = []
+        globals.INTEGER_COLUMNS = None
     
     if globals.FILENAME and globals.SAVEPATH:
-        integer_info = f" (Integer columns: {len(globals.INTEGER_COLUMNS)})" if globals.INTEGER_COLUMNS else " (No integer columns specified)"
+        integer_info = f" (Integer columns: {len(globals.INTEGER_COLUMNS)})" if globals.INTEGER_COLUMNS else " (Integer columns detected from the data)"
         messagebox.showinfo("Setup Complete", 
                            f"Configuration saved!\n\n"
                            f"Data file: {os.path.basename(globals.FILENAME)}\n"
                            f"Save location: {globals.SAVEPATH}\n"
-                           f"Integer columns: {', '.join(globals.INTEGER_COLUMNS) if globals.INTEGER_COLUMNS else 'None'}")
+                           f"Integer columns: {', '.join(globals.INTEGER_COLUMNS) if globals.INTEGER_COLUMNS else 'detected from the data'}")
         window.destroy()
     else:
         response = messagebox.askyesno("Incomplete Setup", 
@@ -0,0 +1,297 @@
+"""
+Command line interface for training, tuning and sampling without the GUI
+
+    python -m gan_cli train data.csv --class-column income --epochs 2000 --export model_dir --samples 1000
+    python -m gan_cli generate model_dir 1000000 --output samples.csv --workers 8
+    python -m gan_cli tflite model_dir --quantization int8 --check
+    python -m gan_cli tune data.csv --class-column income --search-type random --iterations 20
+    python -m gan_cli worker queue_dir --wait
+    python -m gan_cli serve adult=model_dir --port 8765
+    python -m gan_cli pipeline pipeline.json
+    python -m gan_cli schema data.csv
+
+The CLI never imports tkinter, and matplotlib only for the plots of a tuning run.
+"""
+import argparse
+import json
+import os
+import sys
+
+
+def parse_list(value, cast=str):
+    """Parse a comma-separated list, an empty value gives None"""
+    if value is None or not value.strip():
+        return None
+    return [cast(item.strip()) for item in value.split(',') if item.strip()]
+
+
+def parse_layer_configs(value):
+    """Parse semicolon-separated layer configurations such as '256,512;128,256'"""
+    if value is None or not value.strip():
+        return None
+    return [parse_list(config, int) for config in value.split(';') if config.strip()]
+
+
+def parse_class_counts(value):
+    """Parse 'label:count' pairs into a dictionary of class counts"""
+    if value is None:
+        return None
+    class_counts = {}
+    for pair in value.split(','):
+        label, separator, count = pair.partition(':')
+        if not separator:
+            raise argparse.ArgumentTypeError(f"Class counts must be label:count pairs, got '{pair}'")
+        class_counts[label.strip()] = int(count)
+    return class_counts
+
+
+def parse_threads(value):
+    """Thread count: an integer, 'auto' or None"""
+    if value is None or value == 'auto':
+        return value
+    return int(value)
+
+
+def write_samples(samples, output, output_format=None):
+    """Write samples as csv (semicolon separated), json or arrow, the format defaults to the file extension"""
+    output_format = output_format or os.path.splitext(output)[1].lstrip('.').lower() or 'csv'
+    if output_format == 'csv':
+        samples.to_csv(output, sep=';', index=False)
+    else:
+        from gan_sample_server import encode_samples
+
+        with open(output, 'wb') as f:
+            f.write(encode_samples(samples, output_format))
+    print(f"Wrote {len(samples)} samples to {output}")
+
+
+def add_data_arguments(parser):
+    parser.add_argument('data', help='Semicolon separated CSV file')
+    parser.add_argument('--class-column', required=True, help='Name of the class column')
+    parser.add_argument('--integer-columns', default=None,
+                        help='Comma-separated integer columns (default: detected from the data, see gan_schema.py)')
+    parser.add_argument('--intra-op-threads', type=parse_threads, default=None,
+                        help="TensorFlow intra-op threads, an integer or 'auto'")
+    parser.add_argument('--inter-op-threads', type=parse_threads, default=None,
+                        help="TensorFlow inter-op threads, an integer or 'auto'")
+    parser.add_argument('--preprocess-chunk-size', type=int, default=None,
+                        help='Preprocess the data in chunks of this many rows into memory-mapped files')
+    parser.add_argument('--batch-sampler', default='uniform', choices=['uniform', 'stratified', 'balanced'],
+                        help='How the real rows of a batch are drawn: uniformly, with the class shares of the '
+                             'data in every batch, or with class weights count ** --class-weight-power')
+    parser.add_argument('--class-weight-power', type=float, default=0.0,
+                        help='Exponent of the class counts for --batch-sampler balanced, 0 for equal classes')
+
+
+def add_sample_arguments(parser):
+    parser.add_argument('--output', default=None, help='Output file (.csv, .json or .arrow)')
+    parser.add_argument('--format', dest='output_format', default=None, choices=['csv', 'json', 'arrow'],
+                        help='Output format, defaults to the extension of --output')
+
+
+def cmd_train(args):
+    from tabular_gan_modified import TabularGAN
+
+    gan = TabularGAN(
+        args.data,
+        class_column=args.class_column,
+        integer_columns=parse_list(args.integer_columns),
+        latent_dim=args.latent_dim,
+        learning_rate=args.learning_rate,
+        beta1=args.beta1,
+        gen_layers=parse_list(args.gen_layers, int),
+        disc_layers=parse_list(args.disc_layers, int),
+        intra_op_threads=args.intra_op_threads,
+        inter_op_threads=args.inter_op_threads,
+        categorical_columns=parse_list(args.categorical_columns),
+        class_encoding=args.class_encoding,
+        preprocess_chunk_size=args.preprocess_chunk_size
+    )
+    batch_size = gan.recommend_batch_size() if args.batch_size == 'auto' else int(args.batch_size)
+    history = gan.train(args.epochs, batch_size, patience=args.patience if args.patience > 0 else None,
+                        batch_sampler=args.batch_sampler, class_weight_power=args.class_weight_power)
+    print(f"Trained {len(history['g_loss'])} steps with batch size {batch_size}")
+
+    if args.export:
+        gan.export_generator(args.export, tflite_quantization=args.export_tflite)
+        print(f"Exported generator to {args.export}")
+    class_counts = parse_class_counts(args.class_counts)
+    if args.samples or class_counts:
+        if class_counts:
+            samples = gan.generate_samples(class_counts=class_counts)
+        else:
+            samples = gan.generate_samples(args.samples, target_class=args.target_class)
+        write_samples(samples, args.output or f"Generated_Samples_{len(samples)}.csv", args.output_format)
+
+
+def cmd_generate(args):
+    if args.workers > 1:
+        from gan_sampling import generate_sharded
+
+        if args.output_format not in (None, 'csv'):
+            raise SystemExit("Sharded generation writes csv shards")
+        generate_sharded(args.model_dir, args.n, args.workers, args.output or 'shards', args.seed, args.chunk_size,
+                         args.backend)
+        return
+
+    import numpy as np
+    from gan_sampling import SavedGenerator
+
+    generator = SavedGenerator(args.model_dir, args.backend)
+    samples = generator.generate(args.n, np.random.default_rng(args.seed))
+    write_samples(samples, args.output or f"Generated_Samples_{args.n}.csv", args.output_format)
+
+
+def cmd_tflite(args):
+    from gan_sampling import check_tflite, export_tflite
+
+    path = export_tflite(args.model_dir, args.quantization, args.calibration_rows)
+    print(f"Wrote {path} ({os.path.getsize(path) / 1024:.0f} KB)")
+    if args.check:
+        check_tflite(args.model_dir, args.check_samples, num_threads=args.threads)
+
+
+def cmd_tune(args):
+    from gan_parameter_tuning import search
+
+    search(
+        args.class_column, args.epochs, args.iterations,
+        parse_list(args.latent_dim, int), parse_list(args.batch_size, int),
+        parse_list(args.learning_rate, float), parse_list(args.beta1, float),
+        data_path=args.data,
+        gen_layers=parse_layer_configs(args.gen_layers),
+        disc_layers=parse_layer_configs(args.disc_layers),
+        results_dir=args.results_dir,
+        search_type=args.search_type,
+        integer_columns=parse_list(args.integer_columns),
+        early_stopping=json.loads(args.early_stopping) if args.early_stopping else None,
+        selection_metric=args.selection_metric,
+        queue_dir=args.queue_dir,
+        auto_batch_size=args.auto_batch_size,
+        intra_op_threads=args.intra_op_threads,
+        inter_op_threads=args.inter_op_threads,
+        warm_start=args.warm_start,
+        pbt_rounds=args.pbt_rounds,
+        fidelities=parse_list(args.fidelities, float),
+        promote_fraction=args.promote_fraction,
+        early_stop_patience=args.patience,
+        memory_limit_mb=args.memory_limit_mb,
+        history_stream_every=args.history_stream_every,
+        curve_max_points=args.curve_max_points if args.curve_max_points > 0 else None,
+        preprocess_chunk_size=args.preprocess_chunk_size,
+        batch_sampler=args.batch_sampler,
+        class_weight_power=args.class_weight_power
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='gan_cli', description='TabularGAN without the GUI')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train = subparsers.add_parser('train', help='Train a GAN, export it and/or generate samples')
+    add_data_arguments(train)
+    train.add_argument('--categorical-columns', default=None,
+                       help='Comma-separated categorical feature columns (default: detect non-numeric columns)')
+    train.add_argument('--class-encoding', default='auto', choices=['auto', 'onehot', 'index'],
+                       help='Class column encoding')
+    train.add_argument('--latent-dim', type=int, default=20, help='Size of the noise vector')
+    train.add_argument('--learning-rate', type=float, default=0.0001, help='Adam learning rate')
+    train.add_argument('--beta1', type=float, default=0.5, help='Adam beta1')
+    train.add_argument('--gen-layers', default=None, help="Generator hidden layers, e.g. '256,512,1024'")
+    train.add_argument('--disc-layers', default=None, help="Discriminator hidden layers, e.g. '768,512,256'")
+    train.add_argument('--epochs', type=int, default=1000, help='Training steps')
+    train.add_argument('--batch-size', default='96', help="Batch size or 'auto' to benchmark")
+    train.add_argument('--patience', type=int, default=5, help='Early stopping patience, 0 disables it')
+    train.add_argument('--export', default=None, help='Export the generator to this directory')
+    train.add_argument('--export-tflite', default=None, choices=['float32', 'dynamic', 'int8'],
+                       help='Also write generator.tflite with this quantization to the export')
+    train.add_argument('--samples', type=int, default=0, help='Number of samples to generate after training')
+    train.add_argument('--target-class', default=None, help='Generate only this class')
+    train.add_argument('--class-counts', default=None, help="Exact class mix, e.g. '0:400,1:400,2:200'")
+    add_sample_arguments(train)
+    train.set_defaults(func=cmd_train)
+
+    generate = subparsers.add_parser('generate', help='Generate samples from an exported generator')
+    generate.add_argument('model_dir', help='Directory written by train --export')
+    generate.add_argument('n', type=int, help='Number of samples')
+    generate.add_argument('--seed', type=int, default=None, help='Random seed')
+    generate.add_argument('--workers', type=int, default=1,
+                          help='Worker processes, more than one writes csv shards and a manifest to --output')
+    generate.add_argument('--chunk-size', type=int, default=100000, help='Rows written at a time per worker')
+    generate.add_argument('--backend', default='keras', choices=['keras', 'tflite'],
+                          help='Run the Keras generator or the generator.tflite of the export')
+    add_sample_arguments(generate)
+    generate.set_defaults(func=cmd_generate)
+
+    tflite = subparsers.add_parser('tflite', help='Add a quantized TFLite generator to an export and check it')
+    tflite.add_argument('model_dir', help='Directory written by train --export')
+    tflite.add_argument('--quantization', default='dynamic', choices=['float32', 'dynamic', 'int8'],
+                        help='Weights only (dynamic) or weights and activations (int8, calibrated on noise)')
+    tflite.add_argument('--calibration-rows', type=int, default=1000, help='Rows of noise for the int8 calibration')
+    tflite.add_argument('--check', action='store_true',
+                        help='Compare rows/s and column distributions with the float model')
+    tflite.add_argument('--check-samples', type=int, default=20000, help='Rows generated by each model for --check')
+    tflite.add_argument('--threads', type=int, default=None, help='Threads of the TFLite interpreter')
+    tflite.set_defaults(func=cmd_tflite)
+
+    tune = subparsers.add_parser('tune', help='Search hyperparameters')
+    add_data_arguments(tune)
+    tune.add_argument('--search-type', default='grid', choices=['grid', 'random', 'pbt'], help='Search method')
+    tune.add_argument('--epochs', type=int, default=1000, help='Maximum training steps per trial')
+    tune.add_argument('--iterations', type=int, default=10,
+                      help='Random search iterations or population size of population-based training')
+    tune.add_argument('--latent-dim', default='20', help='Comma-separated latent dimensions')
+    tune.add_argument('--batch-size', default='', help='Comma-separated batch sizes')
+    tune.add_argument('--learning-rate', default='0.0001', help='Comma-separated learning rates')
+    tune.add_argument('--beta1', default='0.5', help='Comma-separated beta1 values')
+    tune.add_argument('--gen-layers', default=None, help="Generator layer configurations, e.g. '256,512;128,256'")
+    tune.add_argument('--disc-layers', default=None, help="Discriminator layer configurations")
+    tune.add_argument('--results-dir', default='tuning_results', help='Directory for the results')
+    tune.add_argument('--selection-metric', default='final_g_loss',
+                      choices=['final_g_loss', 'final_d_loss', 'best_loss', 'quality_score'],
+                      help='Metric used to pick the best trial')
+    tune.add_argument('--patience', type=int, default=10, help='Early stopping patience per trial')
+    tune.add_argument('--early-stopping', default=None,
+                      help='JSON with EarlyStopping options, e.g. \'{"smoothing": "ema", "min_delta": 0.001}\'')
+    tune.add_argument('--auto-batch-size', action='store_true', help='Benchmark and select the batch sizes')
+    tune.add_argument('--warm-start', action='store_true', help='Start trials from compatible finished trials')
+    tune.add_argument('--queue-dir', default=None, help='Shared work queue directory for multi-node tuning')
+    tune.add_argument('--pbt-rounds', type=int, default=10, help='Rounds of population-based training')
+    tune.add_argument('--fidelities', default=None, help="Comma-separated row fractions, e.g. '0.05,0.25,1'")
+    tune.add_argument('--promote-fraction', type=float, default=1/3, help='Fraction promoted per fidelity')
+    tune.add_argument('--memory-limit-mb', type=float, default=None,
+                      help='Abort trials whose resident memory exceeds this many megabytes')
+    tune.add_argument('--history-stream-every', type=int, default=None,
+                      help='Append the history of each trial to history.f32 every this many steps')
+    tune.add_argument('--curve-max-points', type=int, default=2000,
+                      help='Points per learning curve series, 0 plots every step')
+    tune.set_defaults(func=cmd_tune)
+
+    # Listed for the help text, main() hands their arguments to the modules' own parsers
+    subparsers.add_parser('worker', help='Run trials from a work queue (see gan_work_queue.py --help)')
+    subparsers.add_parser('serve', help='Serve samples over HTTP (see gan_sample_server.py --help)')
+    subparsers.add_parser('schema', help='Infer and save the column types of a data file (see gan_schema.py --help)')
+    subparsers.add_parser('pipeline', help='Run a cached pipeline from a config file (see gan_pipeline.py --help)')
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'worker':
+        from gan_work_queue import main as worker_main
+        return worker_main(argv[1:])
+    if argv and argv[0] == 'serve':
+        from gan_sample_server import main as serve_main
+        return serve_main(argv[1:])
+    if argv and argv[0] == 'schema':
+        from gan_schema import main as schema_main
+        return schema_main(argv[1:])
+    if argv and argv[0] == 'pipeline':
+        from gan_pipeline import main as pipeline_main
+        return pipeline_main(argv[1:])
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
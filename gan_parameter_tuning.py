@@ -1,12 +1,16 @@
-import pandas as pd
 import numpy as np
 #import matplotlib.pyplot as plt
 from sklearn.model_selection import ParameterGrid
 import json
 import os
+import time
 from datetime import datetime
-from tabular_gan_modified import TabularGAN
-from matplotlib import pyplot as plt
+from tabular_gan_modified import TabularGAN, EarlyStopping, TrainingHistory
+from gan_quality import SampleQualityScorer, read_csv_sample
+from gan_schema import load_schema
+from gan_resources import MemoryLimitExceeded, ResourceMonitor
+from gan_results_store import TrialResultsStore
+from gan_work_queue import WorkQueue
 
 def convert_numpy_types(obj):
     """Convert numpy types to native Python types for JSON serialization"""
@@ -22,21 +26,159 @@ def convert_numpy_types(obj):
         return [convert_numpy_types(item) for item in obj]
     return obj
 
+def downsample_min_max(values, max_points):
+    """
+    Shape-preserving downsample of a per-step series to at most max_points points
+
+    The steps are split into max_points // 2 equal buckets and the minimum and maximum of
+    every bucket are kept in step order, so spikes and the envelope of a noisy loss survive.
+
+    Returns:
+        Step numbers (starting at 1) and values of the kept points
+    """
+    values = np.asarray(values)
+    n_steps = len(values)
+    if max_points is None or n_steps <= max_points:
+        return np.arange(1, n_steps + 1), values
+    bucket_size = -(-n_steps // max(max_points // 2, 1))
+    n_buckets = -(-n_steps // bucket_size)
+    # Pad the last bucket with the last value, argmin/argmax return its first (real) occurrence
+    buckets = np.pad(values, (0, n_buckets * bucket_size - n_steps), mode='edge').reshape(n_buckets, bucket_size)
+    starts = np.arange(n_buckets) * bucket_size
+    kept = np.sort(np.stack([starts + buckets.argmin(axis=1), starts + buckets.argmax(axis=1)], axis=1), axis=1)
+    kept = np.minimum(kept.ravel(), n_steps - 1)
+    return kept + 1, values[kept]
+
+def moving_average(values, window):
+    """Trailing mean over window steps (fewer at the start), computed with one cumulative sum"""
+    cumsum = np.cumsum(np.asarray(values, dtype=np.float64))
+    averages = cumsum.copy()
+    averages[window:] = cumsum[window:] - cumsum[:-window]
+    return averages / np.minimum(np.arange(1, len(cumsum) + 1), window)
+
 class GANTuner:
-    def __init__(self, data_path, class_column, integer_columns = None, results_dir="tuning_results"):
+    # Metrics that can be used to pick the best trial, all of them are minimized
+    SELECTION_METRICS = ('final_g_loss', 'final_d_loss', 'best_loss', 'quality_score')
+    # Parameters that must match for weights to be transferable between trials
+    ARCHITECTURE_PARAMS = ('latent_dim', 'gen_layers', 'disc_layers')
+
+    def __init__(self, data_path, class_column, integer_columns = None, results_dir="tuning_results",
+                 early_stopping=None, selection_metric='final_g_loss', score_max_rows=20000, store_path=None,
+                 intra_op_threads=None, inter_op_threads=None, warm_start=False, fidelities=None, promote_fraction=1/3,
+                 memory_limit_mb=None, history_stream_every=None, curve_max_points=2000,
+                 preprocess_chunk_size=None, batch_sampler='uniform', class_weight_power=0.0):
+        """
+        Args:
+            data_path: Path to the semicolon separated CSV file
+            class_column: Name of the class column
+            integer_columns: Columns restored as integers in generated samples
+            results_dir: Directory for trial results
+            early_stopping: Keyword arguments for EarlyStopping (e.g. smoothing, min_delta, warmup),
+                the patience is taken from early_stop_patience of the search methods
+            selection_metric: Metric used to pick the best trial, one of SELECTION_METRICS
+            score_max_rows: Maximum number of real and generated rows used by the quality scorer
+            store_path: SQLite file for the trial results, defaults to results.sqlite in results_dir
+            intra_op_threads: TensorFlow intra-op threads for the trials, 'auto' to auto-tune (see TabularGAN)
+            inter_op_threads: TensorFlow inter-op threads for the trials
+            warm_start: Save the weights of every trial and initialize new trials from the best finished
+                trial of this search with the same latent_dim, gen_layers and disc_layers
+            fidelities: Increasing fractions of the rows to screen the trials on, e.g. [0.05, 0.25, 1.0].
+                Each fidelity trains on a stratified subsample with the same fraction of the epochs, and
+                only the best promote_fraction of the trials move on to the next one. The full data is
+                always the last fidelity. None trains every trial on the full data.
+            promote_fraction: Fraction of the trials promoted from one fidelity to the next
+            memory_limit_mb: Resident memory in megabytes above which a trial is aborted between two
+                training steps and recorded with status 'aborted', None for no limit
+            history_stream_every: Append the training history of every trial to history.f32 in its trial
+                directory every this many steps (read it with TrainingHistory.load), None keeps it in memory
+            curve_max_points: Points per series in the learning curve plots, longer runs are downsampled
+                (min/max per bucket) so plotting takes the same time for any run length; None plots every step
+            preprocess_chunk_size: Preprocess the data in chunks of this many rows into memory-mapped files
+                (see TabularGAN), None loads it at once
+            batch_sampler: How the real rows of a training batch are drawn, 'uniform', 'stratified' or
+                'balanced' (see TabularGAN.train)
+            class_weight_power: Exponent of the class counts for the 'balanced' sampler
+        """
+        if selection_metric not in self.SELECTION_METRICS:
+            raise ValueError(f"Unknown selection metric '{selection_metric}', expected one of {self.SELECTION_METRICS}")
         self.data_path = data_path
         self.class_column = class_column
         self.integer_columns = integer_columns
         self.results_dir = results_dir
+        self.early_stopping = early_stopping or {}
+        self.selection_metric = selection_metric
+        self.score_max_rows = score_max_rows
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.warm_start = warm_start
+        self.fidelities = self._check_fidelities(fidelities)
+        self.promote_fraction = promote_fraction
+        self.memory_limit_mb = memory_limit_mb
+        self.history_stream_every = history_stream_every
+        self.curve_max_points = curve_max_points
+        self.preprocess_chunk_size = preprocess_chunk_size
+        self.batch_sampler = batch_sampler
+        self.class_weight_power = class_weight_power
+        self._scorer = None
+        # Compiled models of the most recently used architectures, reused by later trials of this process
+        self._model_cache = {}
+        # Stratified row subsamples by fidelity, drawn once and reused by all trials
+        self._row_subsamples = {}
         
         # Create results directory if it doesn't exist
         if not os.path.exists(results_dir):
             os.makedirs(results_dir)
             
-        # For storing results
-        self.results = []
+        # Trials are appended to the store as they complete, nothing is kept in memory
+        if store_path is None:
+            store_path = os.path.join(results_dir, "results.sqlite")
+        self.store = TrialResultsStore(store_path)
+        self.run_id = datetime.now().strftime('%Y%m%d-%H%M%S-') + os.urandom(3).hex()
+    
+    @property
+    def results(self):
+        """Parameters and metrics of the trials of this tuner, read from the results store"""
+        return [
+            {'trial_num': trial['trial_num'], 'params': trial['params'], **trial['metrics']}
+            for trial in self.store.query(run_id=self.run_id)
+        ]
+    
+    def config(self):
+        """Constructor arguments needed to recreate this tuner in another process"""
+        return {
+            'data_path': self.data_path,
+            'class_column': self.class_column,
+            'integer_columns': self.integer_columns,
+            'results_dir': self.results_dir,
+            'early_stopping': self.early_stopping,
+            'selection_metric': self.selection_metric,
+            'score_max_rows': self.score_max_rows,
+            'intra_op_threads': self.intra_op_threads,
+            'inter_op_threads': self.inter_op_threads,
+            'warm_start': self.warm_start,
+            'fidelities': list(self.fidelities),
+            'promote_fraction': self.promote_fraction,
+            'memory_limit_mb': self.memory_limit_mb,
+            'history_stream_every': self.history_stream_every,
+            'curve_max_points': self.curve_max_points,
+            'preprocess_chunk_size': self.preprocess_chunk_size,
+            'batch_sampler': self.batch_sampler,
+            'class_weight_power': self.class_weight_power
+        }
+    
+    @staticmethod
+    def _check_fidelities(fidelities):
+        if not fidelities:
+            return (1.0,)
+        fidelities = [float(fidelity) for fidelity in fidelities]
+        if any(not 0 < fidelity <= 1 for fidelity in fidelities) or fidelities != sorted(set(fidelities)):
+            raise ValueError(f"Fidelities must be increasing fractions in (0, 1], got {fidelities}")
+        if fidelities[-1] < 1:
+            fidelities.append(1.0)
+        return tuple(fidelities)
         
-    def run_grid_search(self, param_grid, n_samples=500, epochs=1000, early_stop_patience=10, progress_callback=None):
+    def run_grid_search(self, param_grid, n_samples=500, epochs=1000, early_stop_patience=10, progress_callback=None,
+                        queue_dir=None, lease_timeout=600):
         """
         Run grid search over parameter combinations
         
@@ -45,66 +187,26 @@ class GANTuner:
             n_samples: Number of samples to generate for evaluation
             epochs: Maximum number of epochs for each trial
             early_stop_patience: Patience for early stopping
+            queue_dir: Shared directory for a work queue, trials are then run by gan_work_queue workers
+            lease_timeout: Seconds without a worker heartbeat after which a queued trial is handed out again
         """
         # Create parameter combinations
-        param_combinations = list(ParameterGrid(param_grid))
-        total_trials = len(param_combinations)
+        param_combinations = [convert_numpy_types(params) for params in ParameterGrid(param_grid)]
         print(f"Running grid search with {len(param_combinations)} parameter combinations")
         
-        for i, params in enumerate(param_combinations):
-            print(f"\nTrial {i+1}/{total_trials}")
-            print(f"Parameters: {params}")
-            
-            if progress_callback:
-                progress_callback(i, total_trials)
+        if queue_dir is not None:
+            return self._run_queued_search(param_combinations, queue_dir, n_samples, epochs, early_stop_patience,
+                                           progress_callback, lease_timeout)
         
-
-            params = convert_numpy_types(params)
-            # Create and train GAN with current parameters
-            gan = TabularGAN(
-                self.data_path, 
-                self.class_column,
-                integer_columns=self.integer_columns,
-                latent_dim=params.get('latent_dim', 100),
-                learning_rate=params.get('learning_rate', 0.0001),
-                beta1=params.get('beta1', 0.5)
-            )
-            
-            # Modify GAN architecture if needed
-            self._modify_gan_architecture(gan, params)
-            
-            # Train GAN and collect metrics
-            history = self._train_with_history(
-                gan, 
-                epochs=epochs, 
-                batch_size=params.get('batch_size', 32),
-                patience=early_stop_patience
-            )
-            
-            history = convert_numpy_types(history)
-            # Save results
-            result = {
-                'params': params,
-                'history': history,
-                'final_d_loss': history['d_loss'][-1],
-                'final_d_accuracy': history['d_accuracy'][-1],
-                'final_g_loss': history['g_loss'][-1],
-                'n_epochs': len(history['d_loss']),
-            }
-            self.results.append(result)
-            
-            # Generate samples for this model
-            samples = gan.generate_samples(n_samples)
-            
-            # Save this trial
-            self._save_trial_results(i, params, history, samples)
+        self._run_trials(param_combinations, n_samples, epochs, early_stop_patience, progress_callback)
         
         # Save overall results
         self._save_overall_results()
         
         return self.results
     
-    def run_random_search(self, param_distributions, n_iter=10, n_samples=5, epochs=1000, early_stop_patience=10, progress_callback=None):
+    def run_random_search(self, param_distributions, n_iter=10, n_samples=500, epochs=1000, early_stop_patience=10, progress_callback=None,
+                          queue_dir=None, lease_timeout=600):
         """
         Run random search over parameter space
         
@@ -114,6 +216,8 @@ class GANTuner:
             n_samples: Number of samples to generate for evaluation
             epochs: Maximum number of epochs for each trial
             early_stop_patience: Patience for early stopping
+            queue_dir: Shared directory for a work queue, trials are then run by gan_work_queue workers
+            lease_timeout: Seconds without a worker heartbeat after which a queued trial is handed out again
         """
         # Sample random parameter combinations
         param_combinations = []
@@ -126,13 +230,256 @@ class GANTuner:
         
         print(f"Running random search with {n_iter} parameter combinations")
         
+        if queue_dir is not None:
+            return self._run_queued_search(param_combinations, queue_dir, n_samples, epochs, early_stop_patience,
+                                           progress_callback, lease_timeout)
+        
+        self._run_trials(param_combinations, n_samples, epochs, early_stop_patience, progress_callback)
+        
+        # Save overall results
+        self._save_overall_results()
+        
+        return self.results
+    
+    def run_population_search(self, param_distributions, population_size=8, rounds=10, steps_per_round=100,
+                              exploit_fraction=0.25, perturb_factors=(0.8, 1.2), n_samples=500, progress_callback=None):
+        """
+        Run population-based training
+        
+        A population of GANs with the same architecture is trained in rounds. After every round
+        the members are ranked by their sample quality score, and the weakest members copy the
+        weights of a strong member and continue with its learning_rate and beta1 multiplied by
+        a random perturbation factor.
+        
+        Args:
+            param_distributions: Dictionary with parameter names as keys and lists of values. The initial
+                learning_rate, beta1 and batch_size of each member are drawn from it, the first latent_dim,
+                gen_layers and disc_layers are used for the whole population.
+            population_size: Number of GANs trained together
+            rounds: Number of training rounds
+            steps_per_round: Training steps of every member per round
+            exploit_fraction: Fraction of the population replaced by copies of the strongest members after every round
+            perturb_factors: Factors that learning_rate and beta1 of a copied member are multiplied with
+            n_samples: Number of samples generated to score a member
+        """
+        architecture = {name: param_distributions[name][0] for name in self.ARCHITECTURE_PARAMS
+                        if param_distributions.get(name)}
+        base = TabularGAN(
+            self.data_path,
+            self.class_column,
+            integer_columns=self.integer_columns,
+            latent_dim=architecture.get('latent_dim', 100),
+            gen_layers=architecture.get('gen_layers'),
+            disc_layers=architecture.get('disc_layers'),
+            intra_op_threads=self.intra_op_threads,
+            inter_op_threads=self.inter_op_threads,
+            preprocess_chunk_size=self.preprocess_chunk_size
+        )
+        
+        # Members share the preprocessed data of the base GAN
+        members = []
+        for _ in range(population_size):
+            params = convert_numpy_types({
+                'learning_rate': np.random.choice(param_distributions.get('learning_rate') or [0.0001]),
+                'beta1': np.random.choice(param_distributions.get('beta1') or [0.5]),
+                'batch_size': np.random.choice(param_distributions.get('batch_size') or [32])
+            })
+            members.append({
+                'gan': base.fresh_copy(learning_rate=params['learning_rate'], beta1=params['beta1']),
+                'params': params,
+                'history': TrainingHistory(steps_per_round * rounds),
+                'schedule': [],
+                'copied_from': None
+            })
+        n_exploit = min(max(int(population_size * exploit_fraction), 1), population_size // 2)
+        print(f"Running population-based training with {population_size} members for {rounds} rounds")
+        
+        for round_num in range(rounds):
+            print(f"\nRound {round_num+1}/{rounds}")
+            if progress_callback:
+                progress_callback(round_num, rounds)
+            
+            for i, member in enumerate(members):
+                history = member['gan'].train(steps_per_round, member['params']['batch_size'], patience=None, verbose=0,
+                                              batch_sampler=self.batch_sampler,
+                                              class_weight_power=self.class_weight_power)
+                member['history'].extend(history)
+                member['samples'] = member['gan'].generate_samples(n_samples)
+                member['quality'] = self._score_samples(member['samples'])
+                member['schedule'].append({
+                    'round': round_num,
+                    **member['params'],
+                    'quality_score': member['quality']['quality_score'],
+                    'copied_from': member['copied_from']
+                })
+                member['copied_from'] = None
+                print(f"Member {i}: quality score {member['quality']['quality_score']:.4f} with {member['params']}")
+            
+            # Exploit and explore, except after the last round
+            if round_num < rounds - 1 and n_exploit > 0:
+                ranking = sorted(range(population_size), key=lambda i: members[i]['quality']['quality_score'])
+                for loser in ranking[-n_exploit:]:
+                    winner = int(np.random.choice(ranking[:n_exploit]))
+                    self._exploit_and_explore(members[loser], members[winner], winner, perturb_factors)
+        
+        for i, member in enumerate(members):
+            params = {**architecture, **member['params']}
+            history = member['history']
+            metrics = {
+                'final_d_loss': float(history['d_loss'][-1]),
+                'final_d_accuracy': float(history['d_accuracy'][-1]),
+                'final_g_loss': float(history['g_loss'][-1]),
+                'n_epochs': len(history),
+                **{name: value for name, value in member['quality'].items() if not name.startswith('column_')}
+            }
+            trial_dir = self._save_trial_results(i, params, history, member['samples'], member['quality'])
+            with open(os.path.join(trial_dir, "pbt_schedule.json"), "w") as f:
+                json.dump(convert_numpy_types(member['schedule']), f, indent=4)
+            member['gan'].generator.save_weights(os.path.join(trial_dir, "generator.weights.h5"))
+            member['gan'].discriminator.save_weights(os.path.join(trial_dir, "discriminator.weights.h5"))
+            self.store.add_trial(self.run_id, i, params, metrics, trial_dir=trial_dir)
+        if progress_callback:
+            progress_callback(rounds, rounds)
+        
+        # Save overall results, members are compared by the metric they were selected with
+        self._save_overall_results(selection_metric='quality_score')
+        
+        return self.results
+    
+    def _exploit_and_explore(self, member, source, source_index, perturb_factors):
+        """Replace a weak member by a copy of a strong one with perturbed optimizer settings"""
+        member['gan'].generator.set_weights(source['gan'].generator.get_weights())
+        member['gan'].discriminator.set_weights(source['gan'].discriminator.get_weights())
+        learning_rate = source['params']['learning_rate'] * float(np.random.choice(perturb_factors))
+        beta1 = float(np.clip(source['params']['beta1'] * np.random.choice(perturb_factors), 0.0, 0.999))
+        member['params'] = {**source['params'], 'learning_rate': learning_rate, 'beta1': beta1}
+        member['gan'].set_optimizer_params(learning_rate, beta1)
+        member['copied_from'] = source_index
+    
+    def recommend_batch_sizes(self, param_grid, min_relative_throughput=0.5, steps=20):
+        """
+        Benchmark the candidate batch sizes and keep only those with a competitive throughput
+        
+        The benchmark uses the first latent_dim, gen_layers and disc_layers of the grid and
+        is saved to batch_size_benchmark.json in the results directory.
+        
+        Args:
+            param_grid: Parameter grid, its batch_size list is used as candidates if present
+            min_relative_throughput: Keep batch sizes reaching this fraction of the best samples/s
+            steps: Number of timed training steps per batch size
+            
+        Returns:
+            List of batch sizes to search
+        """
+        gen_layers = param_grid.get('gen_layers')
+        disc_layers = param_grid.get('disc_layers')
+        gan = TabularGAN(
+            self.data_path,
+            self.class_column,
+            integer_columns=self.integer_columns,
+            latent_dim=param_grid.get('latent_dim', [100])[0],
+            gen_layers=gen_layers[0] if gen_layers else None,
+            disc_layers=disc_layers[0] if disc_layers else None,
+            intra_op_threads=self.intra_op_threads,
+            inter_op_threads=self.inter_op_threads,
+            preprocess_chunk_size=self.preprocess_chunk_size
+        )
+        
+        benchmark = gan.benchmark_batch_sizes(param_grid.get('batch_size') or None, steps=steps)
+        best_throughput = max(result['samples_per_second'] for result in benchmark)
+        selected = [result['batch_size'] for result in benchmark
+                    if result['samples_per_second'] >= min_relative_throughput * best_throughput]
+        
+        with open(os.path.join(self.results_dir, "batch_size_benchmark.json"), "w") as f:
+            json.dump({'benchmark': benchmark, 'selected': selected}, f, indent=4)
+        for result in benchmark:
+            print(f"Batch size {result['batch_size']}: {result['samples_per_second']:.0f} samples/s, "
+                  f"{1000 * result['step_latency']:.1f} ms/step")
+        print(f"Selected batch sizes: {selected}")
+        return selected
+    
+    def _run_queued_search(self, param_combinations, queue_dir, n_samples, epochs, early_stop_patience,
+                           progress_callback, lease_timeout):
+        """Put the trials into a shared work queue and collect the results reported by the workers"""
+        if len(self.fidelities) > 1:
+            raise ValueError("Multi-fidelity searches run locally, they cannot be combined with a work queue")
+        queue = WorkQueue(queue_dir, lease_timeout=lease_timeout)
+        queue.initialize({
+            'run_id': self.run_id,
+            'tuner': self.config(),
+            'n_samples': n_samples,
+            'epochs': epochs,
+            'early_stop_patience': early_stop_patience,
+            'lease_timeout': lease_timeout,
+            'max_attempts': queue.max_attempts
+        })
         for i, params in enumerate(param_combinations):
-            print(f"\nTrial {i+1}/{n_iter}")
-            print(f"Parameters: {params}")
+            queue.put(i, params, self.run_id)
+        total_trials = len(param_combinations)
+        print(f"Queued {total_trials} trials in {queue_dir}, start workers with: python gan_work_queue.py {queue_dir}")
+        
+        collected = set()
+        while len(collected) < total_trials:
+            # Any process may hand out trials of crashed workers again, the coordinator does it too
+            queue.requeue_expired()
+            for report in queue.reports(exclude=collected, run_id=self.run_id):
+                collected.add(report['trial_num'])
+                self.store.add_trial(self.run_id, report['trial_num'], report['params'], report.get('metrics', {}),
+                                     status=report['status'], trial_dir=report.get('trial_dir'))
+                print(f"Trial {report['trial_num']+1}/{total_trials} {report['status']} on {report['worker']}")
+                if progress_callback:
+                    progress_callback(len(collected), total_trials)
+            if len(collected) < total_trials:
+                time.sleep(queue.poll_interval)
+        
+        # Save overall results
+        self._save_overall_results()
+        
+        return self.results
+    
+    def _run_trials(self, param_combinations, n_samples, epochs, early_stop_patience, progress_callback=None):
+        """Run the trials one after another, screening them with successive halving over the fidelities"""
+        candidates = list(range(len(param_combinations)))
+        total_trials = len(candidates)
+        for fidelity in self.fidelities:
+            if len(self.fidelities) > 1:
+                print(f"\nFidelity {fidelity:g}: {len(candidates)} trials on {fidelity:.0%} of the rows")
             
-            if progress_callback:
-                progress_callback(i, n_iter)
-
+            scores = {}
+            for n, i in enumerate(candidates):
+                params = param_combinations[i]
+                print(f"\nTrial {i+1}/{total_trials}")
+                print(f"Parameters: {params}")
+                
+                if progress_callback:
+                    progress_callback(n, len(candidates))
+                
+                result = self._run_trial(i, params, n_samples, epochs, early_stop_patience, fidelity)
+                scores[i] = result.get(self.selection_metric)
+            
+            # Promote the best trials, trials without the selection metric rank last
+            n_promote = max(int(np.ceil(len(candidates) * self.promote_fraction)), 1)
+            candidates = sorted(candidates, key=lambda i: (scores[i] is None, scores[i]))[:n_promote]
+    
+    def _run_trial(self, trial_num, params, n_samples, epochs, early_stop_patience, fidelity=1.0):
+        """Train, sample and score one parameter combination, then save its results"""
+        try:
+            metrics, trial_dir = self._evaluate_trial(trial_num, params, n_samples, epochs, early_stop_patience, fidelity)
+        except MemoryLimitExceeded as e:
+            print(f"Trial {trial_num+1} aborted: {e}")
+            self.store.add_trial(self.run_id, trial_num, params, e.metrics, status='aborted')
+            return {'trial_num': trial_num, 'params': params, **e.metrics}
+        # Screening results stay out of the final ranking
+        status = 'completed' if fidelity >= 1 else 'screened'
+        self.store.add_trial(self.run_id, trial_num, params, metrics, status=status, trial_dir=trial_dir)
+        return {'trial_num': trial_num, 'params': params, **metrics}
+    
+    def _evaluate_trial(self, trial_num, params, n_samples, epochs, early_stop_patience, fidelity=1.0):
+        """Train, sample and score one parameter combination and save its artifacts, return the metrics and trial directory"""
+        # Memory, CPU and wall time of the whole trial, training checks the memory ceiling after every step
+        monitor = ResourceMonitor(self.memory_limit_mb).start()
+        model_params = {}
+        try:
             # Create and train GAN with current parameters
             gan = TabularGAN(
                 self.data_path, 
@@ -140,110 +487,145 @@ class GANTuner:
                 integer_columns=self.integer_columns,
                 latent_dim=params.get('latent_dim', 100),
                 learning_rate=params.get('learning_rate', 0.0001),
-                beta1=params.get('beta1', 0.5)
+                beta1=params.get('beta1', 0.5),
+                gen_layers=params.get('gen_layers'),
+                disc_layers=params.get('disc_layers'),
+                intra_op_threads=self.intra_op_threads,
+                inter_op_threads=self.inter_op_threads,
+                model_cache=self._model_cache,
+                preprocess_chunk_size=self.preprocess_chunk_size
             )
+            model_params = {
+                'generator_params': gan.generator.count_params(),
+                'discriminator_params': gan.discriminator.count_params()
+            }
             
-            # Modify GAN architecture if needed
-            self._modify_gan_architecture(gan, params)
+            # Start from the weights of a finished trial with the same architecture
+            warm_started_from = self._warm_start(gan, params) if self.warm_start else None
+            
+            # Below full fidelity train on a cached stratified subsample with a proportional step budget
+            row_indices = None
+            if fidelity < 1:
+                row_indices = self._row_subsample(gan, fidelity)
+                epochs = max(int(epochs * fidelity), 1)
             
             # Train GAN and collect metrics
-            history = self._train_with_history(
+            history_path = None
+            if self.history_stream_every:
+                trial_dir = self._trial_dir(trial_num, fidelity)
+                os.makedirs(trial_dir, exist_ok=True)
+                history_path = os.path.join(trial_dir, "history.f32")
+            train_start = time.perf_counter()
+            history, early_stopping = self._train_with_history(
                 gan, 
                 epochs=epochs, 
                 batch_size=params.get('batch_size', 32),
-                patience=early_stop_patience
+                patience=early_stop_patience,
+                row_indices=row_indices,
+                callbacks=[monitor.check],
+                history_path=history_path
             )
+            train_seconds = time.perf_counter() - train_start
             
-            history = convert_numpy_types(history)
-            # Save results
-            result = {
-                'params': params,
-                'history': history,
-                'final_d_loss': history['d_loss'][-1],
-                'final_d_accuracy': history['d_accuracy'][-1],
-                'final_g_loss': history['g_loss'][-1],
-                'n_epochs': len(history['d_loss']),
-            }
-            self.results.append(result)
+            # Losses of the models as kept, i.e. after early stopping restored the best weights,
+            # rather than of the last training step
+            final_losses = gan.evaluate_losses(params.get('batch_size', 32), row_indices=row_indices)
             
             # Generate samples for this model
             samples = gan.generate_samples(n_samples)
-            
-            # Save this trial
-            self._save_trial_results(i, params, history, samples)
-        
-        # Save overall results
-        self._save_overall_results()
+            monitor.check()
+            quality = self._score_samples(samples)
+        except MemoryLimitExceeded as e:
+            # The models of an aborted trial are not kept for later trials, so their memory can be freed
+            self._model_cache.clear()
+            e.metrics = {
+                **monitor.stop(),
+                **model_params,
+                'n_epochs': monitor.steps,
+                'memory_limit_mb': self.memory_limit_mb,
+                'fidelity': fidelity
+            }
+            raise
+        finally:
+            resources = monitor.stop()
         
-        return self.results
-            
-    def _train_with_history(self, gan, epochs, batch_size, patience=5):
-        """Modified train method to collect training history"""
-        history = {
-            'd_loss': [],
-            'd_accuracy': [],
-            'g_loss': []
+        # Save results
+        metrics = {
+            'final_d_loss': final_losses['d_loss'],
+            'final_d_accuracy': final_losses['d_accuracy'],
+            'final_g_loss': final_losses['g_loss'],
+            'n_epochs': len(history),
+            'best_epoch': early_stopping.best_epoch,
+            'restored_epoch': early_stopping.weights_epoch,
+            'best_loss': early_stopping.best,
+            'warm_started_from': warm_started_from,
+            'fidelity': fidelity,
+            **resources,
+            'steps_per_second': len(history) / train_seconds,
+            **model_params,
+            **{name: value for name, value in quality.items() if not name.startswith('column_')}
         }
         
-        best_loss = float('inf')
-        patience_counter = 0
-        valid = np.ones((batch_size, 1))
-        fake = np.zeros((batch_size, 1))
+        # Save this trial
+        trial_dir = self._save_trial_results(trial_num, params, history, samples, quality, fidelity)
+        if self.warm_start:
+            gan.generator.save_weights(os.path.join(trial_dir, "generator.weights.h5"))
+            gan.discriminator.save_weights(os.path.join(trial_dir, "discriminator.weights.h5"))
+        return metrics, trial_dir
     
-        for epoch in range(epochs):
-            # Train discriminator
-            idx = np.random.randint(0, gan.preprocessed_data.shape[0], batch_size)
-            real_data = gan.preprocessed_data[idx]
-        
-            noise = np.random.normal(0, 1, (batch_size, gan.latent_dim))
-            fake_data = gan.generator.predict(noise, verbose=0)
-        
-            d_loss_real = gan.discriminator.train_on_batch(real_data, valid)
-            d_loss_fake = gan.discriminator.train_on_batch(fake_data, fake)
-            d_loss = 0.5 * np.add(d_loss_real, d_loss_fake)
-        
-            # Train generator
-            noise = np.random.normal(0, 1, (batch_size, gan.latent_dim))
-            g_loss = gan.gan.train_on_batch(noise, valid)
-            
-            # Record history
-            history['d_loss'].append(float(d_loss[0]))
-            history['d_accuracy'].append(float(d_loss[1]))
-            history['g_loss'].append(float(g_loss))
-        
-            if (epoch + 1) % 100 == 0:
-                print(f"Epoch {epoch+1} [D loss: {d_loss[0]:.4f} | D accuracy: {100*d_loss[1]:.2f}%] [G loss: {g_loss:.4f}]")
-        
-            if g_loss > best_loss:
-                patience_counter += 1
-            else:
-                best_loss = g_loss
-                patience_counter = 0
+    def _warm_start(self, gan, params):
+        """Load the weights of the best compatible finished trial, return its number or None"""
+        architecture = {name: params[name] for name in self.ARCHITECTURE_PARAMS if name in params}
+        candidates = self.store.top_k(self.selection_metric, k=5, params=architecture, run_id=self.run_id)
+        for trial in candidates:
+            generator_path = os.path.join(trial['trial_dir'], "generator.weights.h5")
+            discriminator_path = os.path.join(trial['trial_dir'], "discriminator.weights.h5")
+            if not (os.path.exists(generator_path) and os.path.exists(discriminator_path)):
+                continue
+            try:
+                gan.generator.load_weights(generator_path)
+                gan.discriminator.load_weights(discriminator_path)
+            except ValueError as e:
+                print(f"Cannot warm start from trial {trial['trial_num'] + 1}: {e}")
+                continue
+            print(f"Warm start from trial {trial['trial_num'] + 1}")
+            return trial['trial_num']
+        return None
+    
+    def _row_subsample(self, gan, fidelity):
+        """Stratified row indices for a fidelity, every trial loads the same rows so they are drawn only once"""
+        if fidelity not in self._row_subsamples:
+            self._row_subsamples[fidelity] = gan.stratified_row_indices(fidelity)
+        return self._row_subsamples[fidelity]
+    
+    def _score_samples(self, samples):
+        """Compare generated samples with the real data, the real side is prepared only once"""
+        if self._scorer is None:
+            # A bounded sample, so scoring does not load the whole file
+            schema = load_schema(self.data_path)
+            real_data = read_csv_sample(self.data_path, self.score_max_rows, self.preprocess_chunk_size or 100000,
+                                        dtype=schema.read_dtypes())
+            self._scorer = SampleQualityScorer(real_data, self.class_column, max_rows=self.score_max_rows,
+                                               column_types=schema.types)
+        return self._scorer.score(samples)
             
-            if patience_counter >= patience:
-                print(f"Early stopping at epoch {epoch+1}")
-                break
-                
-        return history
+    def _train_with_history(self, gan, epochs, batch_size, patience=5, row_indices=None, callbacks=None,
+                            history_path=None):
+        """Train a GAN with the tuner's early stopping policy, return the history and the policy state"""
+        early_stopping = EarlyStopping(patience=patience, **self.early_stopping)
+        history = gan.train(epochs, batch_size, verbose=1, callbacks=callbacks, early_stopping=early_stopping,
+                            row_indices=row_indices, history_path=history_path,
+                            history_stream_every=self.history_stream_every or 10000,
+                            batch_sampler=self.batch_sampler, class_weight_power=self.class_weight_power)
+        return history, early_stopping
     
-    def _modify_gan_architecture(self, gan, params):
-        """Modify GAN architecture based on parameters"""
-        gen_layers = params.get('gen_layers')
-        disc_layers = params.get('disc_layers')
-        learning_rate = params.get('learning_rate')
-        beta1 = params.get('beta1')
-        
-        # Rebuild the GAN with new architecture if layer configurations are provided
-        gan.rebuild_with_params(
-            gen_layers=gen_layers,
-            disc_layers=disc_layers,
-            learning_rate=learning_rate,
-            beta1=beta1
-    )
+    def _trial_dir(self, trial_num, fidelity=1.0):
+        trial_name = f"trial_{trial_num}" if fidelity >= 1 else f"trial_{trial_num}_fidelity_{fidelity:g}"
+        return os.path.join(self.results_dir, trial_name)
     
-    def _save_trial_results(self, trial_num, params, history, samples):
+    def _save_trial_results(self, trial_num, params, history, samples, quality=None, fidelity=1.0):
         """Save results from a single trial"""
-        trial_dir = os.path.join(self.results_dir, f"trial_{trial_num}")
+        trial_dir = self._trial_dir(trial_num, fidelity)
         if not os.path.exists(trial_dir):
             os.makedirs(trial_dir)
 
@@ -253,41 +635,36 @@ class GANTuner:
             json.dump(params, f, indent=4)
             
         # Save history
-        history_df = pd.DataFrame({
-            'epoch': range(1, len(history['d_loss']) + 1),
-            'd_loss': history['d_loss'],
-            'd_accuracy': history['d_accuracy'],
-            'g_loss': history['g_loss']
-        })
-        history_df.to_csv(os.path.join(trial_dir, "history.csv"), index=False)
+        history.save_csv(os.path.join(trial_dir, "history.csv"))
         
         # Save generated samples
         samples.to_csv(os.path.join(trial_dir, "samples.csv"), sep=";", index=False)
 
+        # Save sample quality metrics
+        if quality is not None:
+            with open(os.path.join(trial_dir, "quality.json"), "w") as f:
+                json.dump(convert_numpy_types(quality), f, indent=4)
+
         # Generate and save plots
         self._create_learning_curves(history, os.path.join(trial_dir, "learning_curves.png"))
+        return trial_dir
     
-    def _save_overall_results(self):
+    def _save_overall_results(self, selection_metric=None):
         """Save overall results from all trials"""
-        # Convert results to DataFrame for easier analysis
-        results_df = pd.DataFrame([
-            {
-                **{f"param_{k}": v for k, v in r['params'].items()},
-                'final_d_loss': r['final_d_loss'],
-                'final_d_accuracy': r['final_d_accuracy'],
-                'final_g_loss': r['final_g_loss'],
-                'n_epochs': r['n_epochs']
-            }
-            for r in self.results
-        ])
+        selection_metric = selection_metric or self.selection_metric
+        # Export the trials of this search from the store for easier analysis
+        results_df = self.store.to_dataframe(run_id=self.run_id)
+        if results_df.empty:
+            print("No completed trials to summarize")
+            return
         
         # Save to CSV
         results_df.to_csv(os.path.join(self.results_dir, "all_results.csv"), index=False)
         
         # Find best parameters
-        best_idx = results_df['final_g_loss'].idxmin()
-        best_params = self.results[best_idx]['params']
-        best_params = convert_numpy_types(best_params)
+        best = self.store.top_k(selection_metric, k=1, run_id=self.run_id)[0]
+        best_params = convert_numpy_types(best['params'])
+        best_metrics = best['metrics']
         # Save best parameters
         with open(os.path.join(self.results_dir, "best_params.json"), "w") as f:
             json.dump(best_params, f, indent=4)
@@ -296,45 +673,71 @@ class GANTuner:
         with open(os.path.join(self.results_dir, "summary.txt"), "w") as f:
             f.write("TabularGAN Parameter Tuning Summary\n")
             f.write(f"Run at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            f.write(f"Total trials: {len(self.results)}\n\n")
+            f.write(f"Total trials: {len(results_df)}\n")
+            if len(self.fidelities) > 1:
+                screened = self.store.count(run_id=self.run_id, status='screened')
+                f.write(f"Screening runs on row subsamples: {screened} (fidelities {list(self.fidelities)})\n")
+            f.write(f"Selection metric: {selection_metric}\n\n")
             f.write("Best parameters:\n")
             for param, value in best_params.items():
                 f.write(f"  {param}: {value}\n")
             f.write("\nBest performance metrics:\n")
-            f.write(f"  Generator loss: {self.results[best_idx]['final_g_loss']:.4f}\n")
-            f.write(f"  Discriminator loss: {self.results[best_idx]['final_d_loss']:.4f}\n")
-            f.write(f"  Discriminator accuracy: {self.results[best_idx]['final_d_accuracy']:.4f}\n")
-            f.write(f"  Training epochs: {self.results[best_idx]['n_epochs']}\n")
+            f.write(f"  Generator loss: {best_metrics['final_g_loss']:.4f}\n")
+            f.write(f"  Discriminator loss: {best_metrics['final_d_loss']:.4f}\n")
+            f.write(f"  Discriminator accuracy: {best_metrics['final_d_accuracy']:.4f}\n")
+            f.write(f"  Sample quality score: {best_metrics['quality_score']:.4f}\n")
+            f.write(f"  Training epochs: {int(best_metrics['n_epochs'])}\n")
+            if best_metrics.get('restored_epoch') is not None:
+                f.write(f"  Restored weights from epoch: {int(best_metrics['restored_epoch']) + 1}\n")
+            self._write_resource_summary(f)
+    
+    def _write_resource_summary(self, f):
+        """Append the memory and CPU usage of every trial of this search to the summary, largest first"""
+        trials = [trial for trial in self.store.query(run_id=self.run_id, status=None)
+                  if trial['metrics'].get('peak_rss_mb') is not None]
+        if not trials:
+            return
+        f.write("\nResource usage per trial (largest peak memory first):\n")
+        if self.memory_limit_mb is not None:
+            aborted = sum(trial['status'] == 'aborted' for trial in trials)
+            f.write(f"  Memory limit: {self.memory_limit_mb:g} MB, aborted trials: {aborted}\n")
+        for trial in sorted(trials, key=lambda trial: -trial['metrics']['peak_rss_mb']):
+            metrics = trial['metrics']
+            model_params = metrics.get('generator_params', 0) + metrics.get('discriminator_params', 0)
+            speed = f", {metrics['steps_per_second']:.1f} steps/s" if 'steps_per_second' in metrics else ""
+            f.write(f"  Trial {trial['trial_num'] + 1} [{trial['status']}]: peak RSS {metrics['peak_rss_mb']:.0f} MB, "
+                    f"CPU {metrics['cpu_seconds']:.1f} s, wall {metrics['wall_seconds']:.1f} s{speed}, "
+                    f"{int(model_params)} model parameters, {trial['params']}\n")
     
     def _create_learning_curves(self, history, save_path):
-        """Create and save learning curves"""
-        epochs = range(1, len(history['d_loss']) + 1)
+        """Create and save learning curves of the downsampled per-step values and their moving average"""
+        # Imported here so headless runs without plots never load matplotlib
+        from matplotlib import pyplot as plt
+        
+        n_steps = len(history['d_loss'])
+        window = max(n_steps // 50, 1)
         
         plt.figure(figsize=(15, 10))
         
-        # Plot discriminator loss
-        plt.subplot(3, 1, 1)
-        plt.plot(epochs, history['d_loss'])
-        plt.title('Discriminator Loss')
-        plt.xlabel('Epoch')
-        plt.ylabel('Loss')
-        plt.grid(True)
-        
-        # Plot discriminator accuracy
-        plt.subplot(3, 1, 2)
-        plt.plot(epochs, history['d_accuracy'])
-        plt.title('Discriminator Accuracy')
-        plt.xlabel('Epoch')
-        plt.ylabel('Accuracy')
-        plt.grid(True)
-        
-        # Plot generator loss
-        plt.subplot(3, 1, 3)
-        plt.plot(epochs, history['g_loss'])
-        plt.title('Generator Loss')
-        plt.xlabel('Epoch')
-        plt.ylabel('Loss')
-        plt.grid(True)
+        panels = [
+            ('d_loss', 'Discriminator Loss', 'Loss'),
+            ('d_accuracy', 'Discriminator Accuracy', 'Accuracy'),
+            ('g_loss', 'Generator Loss', 'Loss')
+        ]
+        for i, (key, title, ylabel) in enumerate(panels):
+            plt.subplot(3, 1, i + 1)
+            steps, values = downsample_min_max(history[key], self.curve_max_points)
+            plt.plot(steps, values, alpha=0.4, linewidth=0.8, label='Per step')
+            if window > 1:
+                # The smooth average only needs every few of its points
+                average_steps, average = downsample_min_max(moving_average(history[key], window),
+                                                            self.curve_max_points)
+                plt.plot(average_steps, average, linewidth=1.5, label=f'Moving average ({window} steps)')
+                plt.legend(loc='upper right')
+            plt.title(title)
+            plt.xlabel('Epoch')
+            plt.ylabel(ylabel)
+            plt.grid(True)
         
         plt.tight_layout()
         plt.savefig(save_path)
@@ -342,9 +745,11 @@ class GANTuner:
     
     def visualize_results(self):
         """Visualize results from the tuning process"""
-        try:
-            results_df = pd.read_csv(os.path.join(self.results_dir, "all_results.csv"))
+        from matplotlib import pyplot as plt
         
+        try:
+            results_df = self.store.to_dataframe(run_id=self.run_id)
+
         # Create output directory for visualizations
             viz_dir = os.path.join(self.results_dir, "visualizations")
             if not os.path.exists(viz_dir):
@@ -382,6 +787,15 @@ class GANTuner:
                 plt.grid(True)
                 plt.savefig(os.path.join(viz_dir, f"{param_name}_vs_d_loss.png"))
                 plt.close()
+
+                plt.figure(figsize=(10, 6))
+                plt.scatter(results_df[param], results_df['quality_score'])
+                plt.title(f'Impact of {param_name} on Sample Quality Score')
+                plt.xlabel(param_name)
+                plt.ylabel('Sample Quality Score (lower is better)')
+                plt.grid(True)
+                plt.savefig(os.path.join(viz_dir, f"{param_name}_vs_quality_score.png"))
+                plt.close()
             
             print(f"Visualizations saved to {viz_dir}/")
         except Exception as e:
@@ -389,7 +803,11 @@ class GANTuner:
 
 def search(classLabel, epoch, numIterations, latentDim, batchSize, learningRate, beta1, data_path=None, 
            gen_layers=None, disc_layers=None, results_dir=None, search_type='grid', integer_columns=None,
-            progress_callback=None):
+            progress_callback=None, early_stopping=None, selection_metric='final_g_loss', queue_dir=None,
+            auto_batch_size=False, intra_op_threads=None, inter_op_threads=None, warm_start=False, pbt_rounds=10,
+            fidelities=None, promote_fraction=1/3, early_stop_patience=10, memory_limit_mb=None,
+            history_stream_every=None, curve_max_points=2000, preprocess_chunk_size=None, batch_sampler='uniform',
+            class_weight_power=0.0):
     '''
     parser = argparse.ArgumentParser(description='TabularGAN Parameter Tuning')
     parser.add_argument('--data', type=str, default=gui.pickingTheFile, help='Path to data CSV file')
@@ -407,12 +825,18 @@ def search(classLabel, epoch, numIterations, latentDim, batchSize, learningRate,
         results_dir = "tuning_results"
 
     # Create tuner
-    tuner = GANTuner(data_path, classLabel, integer_columns=integer_columns, results_dir = results_dir)
+    tuner = GANTuner(data_path, classLabel, integer_columns=integer_columns, results_dir = results_dir,
+                     early_stopping=early_stopping, selection_metric=selection_metric,
+                     intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads,
+                     warm_start=warm_start, fidelities=fidelities, promote_fraction=promote_fraction,
+                     memory_limit_mb=memory_limit_mb, history_stream_every=history_stream_every,
+                     curve_max_points=curve_max_points, preprocess_chunk_size=preprocess_chunk_size,
+                     batch_sampler=batch_sampler, class_weight_power=class_weight_power)
     
     # Define parameter grid for search
     param_grid = {
         'latent_dim': [int(x) for x in latentDim],
-        'batch_size': [int(x) for x in batchSize],
+        'batch_size': [int(x) for x in batchSize or []],
         'learning_rate': [float(x) for x in learningRate],
         'beta1': [float(x) for x in beta1]
     }
@@ -422,22 +846,40 @@ def search(classLabel, epoch, numIterations, latentDim, batchSize, learningRate,
     if disc_layers:
         param_grid['disc_layers'] = disc_layers
     
+    # Drop batch sizes that are slow per sample on this machine
+    if auto_batch_size:
+        param_grid['batch_size'] = tuner.recommend_batch_sizes(param_grid)
+    elif not param_grid['batch_size']:
+        raise ValueError("Batch size values must be provided unless auto_batch_size is enabled")
+    
     # Run search
     if search_type == 'grid':
         results = tuner.run_grid_search(
             param_grid, 
             epochs=epoch,
-            early_stop_patience=10,
-            progress_callback=progress_callback
+            early_stop_patience=early_stop_patience,
+            progress_callback=progress_callback,
+            queue_dir=queue_dir
             )
     
+    elif search_type == 'pbt':
+        # numIterations is the population size, epoch the training budget of every member
+        results = tuner.run_population_search(
+            param_grid,
+            population_size=numIterations or 8,
+            rounds=pbt_rounds,
+            steps_per_round=max(epoch // pbt_rounds, 1),
+            progress_callback=progress_callback
+        )
+    
     else:
         results = tuner.run_random_search(
             param_grid, 
             n_iter=numIterations, 
             epochs=epoch,
-            early_stop_patience=10,
-            progress_callback=progress_callback
+            early_stop_patience=early_stop_patience,
+            progress_callback=progress_callback,
+            queue_dir=queue_dir
         )
     
     # Visualize results
@@ -0,0 +1,343 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from gan_schema import load_schema
+
+# Stages in run order with the stages whose outputs they read (validate only gates the others)
+STAGES = {
+    'validate': (),
+    'tune': ('validate',),
+    'train_best': ('validate', 'tune'),
+    'generate': ('train_best',),
+    'evaluate': ('validate', 'generate')
+}
+# Stages that read the data file themselves, their inputs include its content hash, its column
+# types and the data config
+DATA_STAGES = ('validate', 'tune', 'train_best', 'evaluate')
+
+MANIFEST_FILE = 'stage.json'
+
+
+def hash_json(data):
+    """Stable hash of a JSON-serializable value"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def hash_files(paths):
+    """Hash of the contents of the given files, in order"""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class Pipeline:
+    """
+    Config-driven validate -> tune -> train_best -> generate -> evaluate runs
+
+    validate loads and preprocesses the data once so bad data or columns fail before any
+    training, and records the resulting columns and classes in schema.json. It does not share
+    preprocessed arrays: every later stage that needs the data loads and preprocesses it itself.
+
+    The input hash of a stage covers its config section and the output hashes of the
+    stages it reads, and for the stages that read the data file (DATA_STAGES) also the
+    data section, the content hash of the file and its column types (the <data>.schema.json
+    sidecar, which can be edited). Its artifacts are kept in work_dir/<stage>/<input hash>/
+    with a stage.json manifest, so a stage whose inputs did not change is skipped and its
+    cached artifacts are reused, also when switching back to an earlier configuration.
+    Output hashes only cover what later stages use (e.g. best_params.json of tune), so a
+    rerun that produces the same result does not invalidate the stages after it.
+
+    Config sections:
+        data:       path, class_column, integer_columns, categorical_columns, class_encoding, preprocess_chunk_size
+        tune:       search_type (grid, random, pbt), param_grid, n_iter (population size of pbt), rounds,
+                    epochs, early_stop_patience, n_samples and the GANTuner options (selection_metric, early_stopping, warm_start,
+                    fidelities, promote_fraction, intra_op_threads, inter_op_threads, batch_sampler); optional
+        train_best: params (used without a tune section, override the tuned ones otherwise),
+                    epochs, batch_size, patience, batch_sampler, class_weight_power, tflite_quantization
+        generate:   n_samples, seed, workers, backend ('tflite' needs train_best.tflite_quantization)
+        evaluate:   max_rows
+    """
+
+    def __init__(self, config, work_dir=None):
+        """
+        Args:
+            config: Pipeline configuration dictionary, see the class docstring
+            work_dir: Directory for the stage artifacts, defaults to config['work_dir'] or 'pipeline_runs'
+        """
+        if 'data' not in config or 'path' not in config['data'] or 'class_column' not in config['data']:
+            raise ValueError("The config needs a data section with path and class_column")
+        self.config = config
+        self.work_dir = work_dir or config.get('work_dir', 'pipeline_runs')
+        self.outputs = {}
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    @classmethod
+    def from_file(cls, path, work_dir=None):
+        with open(path) as f:
+            return cls(json.load(f), work_dir)
+
+    def run(self, stages=None, force=()):
+        """
+        Run the pipeline, skipping stages with unchanged inputs
+
+        Args:
+            stages: Stages to run up to, None runs all. Stages they depend on are run (or reused) as well.
+            force: Stages to rerun even if their inputs are unchanged
+
+        Returns:
+            Dictionary mapping each run stage to its manifest
+        """
+        unknown = (set(stages or ()) | set(force)) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown stages {sorted(unknown)}, expected some of {list(STAGES)}")
+        wanted = self._with_dependencies(stages or list(STAGES))
+        if 'tune' not in self.config:
+            wanted.discard('tune')
+
+        manifests = {}
+        for stage in STAGES:
+            if stage in wanted:
+                manifests[stage] = self._run_stage(stage, force=stage in force)
+        return manifests
+
+    def _with_dependencies(self, stages):
+        wanted = set()
+        pending = list(stages)
+        while pending:
+            stage = pending.pop()
+            if stage not in wanted:
+                wanted.add(stage)
+                pending.extend(STAGES[stage])
+        return wanted
+
+    def _input_hash(self, stage):
+        inputs = {
+            'stage': stage,
+            'config': self.config.get(stage, {}),
+            'upstream': {name: self.outputs[name]['output_hash'] for name in STAGES[stage] if name in self.outputs}
+        }
+        if stage in DATA_STAGES:
+            inputs['data'] = {
+                **self.config['data'],
+                'content': self._data_hash(),
+                # Validated (or inferred and saved) first, so an edited schema file changes the hash
+                'column_types': load_schema(self.config['data']['path']).columns
+            }
+        return hash_json(inputs)
+
+    def _data_hash(self):
+        """Content hash of the data file, recomputed only when its size or modification time changed"""
+        path = self.config['data']['path']
+        stat = os.stat(path)
+        cache_path = os.path.join(self.work_dir, 'data_hash.json')
+        key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        cache = {}
+        if os.path.exists(cache_path):
+            with open(cache_path) as f:
+                cache = json.load(f)
+        if key not in cache:
+            cache[key] = hash_files([path])
+            with open(cache_path, 'w') as f:
+                json.dump(cache, f, indent=4)
+        return cache[key]
+
+    def _run_stage(self, stage, force=False):
+        input_hash = self._input_hash(stage)
+        stage_dir = os.path.join(self.work_dir, stage, input_hash[:16])
+        manifest_path = os.path.join(stage_dir, MANIFEST_FILE)
+
+        if not force and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if all(os.path.exists(os.path.join(stage_dir, name)) for name in manifest['outputs']):
+                print(f"[{stage}] inputs unchanged, reusing {stage_dir}")
+                self.outputs[stage] = manifest
+                return manifest
+
+        print(f"[{stage}] running in {stage_dir}")
+        # Start from an empty directory so no artifacts of an interrupted run are mixed in
+        if os.path.exists(stage_dir):
+            shutil.rmtree(stage_dir)
+        os.makedirs(stage_dir)
+        start = time.perf_counter()
+        outputs, hashed_outputs = getattr(self, f"_stage_{stage}")(stage_dir)
+        manifest = {
+            'stage': stage,
+            'input_hash': input_hash,
+            'output_hash': hash_files([os.path.join(stage_dir, name) for name in hashed_outputs]),
+            'outputs': outputs,
+            'dir': stage_dir,
+            'completed_at': datetime.now().isoformat(timespec='seconds'),
+            'seconds': time.perf_counter() - start
+        }
+        # The manifest is written last, a stage without one is rerun
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=4)
+        self.outputs[stage] = manifest
+        return manifest
+
+    def _gan_kwargs(self):
+        data = self.config['data']
+        return {
+            'integer_columns': data.get('integer_columns'),
+            'categorical_columns': data.get('categorical_columns'),
+            'class_encoding': data.get('class_encoding', 'auto'),
+            'preprocess_chunk_size': data.get('preprocess_chunk_size')
+        }
+
+    def _stage_validate(self, stage_dir):
+        """Load and preprocess the data once to validate it and record its schema"""
+        from tabular_gan_modified import TabularGAN
+
+        data = self.config['data']
+        gan = TabularGAN(data['path'], data['class_column'], **self._gan_kwargs())
+        schema = {
+            'rows': int(len(gan.preprocessed_data)),
+            'feature_columns': gan.feature_columns,
+            'numerical_columns': gan.numerical_columns,
+            'column_types': gan.column_types,
+            'integer_columns': gan.column_ranges,
+            'categorical_columns': {col: len(labels) for col, labels in gan.categories.items()},
+            'class_column': gan.class_column,
+            'class_encoding': gan.class_encoding,
+            'classes': [str(label) for label in gan.decoder.class_labels]
+        }
+        with open(os.path.join(stage_dir, 'schema.json'), 'w') as f:
+            json.dump(schema, f, indent=4)
+        return ['schema.json'], ['schema.json']
+
+    def _stage_tune(self, stage_dir):
+        from gan_parameter_tuning import GANTuner
+
+        data = self.config['data']
+        tune = dict(self.config['tune'])
+        search_type = tune.pop('search_type', 'grid')
+        param_grid = tune.pop('param_grid')
+        search_kwargs = {name: tune.pop(name) for name in ('n_samples', 'epochs', 'early_stop_patience')
+                         if name in tune}
+        n_iter = tune.pop('n_iter', 10)
+        rounds = tune.pop('rounds', 10)
+        tuner = GANTuner(data['path'], data['class_column'], integer_columns=data.get('integer_columns'),
+                         results_dir=stage_dir, preprocess_chunk_size=data.get('preprocess_chunk_size'), **tune)
+        if search_type == 'grid':
+            tuner.run_grid_search(param_grid, **search_kwargs)
+        elif search_type == 'random':
+            tuner.run_random_search(param_grid, n_iter=n_iter, **search_kwargs)
+        elif search_type == 'pbt':
+            epochs = search_kwargs.get('epochs', 1000)
+            tuner.run_population_search(param_grid, population_size=n_iter, rounds=rounds,
+                                        steps_per_round=max(epochs // rounds, 1),
+                                        n_samples=search_kwargs.get('n_samples', 500))
+        else:
+            raise ValueError(f"Unknown search type '{search_type}', expected 'grid', 'random' or 'pbt'")
+        tuner.store.close()
+        if not os.path.exists(os.path.join(stage_dir, 'best_params.json')):
+            raise RuntimeError("Tuning finished without a completed trial")
+        return ['best_params.json', 'all_results.csv', 'summary.txt'], ['best_params.json']
+
+    def _stage_train_best(self, stage_dir):
+        from tabular_gan_modified import TabularGAN
+
+        data = self.config['data']
+        train = self.config.get('train_best', {})
+        params = {}
+        if 'tune' in self.outputs:
+            with open(os.path.join(self.outputs['tune']['dir'], 'best_params.json')) as f:
+                params = json.load(f)
+        params.update(train.get('params', {}))
+
+        gan = TabularGAN(
+            data['path'],
+            data['class_column'],
+            latent_dim=params.get('latent_dim', 20),
+            learning_rate=params.get('learning_rate', 0.0001),
+            beta1=params.get('beta1', 0.5),
+            gen_layers=params.get('gen_layers'),
+            disc_layers=params.get('disc_layers'),
+            **self._gan_kwargs()
+        )
+        batch_size = train.get('batch_size') or params.get('batch_size', 96)
+        history = gan.train(train.get('epochs', 1000), batch_size, patience=train.get('patience', 5),
+                            batch_sampler=train.get('batch_sampler', 'uniform'),
+                            class_weight_power=train.get('class_weight_power', 0.0))
+        history.save_csv(os.path.join(stage_dir, 'history.csv'))
+        with open(os.path.join(stage_dir, 'params.json'), 'w') as f:
+            json.dump({**params, 'batch_size': batch_size}, f, indent=4)
+
+        gan.export_generator(os.path.join(stage_dir, 'model'), tflite_quantization=train.get('tflite_quantization'))
+        model_files = sorted(os.path.join('model', name) for name in os.listdir(os.path.join(stage_dir, 'model')))
+        return ['params.json', 'history.csv', *model_files], model_files
+
+    def _stage_generate(self, stage_dir):
+        from gan_sampling import SavedGenerator, generate_sharded
+
+        generate = self.config.get('generate', {})
+        model_dir = os.path.join(self.outputs['train_best']['dir'], 'model')
+        n_samples = generate.get('n_samples', 1000)
+        workers = generate.get('workers', 1)
+        backend = generate.get('backend', 'keras')
+        if workers > 1:
+            manifest = generate_sharded(model_dir, n_samples, workers, os.path.join(stage_dir, 'shards'),
+                                        seed=generate.get('seed'), backend=backend)
+            files = [os.path.join('shards', shard['file']) for shard in manifest['shards']]
+            return [*files, os.path.join('shards', 'manifest.json')], files
+
+        samples = SavedGenerator(model_dir, backend).generate(n_samples, np.random.default_rng(generate.get('seed')))
+        samples.to_csv(os.path.join(stage_dir, 'samples.csv'), sep=';', index=False)
+        return ['samples.csv'], ['samples.csv']
+
+    def _stage_evaluate(self, stage_dir):
+        from gan_quality import SampleQualityScorer, read_csv_sample
+
+        data = self.config['data']
+        max_rows = self.config.get('evaluate', {}).get('max_rows', 20000)
+        generated = self.outputs['generate']
+        sample_files = [name for name in generated['outputs'] if name.endswith('.csv')]
+        # Read only as many rows of every shard as the scorer uses
+        rows_per_file = -(-max_rows // len(sample_files)) if max_rows else None
+        samples = pd.concat([
+            pd.read_csv(os.path.join(generated['dir'], name), sep=';', nrows=rows_per_file)
+            for name in sample_files
+        ], ignore_index=True)
+
+        schema = load_schema(data['path'])
+        real_data = read_csv_sample(data['path'], max_rows, data.get('preprocess_chunk_size') or 100000,
+                                    dtype=schema.read_dtypes())
+        scorer = SampleQualityScorer(real_data, data['class_column'], max_rows=max_rows, column_types=schema.types)
+        quality = scorer.score(samples)
+        with open(os.path.join(stage_dir, 'quality.json'), 'w') as f:
+            json.dump(quality, f, indent=4)
+        print(f"[evaluate] quality score {quality['quality_score']:.4f}")
+        return ['quality.json'], ['quality.json']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a TabularGAN pipeline with stage-level caching')
+    parser.add_argument('config', help='JSON pipeline configuration')
+    parser.add_argument('--work-dir', default=None, help='Directory for the stage artifacts')
+    parser.add_argument('--stages', default=None, help=f"Comma-separated stages to run up to, of {list(STAGES)}")
+    parser.add_argument('--force', default='', help='Comma-separated stages to rerun even if unchanged')
+    args = parser.parse_args(argv)
+
+    pipeline = Pipeline.from_file(args.config, args.work_dir)
+    stages = [stage.strip() for stage in args.stages.split(',')] if args.stages else None
+    force = [stage.strip() for stage in args.force.split(',') if stage.strip()]
+    manifests = pipeline.run(stages, force)
+    for stage, manifest in manifests.items():
+        print(f"{stage}: {manifest['dir']}")
+
+
+if __name__ == "__main__":
+    main()
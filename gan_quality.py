@@ -0,0 +1,212 @@
+import numpy as np
+import pandas as pd
+
+from gan_schema import is_categorical
+
+
+def _normalize(columns, low, span):
+    """Scale every column to [0, 1] using the given per-column minimum and range"""
+    return (columns - low) / span
+
+
+def _distribution_distances(real_sorted, synthetic):
+    """
+    Per-column Kolmogorov-Smirnov and Wasserstein-1 distances, computed for all columns at once
+
+    Both inputs must already be normalized with the real column ranges. Synthetic values may
+    fall outside [0, 1], so each column is shifted into its own band, as wide as the pooled
+    range of the column and separated from the next band by a gap of 1. This keeps the
+    flattened (column-major) arrays sorted, so the empirical CDFs of all columns are evaluated
+    with a single searchsorted call. The Wasserstein distance is returned in units of the real
+    column range.
+    """
+    n_real, n_cols = real_sorted.shape
+    n_synth = synthetic.shape[0]
+    synth_sorted = np.sort(synthetic, axis=0)
+    low = np.minimum(real_sorted[0], synth_sorted[0])
+    width = np.maximum(real_sorted[-1], synth_sorted[-1]) - low
+    offsets = np.concatenate([[0.0], np.cumsum(width + 1.0)[:-1]]) - low
+
+    real_flat = (real_sorted + offsets).ravel(order='F')
+    synth_flat = (synth_sorted + offsets).ravel(order='F')
+
+    # Evaluation points: the pooled values of every column, sorted within the column
+    points = np.sort(np.concatenate([real_sorted, synth_sorted], axis=0), axis=0)
+    n_points = points.shape[0]
+    column_ids = np.repeat(np.arange(n_cols), n_points)
+    points_flat = (points + offsets).ravel(order='F')
+
+    cdf_real = (np.searchsorted(real_flat, points_flat, side='right') - column_ids * n_real) / n_real
+    cdf_synth = (np.searchsorted(synth_flat, points_flat, side='right') - column_ids * n_synth) / n_synth
+    cdf_gap = np.abs(cdf_real - cdf_synth).reshape(n_cols, n_points)
+
+    ks = cdf_gap.max(axis=1)
+    widths = np.diff(points, axis=0).T
+    wasserstein = (cdf_gap[:, :-1] * widths).sum(axis=1)
+    return ks, wasserstein
+
+
+def _correlation(values):
+    """Correlation matrix that treats constant columns as uncorrelated instead of NaN"""
+    if values.shape[1] < 2:
+        return np.zeros((values.shape[1], values.shape[1]))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.corrcoef(values, rowvar=False)
+    return np.nan_to_num(corr)
+
+
+def _category_distances(real_frequencies, synthetic):
+    """Per-column total variation distance between the category frequencies, missing values count as a category"""
+    distances = []
+    for col, real_freq in real_frequencies.items():
+        synth_freq = synthetic[col].astype(str).value_counts(normalize=True)
+        real_freq, synth_freq = real_freq.align(synth_freq, fill_value=0.0)
+        distances.append(0.5 * float(np.abs(real_freq.to_numpy() - synth_freq.to_numpy()).sum()))
+    return np.array(distances)
+
+
+def read_csv_sample(path, max_rows, chunk_size=100000, random_state=0, sep=';', dtype=None):
+    """
+    Uniform random sample of at most max_rows rows of a CSV file
+
+    The file is read in chunks of chunk_size rows and only the rows with the max_rows smallest
+    random keys are kept, so memory is bounded by max_rows + chunk_size rows. None reads all rows.
+    dtype is passed to pd.read_csv, e.g. TableSchema.read_dtypes() to keep categories as text.
+    """
+    if max_rows is None:
+        return pd.read_csv(path, sep=sep, dtype=dtype)
+    rng = np.random.default_rng(random_state)
+    sample = None
+    keys = None
+    for chunk in pd.read_csv(path, sep=sep, dtype=dtype, chunksize=chunk_size):
+        chunk_keys = rng.random(len(chunk))
+        if sample is None:
+            sample, keys = chunk, chunk_keys
+        else:
+            sample, keys = pd.concat([sample, chunk]), np.concatenate([keys, chunk_keys])
+        if len(sample) > max_rows:
+            keep = np.sort(np.argpartition(keys, max_rows)[:max_rows])
+            sample, keys = sample.iloc[keep], keys[keep]
+    return sample.reset_index(drop=True)
+
+
+class SampleQualityScorer:
+    """
+    Compare synthetic samples with the real data
+
+    The real side (subsample, sorted columns, correlation matrix and class and category
+    frequencies) is prepared once, so scoring a trial only costs sorting its own samples.
+    Numerical and categorical columns are taken from the column types, so a text column is
+    never parsed as numbers. All distances are in [0, 1] and lower is better:
+        - ks_mean: mean per-column Kolmogorov-Smirnov statistic
+        - wasserstein_mean: mean per-column Wasserstein-1 distance, relative to the real column range
+        - correlation_diff: mean absolute difference of the pairwise correlations, divided by 2
+        - category_distance: mean per-column total variation distance between the category frequencies
+        - class_balance_error: total variation distance between the class distributions
+    quality_score is the weighted mean of these values. The numerical distances are left out
+    when there are no numerical columns, category_distance when there are no categorical columns.
+    """
+
+    DEFAULT_WEIGHTS = {
+        'ks_mean': 1.0,
+        'wasserstein_mean': 1.0,
+        'correlation_diff': 1.0,
+        'category_distance': 1.0,
+        'class_balance_error': 1.0
+    }
+
+    def __init__(self, real_data, class_column, max_rows=20000, random_state=0, weights=None,
+                 column_types=None):
+        """
+        Args:
+            real_data: DataFrame with the real data
+            class_column: Name of the class column
+            max_rows: Maximum number of rows used from each side, None uses all rows
+            random_state: Seed for the subsampling
+            weights: Dictionary overriding DEFAULT_WEIGHTS for the combined score
+            column_types: Dictionary mapping columns to 'integer', 'float' or 'categorical', e.g.
+                TableSchema.types; columns missing from it are typed with gan_schema.is_categorical
+        """
+        self.class_column = class_column
+        self.max_rows = max_rows
+        self.weights = {**self.DEFAULT_WEIGHTS, **(weights or {})}
+        self._rng = np.random.default_rng(random_state)
+
+        real_data = self._subsample(real_data)
+        column_types = column_types or {}
+        feature_columns = [col for col in real_data.columns if col != class_column]
+        self.categorical_columns = [
+            col for col in feature_columns
+            if column_types.get(col, 'categorical' if is_categorical(real_data[col]) else 'float') == 'categorical'
+        ]
+        numeric = real_data[[col for col in feature_columns if col not in self.categorical_columns]]
+        numeric = numeric.apply(pd.to_numeric, errors='coerce')
+        self.columns = numeric.columns[numeric.notna().any()].tolist()
+        if not self.columns and not self.categorical_columns:
+            raise ValueError("Real data has no feature columns to compare with")
+
+        self._category_frequencies = {
+            col: real_data[col].astype(str).value_counts(normalize=True) for col in self.categorical_columns
+        }
+
+        real_classes = real_data[class_column].astype(str)
+        self._class_frequencies = real_classes.value_counts(normalize=True)
+
+        if not self.columns:
+            return
+        real_values = numeric[self.columns].dropna().to_numpy(dtype=np.float64)
+        if len(real_values) == 0:
+            raise ValueError("Real data has no complete numeric rows to compare with")
+        self._low = real_values.min(axis=0)
+        span = real_values.max(axis=0) - self._low
+        self._span = np.where(span > 0, span, 1.0)
+        self._real_sorted = np.sort(_normalize(real_values, self._low, self._span), axis=0)
+        self._real_corr = _correlation(real_values)
+
+    def _subsample(self, data):
+        if self.max_rows is not None and len(data) > self.max_rows:
+            idx = self._rng.choice(len(data), self.max_rows, replace=False)
+            return data.iloc[np.sort(idx)]
+        return data
+
+    def score(self, synthetic_data):
+        """Return a dictionary with the individual distances and the combined quality_score"""
+        synthetic_data = self._subsample(synthetic_data)
+        metrics = {}
+        if self.columns:
+            features = synthetic_data[self.columns].apply(pd.to_numeric, errors='coerce')
+            synth_values = features.dropna().to_numpy(dtype=np.float64)
+            if len(synth_values) == 0:
+                raise ValueError("Synthetic data has no complete numeric rows to score")
+
+            ks, wasserstein = _distribution_distances(
+                self._real_sorted, _normalize(synth_values, self._low, self._span)
+            )
+
+            corr_gap = np.abs(_correlation(synth_values) - self._real_corr)
+            upper = np.triu_indices(len(self.columns), k=1)
+            metrics['ks_mean'] = float(ks.mean())
+            metrics['wasserstein_mean'] = float(wasserstein.mean())
+            metrics['correlation_diff'] = float(corr_gap[upper].mean()) / 2 if len(upper[0]) else 0.0
+
+        if self.categorical_columns:
+            category_distances = _category_distances(self._category_frequencies, synthetic_data)
+            metrics['category_distance'] = float(category_distances.mean())
+
+        synth_frequencies = synthetic_data[self.class_column].astype(str).value_counts(normalize=True)
+        real_freq, synth_freq = self._class_frequencies.align(synth_frequencies, fill_value=0.0)
+        metrics['class_balance_error'] = 0.5 * float(np.abs(real_freq.to_numpy() - synth_freq.to_numpy()).sum())
+
+        total_weight = sum(self.weights[name] for name in metrics)
+        metrics['quality_score'] = sum(self.weights[name] * value for name, value in metrics.items()) / total_weight
+        if self.columns:
+            metrics['column_ks'] = dict(zip(self.columns, ks.tolist()))
+            metrics['column_wasserstein'] = dict(zip(self.columns, wasserstein.tolist()))
+        if self.categorical_columns:
+            metrics['column_category_distance'] = dict(zip(self.categorical_columns, category_distances.tolist()))
+        return metrics
+
+
+def score_samples(real_data, synthetic_data, class_column, **kwargs):
+    """Score synthetic samples against the real data, see SampleQualityScorer for the metrics"""
+    return SampleQualityScorer(real_data, class_column, **kwargs).score(synthetic_data)
@@ -0,0 +1,148 @@
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+MB = 1024 * 1024
+
+
+def current_rss_bytes():
+    """Resident set size of this process, None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process since it started or since the last reset_peak_rss()"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return 0
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def reset_peak_rss():
+    """Reset the peak RSS to the current RSS (Linux only), return whether it worked"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class MemoryLimitExceeded(RuntimeError):
+    """Raised when a ResourceMonitor's memory ceiling was exceeded, metrics holds the usage until then"""
+
+    def __init__(self, message, metrics=None):
+        super().__init__(message)
+        self.metrics = metrics or {}
+
+
+class ResourceMonitor:
+    """
+    Peak memory, CPU time and wall time of a block of work, with an optional memory ceiling
+
+    A daemon thread samples the RSS every interval seconds. Crossing the ceiling only sets a
+    flag, the work itself has to call check() (e.g. as a TabularGAN.train callback) so it is
+    aborted between two steps and not in the middle of one. The peak RSS comes from the
+    kernel's high-water mark, reset at start(), so short spikes between two samples count too.
+    CPU time covers all threads of the process.
+    """
+
+    def __init__(self, memory_limit_mb=None, interval=0.2):
+        """
+        Args:
+            memory_limit_mb: RSS in megabytes above which check() raises MemoryLimitExceeded, None for no limit
+            interval: Seconds between two RSS samples
+        """
+        self.memory_limit_mb = memory_limit_mb
+        self.interval = interval
+        self.steps = 0
+        self._peak_sampled = 0
+        self._peak_reset = False
+        self._exceeded_rss = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_wall = None
+        self._start_cpu = None
+        self._result = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._result = None
+        self._exceeded_rss = None
+        self.steps = 0
+        self._peak_reset = reset_peak_rss()
+        self._peak_sampled = current_rss_bytes() or 0
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        limit = self.memory_limit_mb * MB if self.memory_limit_mb is not None else None
+        while not self._stop.wait(self.interval):
+            rss = current_rss_bytes()
+            if rss is None:
+                continue
+            self._peak_sampled = max(self._peak_sampled, rss)
+            if limit is not None and rss > limit and self._exceeded_rss is None:
+                self._exceeded_rss = rss
+
+    def check(self, epoch=None, history=None):
+        """Raise MemoryLimitExceeded once the ceiling was crossed, the arguments match train callbacks"""
+        if epoch is not None:
+            self.steps = epoch + 1
+        if self._exceeded_rss is not None:
+            rss_mb = self._exceeded_rss / MB
+            raise MemoryLimitExceeded(
+                f"RSS of {rss_mb:.0f} MB exceeded the memory limit of {self.memory_limit_mb:g} MB "
+                f"after {self.steps} steps", self.metrics()
+            )
+
+    def stop(self):
+        """Stop sampling and return the metrics"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._result = self.metrics()
+        return self._result
+
+    def metrics(self):
+        """peak_rss_mb, cpu_seconds and wall_seconds so far"""
+        if self._result is not None:
+            return self._result
+        peak = self._peak_sampled
+        # Without a reset the high-water mark covers the whole process, it is only used if nothing was sampled
+        if self._peak_reset or not peak:
+            peak = max(peak, peak_rss_bytes())
+        return {
+            'peak_rss_mb': peak / MB,
+            'cpu_seconds': time.process_time() - self._start_cpu,
+            'wall_seconds': time.perf_counter() - self._start_wall
+        }
@@ -0,0 +1,222 @@
+import json
+import numbers
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    trial_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    trial_num INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    trial_dir TEXT,
+    params TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_trials_run ON trials (run_id, status);
+
+CREATE TABLE IF NOT EXISTS trial_params (
+    trial_id INTEGER NOT NULL REFERENCES trials (trial_id),
+    name TEXT NOT NULL,
+    value_num REAL,
+    value_text TEXT,
+    PRIMARY KEY (trial_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_params_num ON trial_params (name, value_num);
+CREATE INDEX IF NOT EXISTS idx_params_text ON trial_params (name, value_text);
+
+CREATE TABLE IF NOT EXISTS trial_metrics (
+    trial_id INTEGER NOT NULL REFERENCES trials (trial_id),
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (trial_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_metrics ON trial_metrics (name, value);
+"""
+
+
+def _param_columns(value):
+    """Split a parameter value into its numeric and text column, lists are stored as JSON text"""
+    if isinstance(value, bool) or not isinstance(value, numbers.Number):
+        return None, json.dumps(value)
+    return float(value), None
+
+
+class TrialResultsStore:
+    """
+    SQLite store for tuning trials
+
+    Every trial is written in its own transaction as soon as it completes, so the
+    results can be queried (also from another process) while a search is still running.
+    Parameters and metrics are kept in indexed name/value tables, which allows filtering
+    and ranking on any of them without loading the whole table.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Path to the SQLite database file, created if it doesn't exist
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        # Write-ahead logging lets readers query the store while trials are being added
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def add_trial(self, run_id, trial_num, params, metrics, status='completed', trial_dir=None):
+        """
+        Append one finished trial
+
+        Args:
+            run_id: Identifier of the search the trial belongs to
+            trial_num: Number of the trial within its search
+            params: Dictionary with the trial parameters
+            metrics: Dictionary with numeric metrics, None values are skipped
+            status: Trial status, e.g. 'completed' or 'failed'
+            trial_dir: Directory holding the trial artifacts
+
+        Returns:
+            The trial_id of the new row
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO trials (run_id, trial_num, status, created_at, trial_dir, params) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (run_id, int(trial_num), status, datetime.now().isoformat(timespec='seconds'),
+                 trial_dir, json.dumps(params))
+            )
+            trial_id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO trial_params (trial_id, name, value_num, value_text) VALUES (?, ?, ?, ?)",
+                [(trial_id, name, *_param_columns(value)) for name, value in params.items()]
+            )
+            self.connection.executemany(
+                "INSERT INTO trial_metrics (trial_id, name, value) VALUES (?, ?, ?)",
+                [(trial_id, name, float(value)) for name, value in metrics.items() if value is not None]
+            )
+        return trial_id
+
+    def count(self, run_id=None, status='completed'):
+        """Number of stored trials"""
+        where, args = self._where(run_id=run_id, status=status)
+        return self.connection.execute(f"SELECT COUNT(*) FROM trials t {where}", args).fetchone()[0]
+
+    def query(self, params=None, metrics=None, run_id=None, status='completed', limit=None):
+        """
+        Return the trials matching all of the given filters
+
+        Args:
+            params: Dictionary of parameter values the trials must have
+            metrics: Dictionary mapping metric names to (min, max) ranges, either bound may be None
+            run_id: Only return trials of this search
+            status: Only return trials with this status, None returns all
+            limit: Maximum number of trials to return
+
+        Returns:
+            List of dictionaries with trial_id, run_id, trial_num, status, trial_dir, params
+            and one entry per metric
+        """
+        where, args = self._where(params, metrics, run_id, status)
+        sql = f"SELECT t.* FROM trials t {where} ORDER BY t.trial_id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+        return self._with_metrics(self.connection.execute(sql, args).fetchall())
+
+    def top_k(self, metric, k=10, ascending=True, params=None, run_id=None, status='completed'):
+        """Return the k best trials by a metric, lowest first unless ascending is False"""
+        where, args = self._where(params, None, run_id, status)
+        order = "ASC" if ascending else "DESC"
+        sql = (
+            f"SELECT t.* FROM trials t JOIN trial_metrics m ON m.trial_id = t.trial_id AND m.name = ? "
+            f"{where} {'AND' if where else 'WHERE'} m.value IS NOT NULL ORDER BY m.value {order} LIMIT ?"
+        )
+        rows = self.connection.execute(sql, [metric, *args, int(k)]).fetchall()
+        return self._with_metrics(rows)
+
+    def to_dataframe(self, run_id=None, status='completed'):
+        """
+        All matching trials as one row each, with param_ prefixed parameter columns and metric columns
+
+        List parameters such as layer sizes are rendered as text, like in a CSV file.
+        """
+        trials = self.query(run_id=run_id, status=status)
+        return pd.DataFrame([
+            {
+                'trial_num': trial['trial_num'],
+                **{f"param_{name}": str(value) if isinstance(value, (list, tuple, dict)) else value
+                   for name, value in trial['params'].items()},
+                **trial['metrics']
+            }
+            for trial in trials
+        ])
+
+    def _where(self, params=None, metrics=None, run_id=None, status=None):
+        clauses, args = [], []
+        if run_id is not None:
+            clauses.append("t.run_id = ?")
+            args.append(run_id)
+        if status is not None:
+            clauses.append("t.status = ?")
+            args.append(status)
+        for name, value in (params or {}).items():
+            value_num, value_text = _param_columns(value)
+            column = "value_num" if value_text is None else "value_text"
+            clauses.append(
+                f"EXISTS (SELECT 1 FROM trial_params p WHERE p.trial_id = t.trial_id AND p.name = ? AND p.{column} = ?)"
+            )
+            args.extend([name, value_num if value_text is None else value_text])
+        for name, (low, high) in (metrics or {}).items():
+            bounds = ["m.name = ?"]
+            args.append(name)
+            if low is not None:
+                bounds.append("m.value >= ?")
+                args.append(low)
+            if high is not None:
+                bounds.append("m.value <= ?")
+                args.append(high)
+            clauses.append(
+                f"EXISTS (SELECT 1 FROM trial_metrics m WHERE m.trial_id = t.trial_id AND {' AND '.join(bounds)})"
+            )
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def _with_metrics(self, rows):
+        trials = [
+            {
+                'trial_id': row['trial_id'],
+                'run_id': row['run_id'],
+                'trial_num': row['trial_num'],
+                'status': row['status'],
+                'trial_dir': row['trial_dir'],
+                'params': json.loads(row['params']),
+                'metrics': {}
+            }
+            for row in rows
+        ]
+        if not trials:
+            return trials
+        by_id = {trial['trial_id']: trial for trial in trials}
+        # Fetch metrics in bounded batches to stay below SQLite's variable limit
+        ids = list(by_id)
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for trial_id, name, value in self.connection.execute(
+                f"SELECT trial_id, name, value FROM trial_metrics WHERE trial_id IN ({placeholders})", batch
+            ):
+                by_id[trial_id]['metrics'][name] = value
+        return trials
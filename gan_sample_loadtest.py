@@ -0,0 +1,84 @@
+import argparse
+import json
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+
+def run_load_test(url, model=None, rows=100, output_format='csv', concurrency=8, requests_per_client=50):
+    """
+    Send concurrent sample requests to a running gan_sample_server and measure the latency
+
+    Args:
+        url: Base URL of the server, e.g. http://127.0.0.1:8765
+        model: Model name, None when the server has only one model
+        rows: Rows per request
+        output_format: csv, json or arrow
+        concurrency: Number of clients sending requests at the same time
+        requests_per_client: Requests sent by each client one after another
+
+    Returns:
+        Dictionary with request and row counts, p50/p99/max latency in milliseconds,
+        requests per second and rows per second
+    """
+    body = json.dumps({'model': model, 'n': rows, 'format': output_format}).encode('utf-8')
+    latencies = [[] for _ in range(concurrency)]
+    errors = []
+
+    def client(index):
+        for _ in range(requests_per_client):
+            request = urllib.request.Request(f"{url.rstrip('/')}/sample", data=body,
+                                             headers={'Content-Type': 'application/json'})
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = np.concatenate([np.array(values) for values in latencies]) * 1000
+    completed = len(all_latencies)
+    return {
+        'requests': completed,
+        'errors': len(errors),
+        'rows': completed * rows,
+        'seconds': elapsed,
+        'p50_ms': float(np.percentile(all_latencies, 50)) if completed else None,
+        'p99_ms': float(np.percentile(all_latencies, 99)) if completed else None,
+        'max_ms': float(all_latencies.max()) if completed else None,
+        'requests_per_second': completed / elapsed,
+        'rows_per_second': completed * rows / elapsed
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test for gan_sample_server')
+    parser.add_argument('--url', default='http://127.0.0.1:8765', help='Base URL of the server')
+    parser.add_argument('--model', default=None, help='Model name (optional with a single model)')
+    parser.add_argument('--rows', type=int, default=100, help='Rows per request')
+    parser.add_argument('--format', default='csv', choices=['csv', 'json', 'arrow'], help='Output format')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per client')
+    args = parser.parse_args(argv)
+
+    result = run_load_test(args.url, args.model, args.rows, args.format, args.concurrency, args.requests)
+    print(f"Requests: {result['requests']} ({result['errors']} errors) in {result['seconds']:.2f} s")
+    if result['requests']:
+        print(f"Latency: p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, max {result['max_ms']:.1f} ms")
+    print(f"Throughput: {result['requests_per_second']:.1f} requests/s, {result['rows_per_second']:.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
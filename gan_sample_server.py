@@ -0,0 +1,311 @@
+import argparse
+import io
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from gan_sampling import SavedGenerator
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+
+
+class SampleRequest:
+    """One pending request of a SampleBatcher"""
+
+    def __init__(self, num_samples, seed=None):
+        self.num_samples = num_samples
+        self.seed = seed
+        self.samples = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class SampleBatcher:
+    """
+    Coalesces concurrent sample requests for one generator into shared forward passes
+
+    The first request of a batch waits at most max_latency seconds for others to join,
+    then the noise of all requests (each drawn from its own seed if one was given) goes
+    through the generator in one pass and the output is split between the requests.
+    """
+
+    def __init__(self, generator, max_latency=0.01, max_batch_rows=65536):
+        """
+        Args:
+            generator: SavedGenerator to sample from
+            max_latency: Seconds a request may wait for others to share its forward pass
+            max_batch_rows: A batch is started early once it has this many rows
+        """
+        self.generator = generator
+        self.max_latency = max_latency
+        self.max_batch_rows = max_batch_rows
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def sample(self, num_samples, seed=None, timeout=60):
+        """DataFrame with num_samples rows, blocks until its batch has run"""
+        request = SampleRequest(num_samples, seed)
+        self._queue.put(request)
+        if not request.done.wait(timeout):
+            raise TimeoutError(f"No samples after {timeout} seconds")
+        if request.error is not None:
+            raise request.error
+        return request.samples
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        rows = batch[0].num_samples
+        deadline = time.monotonic() + self.max_latency
+        while rows < self.max_batch_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            rows += request.num_samples
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                noise = np.concatenate([
+                    self.generator.noise(request.num_samples, np.random.default_rng(request.seed))
+                    for request in batch
+                ])
+                # Pad to a power of two so the model only ever sees a few batch shapes and is not retraced
+                rows = len(noise)
+                padded_rows = max(64, 1 << (rows - 1).bit_length())
+                noise = np.concatenate([noise, np.zeros((padded_rows - rows, noise.shape[1]), dtype=noise.dtype)])
+                samples = self.generator.decoder.decode(self.generator.forward(noise)[:rows])
+                start = 0
+                for request in batch:
+                    request.samples = samples.iloc[start:start + request.num_samples].reset_index(drop=True)
+                    start += request.num_samples
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            self.batches += 1
+            self.requests += len(batch)
+            for request in batch:
+                request.done.set()
+
+
+def encode_samples(samples, output_format):
+    """Serialize a DataFrame of samples as csv (semicolon separated), json (records) or arrow (IPC stream)"""
+    if output_format == 'csv':
+        return samples.to_csv(sep=';', index=False).encode('utf-8')
+    if output_format == 'json':
+        return samples.to_json(orient='records').encode('utf-8')
+    if output_format == 'arrow':
+        if pa is None:
+            raise ValueError("Arrow output needs pyarrow, which is not installed")
+        table = pa.Table.from_pandas(samples, preserve_index=False)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue()
+    raise ValueError(f"Unknown format '{output_format}', expected one of {list(CONTENT_TYPES)}")
+
+
+class SampleRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP interface of the sample server
+
+        GET  /health                                      -> {"status": "ok"}
+        GET  /models                                      -> loaded models with batching statistics
+        GET  /sample?model=NAME&n=100&format=csv&seed=1   -> samples
+        POST /sample with a JSON body of the same fields  -> samples
+    """
+
+    server_version = "GANSampleServer/1.0"
+
+    def address_string(self):
+        # Unix socket clients have no host address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/health':
+            self._send_json({'status': 'ok'})
+        elif url.path == '/models':
+            self._send_json({
+                name: {
+                    'model_dir': batcher.generator.model_dir,
+                    'columns': batcher.generator.columns,
+                    'requests': batcher.requests,
+                    'batches': batcher.batches
+                }
+                for name, batcher in self.server.batchers.items()
+            })
+        elif url.path == '/sample':
+            self._sample({name: values[-1] for name, values in parse_qs(url.query).items()})
+        else:
+            self._send_error(404, f"Unknown path {url.path}")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/sample':
+            self._send_error(404, f"Unknown path {url.path}")
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            params = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_error(400, "Request body must be JSON")
+            return
+        self._sample(params)
+
+    def _sample(self, params):
+        batchers = self.server.batchers
+        name = params.get('model') or (next(iter(batchers)) if len(batchers) == 1 else None)
+        if name not in batchers:
+            self._send_error(404, f"Unknown model {name}, loaded models: {list(batchers)}")
+            return
+        try:
+            num_samples = int(params.get('n', 100))
+            seed = int(params['seed']) if params.get('seed') is not None else None
+            output_format = params.get('format', 'csv')
+            if output_format not in CONTENT_TYPES:
+                raise ValueError(f"Unknown format '{output_format}', expected one of {list(CONTENT_TYPES)}")
+            if not 0 < num_samples <= self.server.max_rows:
+                raise ValueError(f"n must be between 1 and {self.server.max_rows}")
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+
+        try:
+            samples = batchers[name].sample(num_samples, seed)
+            body = encode_samples(samples, output_format)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+        except Exception as e:
+            self._send_error(500, str(e))
+            return
+        self._send(200, CONTENT_TYPES[output_format], body)
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, status=200):
+        self._send(status, CONTENT_TYPES['json'], json.dumps(data).encode('utf-8'))
+
+    def _send_error(self, status, message):
+        self._send_json({'error': message}, status)
+
+
+class SampleHTTPServer(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections of concurrent clients, which then retry after a second
+    request_queue_size = 128
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def create_server(models, host='127.0.0.1', port=8765, unix_socket=None, max_latency=0.01,
+                  max_batch_rows=65536, max_rows=1000000, quiet=False, backend='keras'):
+    """
+    Load the generators and create the HTTP server, call serve_forever() on the result to run it
+
+    Args:
+        models: Dictionary mapping model names to directories written by TabularGAN.export_generator
+        host: Address to listen on
+        port: TCP port to listen on
+        unix_socket: Listen on this Unix socket path instead of host and port
+        max_latency: Seconds a request may wait for others to share its forward pass
+        max_batch_rows: A forward pass is started early once it has this many rows
+        max_rows: Largest number of rows a single request may ask for
+        quiet: Do not log every request
+        backend: 'keras' or 'tflite' (the generator.tflite of every export), see SavedGenerator
+    """
+    if not models:
+        raise ValueError("At least one model must be given")
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = ThreadingUnixHTTPServer(unix_socket, SampleRequestHandler)
+    else:
+        server = SampleHTTPServer((host, port), SampleRequestHandler)
+    server.batchers = {
+        name: SampleBatcher(SavedGenerator(model_dir, backend), max_latency, max_batch_rows)
+        for name, model_dir in models.items()
+    }
+    server.max_rows = max_rows
+    server.quiet = quiet
+    return server
+
+
+def parse_model_args(values):
+    """Parse NAME=DIR arguments, a plain DIR is named after its last path component"""
+    models = {}
+    for value in values:
+        name, separator, model_dir = value.partition('=')
+        if not separator:
+            model_dir = value
+            name = os.path.basename(os.path.normpath(value))
+        models[name] = model_dir
+    return models
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve synthetic samples from exported generators over HTTP')
+    parser.add_argument('models', nargs='+', help='Exported generators as NAME=DIR or DIR')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on')
+    parser.add_argument('--unix-socket', default=None, help='Listen on a Unix socket instead of TCP')
+    parser.add_argument('--max-latency', type=float, default=0.01,
+                        help='Seconds a request may wait to share a forward pass')
+    parser.add_argument('--max-batch-rows', type=int, default=65536, help='Rows per forward pass')
+    parser.add_argument('--max-rows', type=int, default=1000000, help='Largest request')
+    parser.add_argument('--quiet', action='store_true', help='Do not log every request')
+    parser.add_argument('--backend', default='keras', choices=['keras', 'tflite'],
+                        help='Run the Keras generators or the generator.tflite of the exports')
+    args = parser.parse_args(argv)
+
+    server = create_server(parse_model_args(args.models), args.host, args.port, args.unix_socket,
+                           args.max_latency, args.max_batch_rows, args.max_rows, args.quiet, args.backend)
+    where = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"Serving {list(server.batchers)} on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
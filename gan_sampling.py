@@ -0,0 +1,446 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Files written by TabularGAN.export_generator
+GENERATOR_FILE = 'generator.h5'
+DECODER_FILE = 'decoder.pkl'
+METADATA_FILE = 'generator.json'
+# Written by export_tflite (or export_generator with tflite_quantization)
+TFLITE_FILE = 'generator.tflite'
+TFLITE_QUANTIZATIONS = ('float32', 'dynamic', 'int8')
+BACKENDS = ('keras', 'tflite')
+
+
+class SampleDecoder:
+    """Turns generator output into a DataFrame of samples.
+
+    The schema of the output (positions of the integer columns, their value
+    ranges, the scaling and the class labels) is computed once, so decoding
+    is a few operations on the whole NumPy block instead of a loop over the
+    columns.
+
+    Args:
+        numerical_columns: Names of the numerical columns in generator output order
+        column_ranges: Dictionary mapping integer columns to {'min': ..., 'max': ...}
+        scaler: Fitted MinMaxScaler of the numerical columns
+        classes: Class labels in the order of the class part of the generator output
+        class_column: Name of the class column
+        integer_class: Restore the class labels as integers if they all are
+        categories: Dictionary mapping the categorical feature columns, in generator output
+            order after the numerical columns, to their category labels
+        feature_columns: Order of the feature columns in the samples, defaults to the
+            numerical columns followed by the categorical columns
+    """
+
+    def __init__(self, numerical_columns, column_ranges, scaler, classes, class_column, integer_class=False,
+                 categories=None, feature_columns=None):
+        self.numerical_columns = list(numerical_columns)
+        self.categories = dict(categories or {})
+        self.columns = list(feature_columns or self.numerical_columns + list(self.categories))
+        self.class_column = class_column
+        self.num_numerical = len(self.numerical_columns)
+
+        # Every categorical column has a block of one probability per category
+        widths = [len(labels) for labels in self.categories.values()]
+        self.category_starts = self.num_numerical + np.concatenate([[0], np.cumsum(widths)[:-1]]).astype(np.intp)
+        self.category_widths = np.array(widths, dtype=np.intp)
+        self.class_start = self.num_numerical + int(sum(widths))
+
+        # MinMaxScaler maps x to x * scale_ + min_
+        self.scale = np.asarray(scaler.scale_, dtype=np.float64)
+        self.offset = np.asarray(scaler.min_, dtype=np.float64)
+
+        integer_positions = [i for i, col in enumerate(self.numerical_columns) if col in column_ranges]
+        self.integer_idx = np.array(integer_positions, dtype=np.intp)
+        self.float_idx = np.setdiff1d(np.arange(self.num_numerical), self.integer_idx)
+        self.integer_min = np.array([column_ranges[self.numerical_columns[i]]['min'] for i in integer_positions],
+                                    dtype=np.float64)
+        self.integer_max = np.array([column_ranges[self.numerical_columns[i]]['max'] for i in integer_positions],
+                                    dtype=np.float64)
+
+        self.class_labels = np.asarray(classes).astype(str)
+        self.class_values = self.class_labels
+        if integer_class:
+            try:
+                self.class_values = self.class_labels.astype(np.int64)
+            except ValueError:
+                pass
+
+    def class_code(self, label):
+        """Position of a class label in the class part of the generator output, -1 if unknown"""
+        matches = np.flatnonzero(self.class_labels == str(label))
+        return int(matches[0]) if len(matches) else -1
+
+    def class_codes(self, generated):
+        """Class position of every generated row"""
+        return generated[:, self.class_start:].argmax(axis=1)
+
+    def decode(self, generated):
+        """DataFrame with the original columns from a block of generator output"""
+        numerical = (generated[:, :self.num_numerical].astype(np.float64) - self.offset) / self.scale
+        integers = np.clip(np.rint(numerical[:, self.integer_idx]), self.integer_min, self.integer_max)
+
+        # One argmax per categorical column, each over all rows at once
+        categorical = {
+            col: labels[generated[:, start:start + width].argmax(axis=1)]
+            for (col, labels), start, width in zip(self.categories.items(), self.category_starts, self.category_widths)
+        }
+
+        frame = pd.concat([
+            pd.DataFrame(numerical[:, self.float_idx], columns=[self.numerical_columns[i] for i in self.float_idx]),
+            pd.DataFrame(integers.astype(np.int64), columns=[self.numerical_columns[i] for i in self.integer_idx]),
+            pd.DataFrame(categorical, columns=list(self.categories))
+        ], axis=1)[self.columns]
+        frame[self.class_column] = self.class_values[self.class_codes(generated)]
+        return frame
+
+
+def convert_to_tflite(model, quantization='dynamic', calibration_rows=1000, seed=0):
+    """
+    Convert a generator model to a TFLite flatbuffer
+
+    Args:
+        model: Keras generator with a (batch, latent_dim) noise input
+        quantization: 'float32' converts without quantization, 'dynamic' stores the weights as
+            int8 and quantizes activations on the fly, 'int8' quantizes weights and activations
+            with ranges calibrated on standard normal noise. Input and output stay float32.
+        calibration_rows: Rows of noise the int8 activation ranges are calibrated on
+        seed: Seed of the calibration noise
+
+    Returns:
+        The TFLite model as bytes
+    """
+    import tensorflow as tf
+
+    if quantization not in TFLITE_QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {TFLITE_QUANTIZATIONS}")
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization != 'float32':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'int8':
+        latent_dim = model.input_shape[-1]
+        noise = np.random.default_rng(seed).standard_normal((calibration_rows, latent_dim), dtype=np.float32)
+
+        def representative_dataset():
+            for row in noise:
+                yield [row[None, :]]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def export_tflite(model_dir, quantization='dynamic', calibration_rows=1000, seed=0, model=None):
+    """
+    Add a TFLite version of the generator to an export, load it with SavedGenerator(model_dir, backend='tflite')
+
+    Args:
+        model_dir: Directory written by TabularGAN.export_generator
+        quantization: One of TFLITE_QUANTIZATIONS, see convert_to_tflite
+        calibration_rows: Rows of noise for the int8 calibration
+        seed: Seed of the calibration noise
+        model: Generator model to convert, None loads the one in model_dir
+
+    Returns:
+        Path of the TFLite file
+    """
+    if model is None:
+        from tensorflow.keras import models
+
+        model = models.load_model(os.path.join(model_dir, GENERATOR_FILE), compile=False)
+    path = os.path.join(model_dir, TFLITE_FILE)
+    with open(path, 'wb') as f:
+        f.write(convert_to_tflite(model, quantization, calibration_rows, seed))
+
+    metadata_path = os.path.join(model_dir, METADATA_FILE)
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+    metadata['tflite_quantization'] = quantization
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=4)
+    return path
+
+
+def _tflite_interpreter(path, num_threads=None):
+    """TFLite interpreter from the small ai_edge_litert or tflite_runtime packages if installed, from TensorFlow otherwise"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=path, num_threads=num_threads)
+
+
+class SavedGenerator:
+    """
+    Generator exported with TabularGAN.export_generator
+
+    Sampling only needs the generator model and the SampleDecoder, the training data
+    and the discriminator are not loaded. With backend='tflite' the forward pass runs in a
+    TFLite interpreter on the generator.tflite of the export (see export_tflite) and the
+    Keras model is not loaded either.
+    """
+
+    def __init__(self, model_dir, backend='keras', num_threads=None):
+        """
+        Args:
+            model_dir: Directory written by TabularGAN.export_generator
+            backend: 'keras' or 'tflite'
+            num_threads: Threads of the TFLite interpreter, None for its default
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        self.model_dir = model_dir
+        self.backend = backend
+        with open(os.path.join(model_dir, METADATA_FILE)) as f:
+            self.metadata = json.load(f)
+        with open(os.path.join(model_dir, DECODER_FILE), 'rb') as f:
+            self.decoder = pickle.load(f)
+        self.latent_dim = self.metadata['latent_dim']
+        self.columns = self.metadata['columns']
+        if backend == 'tflite':
+            path = os.path.join(model_dir, TFLITE_FILE)
+            if not os.path.exists(path):
+                raise ValueError(f"{model_dir} has no {TFLITE_FILE}, create it with export_tflite")
+            self.model = None
+            self._interpreter = _tflite_interpreter(path, num_threads)
+            self._input_index = self._interpreter.get_input_details()[0]['index']
+            self._output_index = self._interpreter.get_output_details()[0]['index']
+            self._batch_rows = None
+        else:
+            from tensorflow.keras import models
+
+            self.model = models.load_model(os.path.join(model_dir, GENERATOR_FILE), compile=False)
+
+    def noise(self, num_samples, rng=None):
+        """Generator input for num_samples rows, drawn from rng (a numpy Generator)"""
+        rng = rng if rng is not None else np.random.default_rng()
+        return rng.standard_normal((num_samples, self.latent_dim), dtype=np.float32)
+
+    def forward(self, noise):
+        """Generator output for a block of noise, in one forward pass"""
+        if self.model is not None:
+            return np.asarray(self.model.predict_on_batch(noise))
+        # The interpreter's tensors have a fixed batch size, reallocated only when it changes
+        if len(noise) != self._batch_rows:
+            self._interpreter.resize_tensor_input(self._input_index, [len(noise), self.latent_dim])
+            self._interpreter.allocate_tensors()
+            self._batch_rows = len(noise)
+        self._interpreter.set_tensor(self._input_index, np.asarray(noise, dtype=np.float32))
+        self._interpreter.invoke()
+        return self._interpreter.get_tensor(self._output_index)
+
+    def generate_raw(self, num_samples, rng=None):
+        """Generator output for num_samples rows"""
+        return self.forward(self.noise(num_samples, rng))
+
+    def generate(self, num_samples, rng=None):
+        """DataFrame with num_samples synthetic rows"""
+        return self.decoder.decode(self.generate_raw(num_samples, rng))
+
+
+def _forward_seconds(generator, noise, batch_rows, repeats):
+    """Fastest of repeats timed forward passes over noise in blocks of batch_rows, and the output"""
+    generator.forward(noise[:batch_rows])
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        raw = np.concatenate([generator.forward(noise[i:i + batch_rows]) for i in range(0, len(noise), batch_rows)])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, raw
+
+
+def check_tflite(model_dir, num_samples=20000, batch_rows=10000, seed=0, num_threads=None, repeats=3):
+    """
+    Compare the TFLite generator of an export with the float Keras generator
+
+    Both run on the same noise. Speed is the forward pass alone (decoding costs the same for
+    both). Drift is measured on the decoded rows with gan_quality, the float rows taking the
+    place of the real data, plus the mean absolute difference of the raw outputs and the
+    fraction of rows that decode to the same class. The result is also written to
+    tflite_check.json in model_dir.
+
+    Args:
+        model_dir: Directory with generator.tflite, see export_tflite
+        num_samples: Rows generated by each backend
+        batch_rows: Rows per forward pass
+        seed: Seed of the noise
+        num_threads: Threads of the TFLite interpreter
+        repeats: Timed passes per backend, the fastest counts
+
+    Returns:
+        Dictionary with the rows/s of both backends, the speedup and the drift metrics
+    """
+    from gan_quality import SampleQualityScorer
+
+    keras_generator = SavedGenerator(model_dir)
+    tflite_generator = SavedGenerator(model_dir, backend='tflite', num_threads=num_threads)
+    noise = keras_generator.noise(num_samples, np.random.default_rng(seed))
+    keras_seconds, keras_raw = _forward_seconds(keras_generator, noise, batch_rows, repeats)
+    tflite_seconds, tflite_raw = _forward_seconds(tflite_generator, noise, batch_rows, repeats)
+
+    decoder = keras_generator.decoder
+    column_types = {
+        **{col: 'float' for col in decoder.numerical_columns},
+        **{col: 'categorical' for col in decoder.categories}
+    }
+    scorer = SampleQualityScorer(decoder.decode(keras_raw), keras_generator.metadata['class_column'],
+                                 max_rows=num_samples, column_types=column_types)
+    drift = scorer.score(decoder.decode(tflite_raw))
+    result = {
+        'quantization': keras_generator.metadata.get('tflite_quantization'),
+        'num_samples': num_samples,
+        'batch_rows': batch_rows,
+        'keras_rows_per_second': num_samples / keras_seconds,
+        'tflite_rows_per_second': num_samples / tflite_seconds,
+        'speedup': keras_seconds / tflite_seconds,
+        'raw_mean_abs_diff': float(np.abs(keras_raw - tflite_raw).mean()),
+        'class_agreement': float((decoder.class_codes(keras_raw) == decoder.class_codes(tflite_raw)).mean()),
+        **drift
+    }
+    with open(os.path.join(model_dir, 'tflite_check.json'), 'w') as f:
+        json.dump(result, f, indent=4)
+    print(f"Keras {result['keras_rows_per_second']:.0f} rows/s, TFLite ({result['quantization']}) "
+          f"{result['tflite_rows_per_second']:.0f} rows/s, speedup {result['speedup']:.2f}x")
+    if 'ks_mean' in result:
+        print(f"Drift against the float model: KS {result['ks_mean']:.4f}, "
+              f"Wasserstein {result['wasserstein_mean']:.4f}, class agreement {result['class_agreement']:.2%}")
+    else:
+        print(f"Drift against the float model: category distance {result['category_distance']:.4f}, "
+              f"class agreement {result['class_agreement']:.2%}")
+    return result
+
+
+def _shard_sizes(total, n_shards):
+    """Split total rows into n_shards sizes that differ by at most one"""
+    base, extra = divmod(total, n_shards)
+    return [base + (1 if i < extra else 0) for i in range(n_shards)]
+
+
+def _write_shard(task):
+    """Worker process: generate one shard chunk by chunk and write it as a CSV file"""
+    if task['backend'] == 'keras':
+        # Imports TensorFlow, which the tflite backend does without
+        from gan_threads import configure_threads
+
+        # Split the cores between the workers instead of letting every worker use all of them
+        configure_threads(task['intra_op_threads'], 1)
+    generator = SavedGenerator(task['model_dir'], task['backend'], num_threads=task['intra_op_threads'])
+    rng = np.random.default_rng(task['seed'])
+
+    start = time.perf_counter()
+    written = 0
+    with open(task['path'], 'w', newline='') as f:
+        while written < task['rows']:
+            n_rows = min(task['chunk_size'], task['rows'] - written)
+            chunk = generator.generate(n_rows, rng)
+            chunk.to_csv(f, sep=';', index=False, header=written == 0)
+            written += n_rows
+    return {
+        'file': os.path.basename(task['path']),
+        'rows': written,
+        'seconds': time.perf_counter() - start
+    }
+
+
+def generate_sharded(model_dir, total, n_workers, out_dir, seed=None, chunk_size=100000, backend='keras'):
+    """
+    Generate a large synthetic data set in parallel worker processes
+
+    Every worker loads the exported generator, draws its noise from its own seed stream
+    (spawned from one SeedSequence, so the streams are independent and the whole run is
+    reproducible from seed) and writes its rows to one shard file. manifest.json in
+    out_dir lists the shards with their row counts and seeds.
+
+    Args:
+        model_dir: Directory written by TabularGAN.export_generator
+        total: Total number of rows
+        n_workers: Number of worker processes and shards
+        out_dir: Directory for the shards and the manifest
+        seed: Seed of the run, None draws a fresh one (recorded in the manifest)
+        chunk_size: Rows generated and written at a time by each worker
+        backend: 'keras' or 'tflite', see SavedGenerator
+
+    Returns:
+        The manifest dictionary
+    """
+    if total <= 0 or n_workers <= 0:
+        raise ValueError("total and n_workers must be positive")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    os.makedirs(out_dir, exist_ok=True)
+    seed_sequence = np.random.SeedSequence(seed)
+    shard_seeds = seed_sequence.spawn(n_workers)
+    intra_op_threads = max((os.cpu_count() or 1) // n_workers, 1)
+
+    tasks = [
+        {
+            'model_dir': model_dir,
+            'path': os.path.join(out_dir, f"shard_{i:05d}.csv"),
+            'rows': rows,
+            'seed': shard_seed,
+            'chunk_size': chunk_size,
+            'backend': backend,
+            'intra_op_threads': intra_op_threads
+        }
+        for i, (rows, shard_seed) in enumerate(zip(_shard_sizes(total, n_workers), shard_seeds))
+    ]
+
+    start = time.perf_counter()
+    # Spawned workers start without a copy of this process's TensorFlow state
+    with multiprocessing.get_context('spawn').Pool(n_workers) as pool:
+        shards = pool.map(_write_shard, tasks)
+    elapsed = time.perf_counter() - start
+
+    with open(os.path.join(model_dir, METADATA_FILE)) as f:
+        columns = json.load(f)['columns']
+    manifest = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'model_dir': os.path.abspath(model_dir),
+        'total_rows': total,
+        'n_workers': n_workers,
+        'backend': backend,
+        'seed': seed_sequence.entropy,
+        'columns': columns,
+        'seconds': elapsed,
+        'rows_per_second': total / elapsed,
+        'shards': [
+            {**shard, 'seed_spawn_key': list(task['seed'].spawn_key)}
+            for shard, task in zip(shards, tasks)
+        ]
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=4)
+    print(f"Generated {total} rows in {n_workers} shards in {elapsed:.1f} s ({total / elapsed:.0f} rows/s)")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic rows from an exported generator in parallel')
+    parser.add_argument('model_dir', help='Directory written by TabularGAN.export_generator')
+    parser.add_argument('total', type=int, help='Total number of rows')
+    parser.add_argument('out_dir', help='Directory for the shards and manifest.json')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the run')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Rows written at a time per worker')
+    parser.add_argument('--backend', default='keras', choices=BACKENDS,
+                        help='Run the Keras generator or the generator.tflite of the export')
+    args = parser.parse_args(argv)
+    generate_sharded(args.model_dir, args.total, args.workers, args.out_dir, args.seed, args.chunk_size, args.backend)
+
+
+if __name__ == "__main__":
+    main()
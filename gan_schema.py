@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+SCHEMA_SUFFIX = '.schema.json'
+COLUMN_TYPES = ('integer', 'float', 'categorical')
+
+
+def schema_path(data_path):
+    """Schema file kept next to a data file, e.g. adult.csv.schema.json"""
+    return data_path + SCHEMA_SUFFIX
+
+
+def is_categorical(values):
+    """A column is categorical when most of its values are not numbers"""
+    if pd.api.types.is_bool_dtype(values):
+        return True
+    if pd.api.types.is_numeric_dtype(values):
+        return False
+    present = values.dropna()
+    return pd.to_numeric(present, errors='coerce').isna().mean() > 0.5 if len(present) else False
+
+
+def infer_column(values):
+    """Type, range and missing fraction of one column of a sample"""
+    info = {'missing': float(values.isna().mean())}
+    if is_categorical(values):
+        info['type'] = 'categorical'
+        info['distinct'] = int(values.nunique())
+        return info
+    numeric = pd.to_numeric(values, errors='coerce').dropna()
+    whole = len(numeric) > 0 and bool((numeric == np.floor(numeric)).all())
+    info['type'] = 'integer' if whole else 'float'
+    if len(numeric):
+        info['min'] = int(numeric.min()) if whole else float(numeric.min())
+        info['max'] = int(numeric.max()) if whole else float(numeric.max())
+    return info
+
+
+class TableSchema:
+    """
+    Column types of a semicolon separated data file, inferred from its first rows
+
+    Only a bounded sample (sample_rows) is parsed, so the schema of a large file is known
+    without a full pass. It is saved as <data file>.schema.json and reused by later loads as
+    long as the size and modification time of the data file match. The file can be edited,
+    e.g. to change a column that only has whole numbers in the sample from integer to float.
+    Ranges are those of the sample; TabularGAN takes the exact ranges from the loaded data.
+    """
+
+    def __init__(self, columns, data_size=None, data_mtime_ns=None, sample_rows=None):
+        """
+        Args:
+            columns: Dictionary mapping every column to a dictionary with its 'type' (one of
+                COLUMN_TYPES) and optionally 'min', 'max', 'missing' and 'distinct'
+            data_size: Size of the data file in bytes when the schema was inferred
+            data_mtime_ns: Modification time of the data file when the schema was inferred
+            sample_rows: Number of rows the schema was inferred from
+        """
+        for col, info in columns.items():
+            if info.get('type') not in COLUMN_TYPES:
+                raise ValueError(f"Column '{col}' has type {info.get('type')!r}, expected one of {COLUMN_TYPES}")
+        self.columns = columns
+        self.data_size = data_size
+        self.data_mtime_ns = data_mtime_ns
+        self.sample_rows = sample_rows
+
+    @classmethod
+    def infer(cls, data_path, sample_rows=10000):
+        """Infer the schema from the first sample_rows rows of a data file"""
+        stat = os.stat(data_path)
+        sample = pd.read_csv(data_path, sep=';', nrows=sample_rows)
+        return cls(
+            {col: infer_column(sample[col]) for col in sample.columns},
+            data_size=stat.st_size,
+            data_mtime_ns=stat.st_mtime_ns,
+            sample_rows=len(sample)
+        )
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            schema = json.load(f)
+        return cls(schema['columns'], schema.get('data_size'), schema.get('data_mtime_ns'), schema.get('sample_rows'))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'data_size': self.data_size,
+                'data_mtime_ns': self.data_mtime_ns,
+                'sample_rows': self.sample_rows,
+                'columns': self.columns
+            }, f, indent=4)
+
+    def matches(self, data_path):
+        """Whether the data file is unchanged since the schema was inferred"""
+        stat = os.stat(data_path)
+        return stat.st_size == self.data_size and stat.st_mtime_ns == self.data_mtime_ns
+
+    def columns_of_type(self, column_type):
+        return [col for col, info in self.columns.items() if info['type'] == column_type]
+
+    @property
+    def integer_columns(self):
+        return self.columns_of_type('integer')
+
+    @property
+    def categorical_columns(self):
+        return self.columns_of_type('categorical')
+
+    @property
+    def types(self):
+        """Dictionary mapping every column to its type"""
+        return {col: info['type'] for col, info in self.columns.items()}
+
+    def read_dtypes(self):
+        """dtype argument for pd.read_csv: categorical columns are read as text without parsing numbers"""
+        return {col: str for col in self.categorical_columns}
+
+
+def load_schema(data_path, sample_rows=10000, refresh=False):
+    """
+    Schema of a data file, read from its schema file if it is still valid, inferred and saved otherwise
+
+    Args:
+        data_path: Path to the semicolon separated CSV file
+        sample_rows: Number of rows a new schema is inferred from
+        refresh: Infer the schema again even if a valid schema file exists
+    """
+    path = schema_path(data_path)
+    if not refresh and os.path.exists(path):
+        schema = TableSchema.load(path)
+        if schema.matches(data_path):
+            return schema
+    schema = TableSchema.infer(data_path, sample_rows)
+    try:
+        schema.save(path)
+    except OSError as e:
+        print(f"Could not save the schema to {path}: {e}")
+    return schema
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Infer and save the column types of a semicolon separated CSV file')
+    parser.add_argument('data', help='Semicolon separated CSV file')
+    parser.add_argument('--sample-rows', type=int, default=10000, help='Number of rows to infer the types from')
+    parser.add_argument('--refresh', action='store_true', help='Infer again even if a valid schema file exists')
+    args = parser.parse_args(argv)
+
+    schema = load_schema(args.data, args.sample_rows, args.refresh)
+    for col, info in schema.columns.items():
+        details = ', '.join(f"{name} {value}" for name, value in info.items() if name != 'type')
+        print(f"{col}: {info['type']} ({details})")
+    print(f"Schema from {schema.sample_rows} sample rows: {schema_path(args.data)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import warnings
+
+import tensorflow as tf
+
+# Environment variables overriding the thread counts passed in code
+INTRA_OP_ENV = 'GAN_INTRA_OP_THREADS'
+INTER_OP_ENV = 'GAN_INTER_OP_THREADS'
+CACHE_ENV = 'GAN_THREAD_CACHE'
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'gan_gui', 'thread_settings.json')
+
+
+def requested_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    Thread counts after applying the GAN_INTRA_OP_THREADS and GAN_INTER_OP_THREADS overrides
+
+    Every value is None, 'auto' or an int; a variable that is neither 'auto' nor a number
+    raises a ValueError naming it.
+    """
+    requested = []
+    for name, value in ((INTRA_OP_ENV, intra_op_threads), (INTER_OP_ENV, inter_op_threads)):
+        if name in os.environ:
+            value = os.environ[name].strip()
+            if value == '':
+                value = None
+            elif value.lower() == 'auto':
+                value = 'auto'
+            else:
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise ValueError(f"{name} must be a number of threads or 'auto', got {os.environ[name]!r}")
+        requested.append(value)
+    return tuple(requested)
+
+
+def configure_threads(intra_op_threads=None, inter_op_threads=None, use_environment=True):
+    """
+    Set TensorFlow's intra-op and inter-op thread pool sizes
+
+    GAN_INTRA_OP_THREADS and GAN_INTER_OP_THREADS override the arguments, None keeps
+    TensorFlow's default (all cores). 'auto' is resolved by TabularGAN with a benchmark;
+    passed here unresolved, e.g. by a sampling worker, it keeps the default as well.
+    TensorFlow only accepts new values before its runtime starts; later calls with
+    different values emit a warning and change nothing.
+
+    Args:
+        intra_op_threads: Intra-op thread count, None or 'auto'
+        inter_op_threads: Inter-op thread count, None or 'auto'
+        use_environment: Apply the environment overrides, False for values already
+            taken from requested_threads
+
+    Returns:
+        Tuple with the effective (intra_op_threads, inter_op_threads), 0 meaning the default
+    """
+    if use_environment:
+        intra_op_threads, inter_op_threads = requested_threads(intra_op_threads, inter_op_threads)
+    requested = {'intra': intra_op_threads, 'inter': inter_op_threads}
+    setters = {
+        'intra': (tf.config.threading.get_intra_op_parallelism_threads,
+                  tf.config.threading.set_intra_op_parallelism_threads),
+        'inter': (tf.config.threading.get_inter_op_parallelism_threads,
+                  tf.config.threading.set_inter_op_parallelism_threads)
+    }
+    for pool, value in requested.items():
+        if value is None or value == 'auto':
+            continue
+        value = int(value)
+        get_threads, set_threads = setters[pool]
+        if get_threads() == value:
+            continue
+        try:
+            set_threads(value)
+        except RuntimeError:
+            warnings.warn(f"TensorFlow is already initialized, {pool}-op threads stay at {get_threads()} "
+                          f"instead of {value}. Configure threads before the first model is built.")
+    return (tf.config.threading.get_intra_op_parallelism_threads(),
+            tf.config.threading.get_inter_op_parallelism_threads())
+
+
+def tensorflow_initialized():
+    """Whether TensorFlow's runtime has started, after which its thread pools are fixed"""
+    from tensorflow.python.eager import context
+
+    return bool(getattr(context.context(), '_initialized', False))
+
+
+def candidate_settings(cpu_count=None):
+    """A few (intra_op_threads, inter_op_threads) pairs worth trying on this machine"""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    intra_values = sorted({1, max(cpu_count // 4, 1), max(cpu_count // 2, 1), cpu_count})
+    return [(intra, inter) for intra in intra_values for inter in (1, 2)]
+
+
+def _cache_path():
+    return os.environ.get(CACHE_ENV, DEFAULT_CACHE_PATH)
+
+
+def _load_cache():
+    try:
+        with open(_cache_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache):
+    path = _cache_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def cache_key(latent_dim, gen_layers, disc_layers, input_dim):
+    """Cache key of a thread setting: machine and architecture"""
+    return (f"{socket.gethostname()}|cpus={os.cpu_count()}|latent_dim={latent_dim}|gen_layers={gen_layers}"
+            f"|disc_layers={disc_layers}|input_dim={input_dim}")
+
+
+def cached_setting(key):
+    """Return the cached (intra_op_threads, inter_op_threads) for a key, or None"""
+    entry = _load_cache().get(key)
+    return (entry['intra_op_threads'], entry['inter_op_threads']) if entry else None
+
+
+def autotune_threads(spec, key, candidates=None, steps=20, timeout=600):
+    """
+    Benchmark the training step for several thread settings and cache the fastest one
+
+    Each setting runs in its own Python process, because TensorFlow cannot change its
+    thread pools once started.
+
+    Args:
+        spec: Dictionary with the TabularGAN arguments (data_path, class_column, integer_columns,
+            latent_dim, gen_layers, disc_layers) and the batch_size to benchmark
+        key: Cache key, see cache_key
+        candidates: List of (intra_op_threads, inter_op_threads) pairs, defaults to candidate_settings()
+        steps: Number of timed training steps per setting
+        timeout: Seconds allowed per setting
+
+    Returns:
+        Tuple with the best (intra_op_threads, inter_op_threads)
+    """
+    candidates = candidates or candidate_settings()
+    env = {name: value for name, value in os.environ.items() if name not in (INTRA_OP_ENV, INTER_OP_ENV)}
+    results = []
+    for intra, inter in candidates:
+        child_spec = {**spec, 'intra_op_threads': intra, 'inter_op_threads': inter, 'steps': steps}
+        try:
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--benchmark', json.dumps(child_spec)],
+                capture_output=True, text=True, timeout=timeout, env=env, check=True
+            )
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+        except (subprocess.SubprocessError, ValueError, IndexError) as e:
+            warnings.warn(f"Thread benchmark with intra={intra}, inter={inter} failed: {e}")
+            continue
+        print(f"Threads intra={intra}, inter={inter}: {result['samples_per_second']:.0f} samples/s")
+        results.append({'intra_op_threads': intra, 'inter_op_threads': inter, **result})
+
+    if not results:
+        raise RuntimeError("All thread benchmarks failed")
+    best = max(results, key=lambda result: result['samples_per_second'])
+    cache = _load_cache()
+    cache[key] = best
+    _save_cache(cache)
+    return best['intra_op_threads'], best['inter_op_threads']
+
+
+def _run_benchmark(spec):
+    """Child process side of autotune_threads: time the training step with one thread setting"""
+    from tabular_gan_modified import TabularGAN
+
+    gan = TabularGAN(
+        spec['data_path'],
+        spec['class_column'],
+        integer_columns=spec.get('integer_columns'),
+        latent_dim=spec['latent_dim'],
+        gen_layers=spec.get('gen_layers'),
+        disc_layers=spec.get('disc_layers'),
+        preprocess_chunk_size=spec.get('preprocess_chunk_size'),
+        preprocessed_dir=spec.get('preprocessed_dir'),
+        intra_op_threads=spec['intra_op_threads'],
+        inter_op_threads=spec['inter_op_threads']
+    )
+    result = gan.benchmark_batch_sizes([spec['batch_size']], steps=spec['steps'])[0]
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Thread setting benchmark (used by autotune_threads)')
+    parser.add_argument('--benchmark', required=True, help='JSON benchmark specification')
+    _run_benchmark(json.loads(parser.parse_args().benchmark))
@@ -0,0 +1,318 @@
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+
+from gan_resources import MemoryLimitExceeded
+
+
+def _write_json(path, data):
+    """Write a JSON file atomically: readers on other hosts see either nothing or the whole file"""
+    tmp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class Lease:
+    """
+    A claimed trial
+
+    While the lease is active a background thread touches the claimed file, the file's
+    modification time is the heartbeat other processes check for expired leases.
+    """
+
+    def __init__(self, queue, trial_num, spec, worker_id):
+        self.queue = queue
+        self.trial_num = trial_num
+        self.spec = spec
+        self.worker_id = worker_id
+        self.path = queue._path('claimed', trial_num)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _heartbeat(self):
+        interval = max(self.queue.lease_timeout / 4, 1)
+        while not self._stop.wait(interval):
+            try:
+                os.utime(self.path, None)
+            except FileNotFoundError:
+                # The lease expired and the trial was handed to another worker
+                return
+
+
+class WorkQueue:
+    """
+    Trial queue on a shared directory, without any broker service
+
+    Every state change is an atomic rename between the subdirectories below, which works
+    on local disks and NFS alike:
+        pending/  trials waiting for a worker
+        claimed/  trials being run, the file modification time is the lease heartbeat
+        done/     reports of finished trials
+        failed/   reports of trials that failed max_attempts times
+    A claimed trial whose heartbeat is older than lease_timeout is moved back to pending
+    by whichever process notices it first. Trials and reports carry the run_id of the
+    search, so reports of an earlier search in the same directory are never taken as results.
+    """
+
+    STATES = ('pending', 'claimed', 'done', 'failed')
+
+    def __init__(self, queue_dir, lease_timeout=600, max_attempts=3, poll_interval=5):
+        """
+        Args:
+            queue_dir: Shared directory holding the queue
+            lease_timeout: Seconds without heartbeat after which a claimed trial is handed out again
+            max_attempts: Number of times a trial is tried before it is reported as failed
+            poll_interval: Seconds between checks for new work or results
+        """
+        self.queue_dir = queue_dir
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        for state in self.STATES:
+            os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    def _path(self, state, trial_num):
+        return os.path.join(self.queue_dir, state, f"{int(trial_num):06d}.json")
+
+    def _trial_files(self, state):
+        return sorted(name for name in os.listdir(os.path.join(self.queue_dir, state)) if name.endswith('.json'))
+
+    def _now(self):
+        """Current time of the file server, so heartbeats are compared without clock skew between hosts"""
+        clock_path = os.path.join(self.queue_dir, f".clock.{socket.gethostname()}.{os.getpid()}")
+        with open(clock_path, "w"):
+            pass
+        now = os.stat(clock_path).st_mtime
+        os.remove(clock_path)
+        return now
+
+    def initialize(self, config):
+        """Write the run configuration shared by all workers and remove the trials of earlier runs"""
+        removed = 0
+        for state in self.STATES:
+            for name in self._trial_files(state):
+                try:
+                    os.remove(os.path.join(self.queue_dir, state, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        if removed:
+            print(f"Removed {removed} trial files of an earlier run from {self.queue_dir}")
+        _write_json(os.path.join(self.queue_dir, "config.json"), config)
+
+    def config(self):
+        return _read_json(os.path.join(self.queue_dir, "config.json"))
+
+    def wait_for_config(self):
+        """Run configuration, polled until the coordinator has written it"""
+        path = os.path.join(self.queue_dir, "config.json")
+        if not os.path.exists(path):
+            print(f"Waiting for a search to write {path}")
+            while not os.path.exists(path):
+                time.sleep(self.poll_interval)
+        return self.config()
+
+    def put(self, trial_num, params, run_id=None):
+        """Add a trial of the run run_id to the pending trials"""
+        _write_json(self._path('pending', trial_num), {
+            'trial_num': trial_num,
+            'run_id': run_id,
+            'params': params,
+            'attempts': 0
+        })
+
+    def claim(self, worker_id):
+        """Claim the next pending trial, return a Lease or None when nothing is pending"""
+        for name in self._trial_files('pending'):
+            source = os.path.join(self.queue_dir, 'pending', name)
+            target = os.path.join(self.queue_dir, 'claimed', name)
+            try:
+                # Only one worker can win the rename, the others move on to the next file
+                os.rename(source, target)
+            except FileNotFoundError:
+                continue
+            os.utime(target, None)
+            spec = _read_json(target)
+            return Lease(self, spec['trial_num'], spec, worker_id)
+        return None
+
+    def complete(self, lease, metrics, trial_dir, status='completed'):
+        """Report a finished (or aborted, which is not retried) trial and release its lease"""
+        _write_json(self._path('done', lease.trial_num), {
+            'trial_num': lease.trial_num,
+            'run_id': lease.spec.get('run_id'),
+            'params': lease.spec['params'],
+            'status': status,
+            'metrics': metrics,
+            'trial_dir': trial_dir,
+            'worker': lease.worker_id
+        })
+        self._release(lease)
+
+    def fail(self, lease, error):
+        """Hand a failed trial out again, or report it as failed after max_attempts"""
+        if not os.path.exists(lease.path):
+            # The lease expired meanwhile and the trial is already queued again
+            return
+        self._retry_or_fail(lease.spec, error, lease.worker_id)
+        self._release(lease)
+
+    def _retry_or_fail(self, spec, error, worker_id):
+        attempts = spec.get('attempts', 0) + 1
+        if attempts < self.max_attempts:
+            _write_json(self._path('pending', spec['trial_num']), {**spec, 'attempts': attempts, 'last_error': error})
+        else:
+            _write_json(self._path('failed', spec['trial_num']), {
+                'trial_num': spec['trial_num'],
+                'run_id': spec.get('run_id'),
+                'params': spec['params'],
+                'status': 'failed',
+                'error': error,
+                'worker': worker_id
+            })
+
+    def _release(self, lease):
+        try:
+            os.remove(lease.path)
+        except FileNotFoundError:
+            pass
+
+    def requeue_expired(self):
+        """Move claimed trials without a recent heartbeat back to pending, return their numbers"""
+        now = self._now()
+        requeued = []
+        for name in self._trial_files('claimed'):
+            path = os.path.join(self.queue_dir, 'claimed', name)
+            expired_path = f"{path}.expired.{socket.gethostname()}.{os.getpid()}"
+            try:
+                if now - os.stat(path).st_mtime < self.lease_timeout:
+                    continue
+                # Only one process can win the rename and requeue the trial
+                os.rename(path, expired_path)
+            except FileNotFoundError:
+                continue
+            spec = _read_json(expired_path)
+            self._retry_or_fail(spec, f"Lease expired after {self.lease_timeout} seconds without heartbeat", None)
+            os.remove(expired_path)
+            requeued.append(spec['trial_num'])
+        return requeued
+
+    def reports(self, exclude=(), run_id=None):
+        """Reports of finished and failed trials of the run run_id (all runs for None), except the trials in exclude"""
+        reports = []
+        for state in ('done', 'failed'):
+            for name in self._trial_files(state):
+                if int(name.split('.')[0]) in exclude:
+                    continue
+                report = _read_json(os.path.join(self.queue_dir, state, name))
+                if run_id is not None and report.get('run_id') != run_id:
+                    continue
+                reports.append(report)
+        return reports
+
+    def status(self):
+        """Number of trials in each state"""
+        return {state: len(self._trial_files(state)) for state in self.STATES}
+
+
+def run_worker(queue_dir, worker_id=None, max_trials=None, wait=False, poll_interval=5):
+    """
+    Claim and run trials from a work queue until it is empty
+
+    Args:
+        queue_dir: Shared queue directory written by GANTuner
+        worker_id: Name reported with the results, defaults to host:pid
+        max_trials: Stop after this many trials
+        wait: Keep polling while other workers still hold trials that may be handed out again
+        poll_interval: Seconds between polls when no trial is pending
+
+    Returns:
+        Number of trials run by this worker
+    """
+    from gan_parameter_tuning import GANTuner
+
+    def load_run():
+        """Configuration and tuner of the current run, workers may start before the coordinator"""
+        config = queue.wait_for_config()
+        queue.lease_timeout = config.get('lease_timeout', default_lease_timeout)
+        queue.max_attempts = config.get('max_attempts', default_max_attempts)
+        # Results are reported through the queue, the coordinator owns the results store
+        tuner = GANTuner(**config['tuner'], store_path=":memory:")
+        tuner.run_id = config['run_id']
+        return config, tuner
+
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    queue = WorkQueue(queue_dir, poll_interval=poll_interval)
+    default_lease_timeout, default_max_attempts = queue.lease_timeout, queue.max_attempts
+    config, tuner = load_run()
+
+    trials_run = 0
+    while max_trials is None or trials_run < max_trials:
+        queue.requeue_expired()
+        lease = queue.claim(worker_id)
+        if lease is None:
+            if wait and queue.status()['claimed'] > 0:
+                time.sleep(poll_interval)
+                continue
+            break
+
+        if lease.spec.get('run_id') != tuner.run_id:
+            # A new search was started in the queue directory since this worker read the configuration
+            config, tuner = load_run()
+        print(f"[{worker_id}] Trial {lease.trial_num}: {lease.spec['params']}")
+        with lease:
+            try:
+                metrics, trial_dir = tuner._evaluate_trial(
+                    lease.trial_num, lease.spec['params'], config['n_samples'], config['epochs'],
+                    config['early_stop_patience']
+                )
+            except MemoryLimitExceeded as e:
+                # Another attempt would exceed the limit again
+                print(f"[{worker_id}] Trial {lease.trial_num} aborted: {e}")
+                queue.complete(lease, e.metrics, None, status='aborted')
+            except Exception:
+                error = traceback.format_exc()
+                print(f"[{worker_id}] Trial {lease.trial_num} failed:\n{error}")
+                queue.fail(lease, error)
+            else:
+                queue.complete(lease, metrics, trial_dir)
+                # Keep a local record so later trials of this worker can warm start from it
+                tuner.store.add_trial(tuner.run_id, lease.trial_num, lease.spec['params'], metrics, trial_dir=trial_dir)
+        trials_run += 1
+    return trials_run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run TabularGAN tuning trials from a shared work queue')
+    parser.add_argument('queue_dir', help='Queue directory given to the search')
+    parser.add_argument('--worker-id', default=None, help='Name reported with the results (default: host:pid)')
+    parser.add_argument('--max-trials', type=int, default=None, help='Stop after this many trials')
+    parser.add_argument('--wait', action='store_true', help='Keep polling until all claimed trials are finished')
+    parser.add_argument('--poll-interval', type=float, default=5, help='Seconds between polls')
+    args = parser.parse_args(argv)
+    trials_run = run_worker(args.queue_dir, args.worker_id, args.max_trials, args.wait, args.poll_interval)
+    print(f"Worker finished after {trials_run} trials")
+
+
+if __name__ == "__main__":
+    main()
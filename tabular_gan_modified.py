@@ -7,84 +7,643 @@ np.bool = bool
 np.int = int
 np.float = float
 
+import copy
+import json
+import os
+import pickle
+import tempfile
+import time
+from collections import deque
 from sklearn.preprocessing import MinMaxScaler, OneHotEncoder
+import tensorflow as tf
 from tensorflow.keras import layers, models, optimizers
+from gan_threads import (configure_threads, requested_threads, cache_key, cached_setting, autotune_threads,
+                         tensorflow_initialized)
+from gan_sampling import GENERATOR_FILE, DECODER_FILE, METADATA_FILE, SampleDecoder, export_tflite
+from gan_schema import load_schema
+
+class EarlyStopping:
+    """Early stopping policy for the GAN training loop.
+
+    The monitored loss is smoothed (exponential moving average or windowed
+    mean) before it is compared with the best value so far, so a single noisy
+    batch neither resets nor triggers the patience counter. With
+    restore_best_weights the generator (and discriminator) weights at the best
+    smoothed value are kept in memory and put back when training ends, so the
+    two models stay a matching pair. Copying the weights to the host is not
+    free, so an improvement is only snapshotted when at least snapshot_every
+    steps have passed since the last snapshot; weights_epoch is the step of
+    the weights that restore puts back.
+
+    The EMA is bias-corrected, so it does not stay anchored to the first raw
+    loss, and best values are only tracked after warmup. The default warmup is
+    the number of steps the smoothing needs to settle (1 / alpha for 'ema',
+    window for 'window', none for 'none'), so early, barely trained weights are
+    never kept as the best.
+
+    Args:
+        patience: Number of steps without improvement before stopping
+        monitor: Loss to monitor, 'g_loss' or 'd_loss'
+        smoothing: 'ema', 'window' or 'none' (raw per-batch values)
+        alpha: EMA weight of the newest value
+        window: Number of steps averaged by the 'window' smoothing
+        min_delta: Minimum decrease of the smoothed loss counted as improvement
+        warmup: Number of initial steps during which the best value is not tracked and stopping
+            is disabled, None for the settling time of the smoothing
+        restore_best_weights: Restore the best generator and discriminator weights on stop
+        snapshot_every: Minimum number of steps between two weight snapshots
+    """
+
+    MONITORS = ('g_loss', 'd_loss')
+    SMOOTHING = ('ema', 'window', 'none')
+
+    def __init__(self, patience=5, monitor='g_loss', smoothing='ema', alpha=0.1, window=50,
+                 min_delta=0.0, warmup=None, restore_best_weights=True, snapshot_every=10):
+        if monitor not in self.MONITORS:
+            raise ValueError(f"Unknown monitored metric '{monitor}', expected one of {self.MONITORS}")
+        if smoothing not in self.SMOOTHING:
+            raise ValueError(f"Unknown smoothing '{smoothing}', expected one of {self.SMOOTHING}")
+        self.patience = patience
+        self.monitor = monitor
+        self.smoothing = smoothing
+        self.alpha = alpha
+        self.window = window
+        self.min_delta = min_delta
+        if warmup is None:
+            warmup = {'ema': int(np.ceil(1 / alpha)), 'window': window, 'none': 0}[smoothing]
+        self.warmup = warmup
+        self.restore_best_weights = restore_best_weights
+        self.snapshot_every = snapshot_every
+        self.reset()
+
+    def reset(self):
+        """Clear the state so the policy can be reused for a new run"""
+        self.best = float('inf')
+        self.best_epoch = None
+        self.best_weights = None
+        self.best_discriminator_weights = None
+        self.weights_epoch = None
+        self.wait = 0
+        self.stopped_epoch = None
+        self._smoothed = None
+        self._ema = 0.0
+        self._ema_steps = 0
+        self._values = deque()
+        self._values_sum = 0.0
+
+    def _smooth(self, value):
+        if self.smoothing == 'ema':
+            # Started at zero and divided by the total weight of the values seen so far
+            self._ema = self.alpha * value + (1 - self.alpha) * self._ema
+            self._ema_steps += 1
+            self._smoothed = self._ema / (1 - (1 - self.alpha) ** self._ema_steps)
+        elif self.smoothing == 'window':
+            self._values.append(value)
+            self._values_sum += value
+            if len(self._values) > self.window:
+                self._values_sum -= self._values.popleft()
+            self._smoothed = self._values_sum / len(self._values)
+        else:
+            self._smoothed = value
+        return self._smoothed
+
+    def update(self, epoch, logs, generator, discriminator=None):
+        """Record the losses of one step, return True when training should stop"""
+        value = self._smooth(float(logs[self.monitor]))
+        if epoch < self.warmup:
+            return False
+
+        if value < self.best - self.min_delta:
+            self.best = value
+            self.best_epoch = epoch
+            self.wait = 0
+            if self.restore_best_weights and (self.weights_epoch is None
+                                              or epoch - self.weights_epoch >= self.snapshot_every):
+                self.best_weights = generator.get_weights()
+                if discriminator is not None:
+                    self.best_discriminator_weights = discriminator.get_weights()
+                self.weights_epoch = epoch
+        else:
+            self.wait += 1
+
+        if self.wait >= self.patience:
+            self.stopped_epoch = epoch
+            return True
+        return False
+
+    def restore(self, generator, discriminator=None):
+        """Load the best generator (and discriminator) weights seen so far, if any were kept"""
+        if self.restore_best_weights and self.best_weights is not None:
+            generator.set_weights(self.best_weights)
+            if discriminator is not None and self.best_discriminator_weights is not None:
+                discriminator.set_weights(self.best_discriminator_weights)
+            return True
+        return False
+
+
+class TrainingHistory:
+    """Per-step losses of a training run in preallocated float32 arrays.
+
+    The three series are rows of one (3, capacity) array that grows by
+    chunk_size steps when full, so recording a step is a single array write
+    instead of three appends of Python floats. history['d_loss'] returns a
+    view of the recorded steps, which keeps the dictionary-style access of
+    the former list history. With stream_path the steps are also appended to
+    a raw float32 file every stream_every steps (and on close), which
+    TrainingHistory.load reads back, e.g. while a long run is still going.
+
+    Args:
+        capacity: Number of steps allocated up front, e.g. the maximum number of steps
+        chunk_size: Number of steps added whenever the arrays are full
+        stream_path: File the steps are appended to, None keeps them in memory only
+        stream_every: Number of steps between two appends to stream_path
+    """
+
+    KEYS = ('d_loss', 'd_accuracy', 'g_loss')
+
+    def __init__(self, capacity=0, chunk_size=65536, stream_path=None, stream_every=10000):
+        self.chunk_size = chunk_size
+        self.stream_path = stream_path
+        self.stream_every = stream_every
+        self._values = np.empty((len(self.KEYS), max(capacity, 1)), dtype=np.float32)
+        self._length = 0
+        self._streamed = 0
+        if stream_path is not None:
+            # Start a new file, steps of an earlier run are not mixed in
+            open(stream_path, 'wb').close()
+
+    @classmethod
+    def load(cls, path):
+        """History read from a file written with stream_path"""
+        values = np.fromfile(path, dtype=np.float32).reshape(-1, len(cls.KEYS)).T
+        history = cls(values.shape[1])
+        history._values[:, :values.shape[1]] = values
+        history._length = values.shape[1]
+        return history
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        return self._values[self.KEYS.index(key), :self._length]
+
+    def keys(self):
+        return self.KEYS
+
+    def items(self):
+        return [(key, self[key]) for key in self.KEYS]
+
+    def append(self, d_loss, d_accuracy, g_loss):
+        """Record the losses of one step"""
+        if self._length == self._values.shape[1]:
+            self._grow(self.chunk_size)
+        self._values[:, self._length] = (d_loss, d_accuracy, g_loss)
+        self._length += 1
+        if self.stream_path is not None and self._length - self._streamed >= self.stream_every:
+            self.flush()
+
+    def extend(self, other):
+        """Append all steps of another history"""
+        n_steps = len(other)
+        free = self._values.shape[1] - self._length
+        if n_steps > free:
+            self._grow(max(n_steps - free, self.chunk_size))
+        self._values[:, self._length:self._length + n_steps] = other._values[:, :n_steps]
+        self._length += n_steps
+        if self.stream_path is not None and self._length - self._streamed >= self.stream_every:
+            self.flush()
+
+    def _grow(self, n_steps):
+        values = np.empty((len(self.KEYS), self._values.shape[1] + n_steps), dtype=np.float32)
+        values[:, :self._length] = self._values[:, :self._length]
+        self._values = values
+
+    def flush(self):
+        """Append the steps recorded since the last flush to stream_path"""
+        if self.stream_path is None or self._streamed == self._length:
+            return
+        with open(self.stream_path, 'ab') as f:
+            # Step-major rows, so the file can be read back with a single reshape
+            np.ascontiguousarray(self._values[:, self._streamed:self._length].T).tofile(f)
+        self._streamed = self._length
+
+    def close(self):
+        """Write the remaining steps to stream_path"""
+        self.flush()
+
+    def to_dataframe(self):
+        """DataFrame with an epoch column (starting at 1) and one column per loss"""
+        return pd.DataFrame({
+            'epoch': np.arange(1, self._length + 1),
+            **{key: self[key] for key in self.KEYS}
+        })
+
+    def save_csv(self, path):
+        """Write the history as CSV with the columns epoch, d_loss, d_accuracy and g_loss"""
+        self.to_dataframe().to_csv(path, index=False)
+
+
+class ClassBatchSampler:
+    """Draws minibatch row indices class by class.
+
+    The rows are sorted by class once, so every class is a contiguous slice
+    of one index array, and a Walker/Vose alias table over the class weights
+    is built once. Drawing a batch then costs O(batch_size): pick the classes
+    (fixed per-class quotas plus alias draws), then a uniform row within
+    each picked class slice.
+
+    'stratified' keeps the class shares of the data in every batch, with
+    floor(batch_size * share) rows per class and the remaining rows drawn by
+    the fractional parts, so the expected count of every class is exact. This
+    removes the batch-to-batch variation of rare classes. 'balanced' draws the
+    classes with weights count ** class_weight_power, uniformly for the default
+    power of 0, so rare classes are seen as often as common ones. The generator
+    then learns the balanced class mix, so generate with class_counts to get a
+    specific one.
+
+    Args:
+        row_classes: Class code of every row
+        mode: 'stratified' or 'balanced'
+        class_weight_power: Exponent of the class counts in the 'balanced' weights,
+            0 for uniform classes, 1 for the shares of the data
+        rows: Row indices the classes belong to, None for 0..len(row_classes)-1
+        rng: numpy Generator, None for a new one
+    """
+
+    MODES = ('stratified', 'balanced')
+
+    def __init__(self, row_classes, mode='stratified', class_weight_power=0.0, rows=None, rng=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown sampler mode '{mode}', expected one of {self.MODES}")
+        row_classes = np.asarray(row_classes)
+        order = np.argsort(row_classes, kind='stable')
+        self.rows = order if rows is None else np.asarray(rows)[order]
+        counts = np.bincount(row_classes)
+        starts = np.cumsum(counts) - counts
+        present = counts > 0
+        self.starts = starts[present]
+        self.counts = counts[present]
+        self.mode = mode
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        if mode == 'stratified':
+            weights = self.counts.astype(np.float64)
+        else:
+            weights = self.counts.astype(np.float64) ** class_weight_power
+        self.probabilities = weights / weights.sum()
+        self._alias_probability, self._alias = self._alias_table(self.probabilities)
+        # Fixed classes and alias table of the remaining rows of stratified batches, by batch size
+        self._quotas = {}
+
+    @staticmethod
+    def _alias_table(probabilities):
+        """Vose's alias method: draw k uniformly, keep it with probability[k], else take alias[k]"""
+        n = len(probabilities)
+        scaled = probabilities * n
+        probability = np.ones(n)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            probability[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        return probability, alias
+
+    def _draw_classes(self, n, alias_probability, alias):
+        k = self.rng.integers(0, len(alias), n)
+        return np.where(self.rng.random(n) < alias_probability[k], k, alias[k])
+
+    def _stratified_quota(self, batch_size):
+        if batch_size not in self._quotas:
+            expected = batch_size * self.probabilities
+            quota = np.floor(expected)
+            fixed = np.repeat(np.arange(len(self.counts)), quota.astype(np.intp))
+            residual = expected - quota
+            table = self._alias_table(residual / residual.sum()) if len(fixed) < batch_size else None
+            self._quotas[batch_size] = (fixed, table)
+        return self._quotas[batch_size]
+
+    def sample(self, batch_size):
+        """Row indices of one batch"""
+        if self.mode == 'stratified':
+            fixed, table = self._stratified_quota(batch_size)
+            if table is None:
+                classes = fixed
+            else:
+                classes = np.concatenate([fixed, self._draw_classes(batch_size - len(fixed), *table)])
+        else:
+            classes = self._draw_classes(batch_size, self._alias_probability, self._alias)
+        offsets = (self.rng.random(batch_size) * self.counts[classes]).astype(np.intp)
+        return self.rows[self.starts[classes] + offsets]
+
 
 class TabularGAN:
-    def __init__(self, data_path, class_column, integer_columns = None, latent_dim=20, learning_rate=0.0001, beta1=0.5):
+    # Candidate batch sizes for benchmark_batch_sizes
+    DEFAULT_BATCH_SIZES = (32, 64, 128, 256, 512, 1024)
+
+    # Batch size used when thread settings are auto-tuned
+    THREAD_BENCHMARK_BATCH_SIZE = 128
+
+    # class_encoding='auto' switches to index encoding above this number of classes
+    INDEX_ENCODING_MIN_CLASSES = 64
+
+    # Largest number of rows generated in one batch when filling class quotas
+    MAX_GENERATION_BATCH = 65536
+
+    # Architectures kept in a model_cache, the least recently used one is dropped first
+    MODEL_CACHE_SIZE = 2
+
+    def __init__(self, data_path, class_column, integer_columns = None, latent_dim=20, learning_rate=0.0001, beta1=0.5,
+                 gen_layers=None, disc_layers=None, intra_op_threads=None, inter_op_threads=None, model_cache=None,
+                 categorical_columns=None, class_encoding='auto', class_embedding_dim=None, preprocess_chunk_size=None,
+                 preprocessed_dir=None):
+        """
+        Args:
+            data_path: Path to the semicolon separated CSV file
+            class_column: Name of the class column
+            integer_columns: Columns restored as integers in generated samples, None takes the integer
+                columns of the data file's schema (see gan_schema.load_schema)
+            latent_dim: Size of the noise vector
+            learning_rate: Adam learning rate
+            beta1: Adam beta1
+            gen_layers: Generator hidden layer sizes, None for the default
+            disc_layers: Discriminator hidden layer sizes, None for the default
+            intra_op_threads: TensorFlow intra-op threads, 'auto' to benchmark and cache the best setting
+                for this machine and architecture, None for TensorFlow's default. GAN_INTRA_OP_THREADS overrides it.
+                'auto' only benchmarks for the first GAN of a process, later ones keep the thread pools that
+                TensorFlow started with.
+            inter_op_threads: TensorFlow inter-op threads, see intra_op_threads. GAN_INTER_OP_THREADS overrides it.
+            model_cache: Dictionary shared between GANs of the same process. Compiled models are stored in it
+                by architecture and later GANs with the same architecture reuse them with reset weights and
+                optimizer state, which skips building, compiling and tracing the models again. It holds the
+                MODEL_CACHE_SIZE most recently used architectures.
+            categorical_columns: Feature columns modelled as categories, with a softmax head per column in the
+                generator. None takes the categorical columns of the schema that are not integer columns.
+            class_encoding: 'onehot' stores the classes one-hot in preprocessed_data. 'index' stores integer class
+                codes, expands them to one-hot per batch only and feeds the class part of the discriminator input
+                through a small embedding projection. 'auto' uses 'index' from INDEX_ENCODING_MIN_CLASSES classes.
+            class_embedding_dim: Size of the class embedding with index encoding, None for min(50, classes / 2)
+            preprocess_chunk_size: Read and preprocess the data in chunks of this many rows in two passes and keep
+                the preprocessed rows in memory-mapped files, for data that does not fit in memory. None loads
+                the whole file at once.
+            preprocessed_dir: Directory for the memory-mapped files, defaults to the directory of the data file
+        """
+        if class_encoding not in ('auto', 'onehot', 'index'):
+            raise ValueError(f"Unknown class encoding '{class_encoding}', expected 'auto', 'onehot' or 'index'")
         self.data_path = data_path
         self.class_column = class_column
         self.latent_dim = latent_dim
         self.learning_rate = learning_rate
         self.beta1 = beta1
+        self.gen_layers = gen_layers
+        self.disc_layers = disc_layers
+        self.model_cache = model_cache
+        self.categorical_columns = categorical_columns
+        self.class_encoding = class_encoding
+        self.class_embedding_dim = class_embedding_dim
+        self.preprocess_chunk_size = preprocess_chunk_size
+        self.preprocessed_dir = preprocessed_dir
         self.scaler = MinMaxScaler(feature_range=(-1, 1))
         self.encoder = OneHotEncoder(sparse=False, handle_unknown='ignore')
-        
-        # Integer columns can be specified or defaulted
-        
-        if integer_columns is not None:
-            self.integer_columns = integer_columns
-        else:
-            # Default integer columns (fallback)
-            self.integer_columns = [
-                'age',
-                'education_num',
-                'capital_gain',
-                'capital_loss',
-                'hours_per_week'
-        ]
+        self.integer_columns = integer_columns
         self._load_and_preprocess_data()
+        # Class batch samplers over all rows by (mode, class_weight_power), the class grouping is done once
+        self._batch_samplers = {}
+        # Thread pools must be set before TensorFlow runs its first operation
+        self._configure_threads(intra_op_threads, inter_op_threads)
         self._build_gan()
+    
+    def _configure_threads(self, intra_op_threads, inter_op_threads):
+        # The environment overrides are applied first, so GAN_INTRA_OP_THREADS=auto benchmarks as well
+        intra_op_threads, inter_op_threads = requested_threads(intra_op_threads, inter_op_threads)
+        if 'auto' in (intra_op_threads, inter_op_threads):
+            if tensorflow_initialized():
+                # The thread pools are fixed, e.g. by an earlier GAN of this process, so a benchmark
+                # could not change them: keep the current setting
+                intra_op_threads = None if intra_op_threads == 'auto' else intra_op_threads
+                inter_op_threads = None if inter_op_threads == 'auto' else inter_op_threads
+            else:
+                intra_op_threads, inter_op_threads = self.autotune_threads()
+        self.intra_op_threads, self.inter_op_threads = configure_threads(intra_op_threads, inter_op_threads,
+                                                                         use_environment=False)
+    
+    def autotune_threads(self, candidates=None, steps=20, refresh=False):
+        """
+        Find the fastest (intra_op_threads, inter_op_threads) for this machine and architecture
+        
+        The result is cached per host and architecture, later calls return the cached setting
+        unless refresh is set. The settings take effect in processes that start afterwards,
+        or in this one if TensorFlow has not run yet.
+        """
+        key = cache_key(self.latent_dim, self.gen_layers, self.disc_layers, self.input_dim)
+        setting = None if refresh else cached_setting(key)
+        if setting is None:
+            spec = {
+                'data_path': self.data_path,
+                'class_column': self.class_column,
+                'integer_columns': self.integer_columns,
+                'latent_dim': self.latent_dim,
+                'gen_layers': self.gen_layers,
+                'disc_layers': self.disc_layers,
+                'preprocess_chunk_size': self.preprocess_chunk_size,
+                'preprocessed_dir': self.preprocessed_dir,
+                'batch_size': self.THREAD_BENCHMARK_BATCH_SIZE
+            }
+            setting = autotune_threads(spec, key, candidates=candidates, steps=steps)
+        return setting
         
     def _load_and_preprocess_data(self):
-        #Load data
-        data = pd.read_csv(self.data_path, sep=';')
-        
-        # Keep the original types of columns for later usage
-        self.column_types = {}
-        for col in data.columns:
-            if col in self.integer_columns or col == self.class_column:
-                try:
-                    data[col] = data[col].astype(int)
-                    self.column_types[col] = 'int'
-                except:
-                    self.column_types[col] = 'object'
-        
-        numeric_columns = data.columns.drop(self.class_column)
-        data[numeric_columns] = data[numeric_columns].apply(pd.to_numeric, errors='coerce')
-        
-        # Separate features and labels
+        # Column types come from a schema inferred on the first rows and saved next to the data
+        self.schema = load_schema(self.data_path)
+        self.column_types = self.schema.types
+        if self.integer_columns is None:
+            self.integer_columns = self.schema.integer_columns
+        
+        feature_columns = pd.Index([col for col in self.schema.columns if col != self.class_column])
+        if self.categorical_columns is None:
+            self.categorical_columns = [
+                col for col in self.schema.categorical_columns if col not in self.integer_columns
+            ]
+        self.categorical_columns = [col for col in feature_columns if col in self.categorical_columns]
+        self.feature_columns = feature_columns.tolist()
+        self.numerical_columns = feature_columns.drop(self.categorical_columns).tolist()
+        
+        if self.preprocess_chunk_size:
+            class_labels = self._preprocess_chunked()
+        else:
+            class_labels = self._preprocess_in_memory()
+        self.num_numerical = len(self.numerical_columns)
+        self.input_dim = self.num_numerical + self.categorical_dim + self.num_classes
+        self.decoder = SampleDecoder(
+            self.numerical_columns,
+            self.column_ranges,
+            self.scaler,
+            class_labels,
+            self.class_column,
+            integer_class=self.class_column in self.integer_columns,
+            categories=self.categories,
+            feature_columns=self.feature_columns
+        )
+    
+    def _read_data(self, chunksize=None):
+        """Read the data file, categorical columns as text without trying to parse numbers"""
+        return pd.read_csv(self.data_path, sep=';', dtype=self.schema.read_dtypes(), chunksize=chunksize)
+    
+    def _split_features(self, data):
+        """Features and class labels of a block of rows, without rows with missing or non-numeric features"""
+        data[self.numerical_columns] = data[self.numerical_columns].apply(pd.to_numeric, errors='coerce')
         X = data.drop(self.class_column, axis=1)
         y = data[self.class_column].astype(str)
-
-        # Delete rows with NaN values
         mask = X.isna().any(axis=1)
-        X = X[~mask]
-        y = y[~mask]
+        return X[~mask], y[~mask]
+    
+    def _set_categories(self, categories):
+        """Category labels per categorical column and the offsets of their one-hot blocks"""
+        self.categories = categories
+        widths = [len(labels) for labels in categories.values()]
+        self.category_offsets = np.concatenate([[0], np.cumsum(widths)[:-1]]).astype(np.intp)
+        self.categorical_dim = int(sum(widths))
+        return np.min_scalar_type(max(widths or [1]))
+    
+    def _set_class_encoding(self, num_classes):
+        self.num_classes = num_classes
+        if self.class_encoding == 'auto':
+            self.class_encoding = 'index' if num_classes >= self.INDEX_ENCODING_MIN_CLASSES else 'onehot'
+        if self.class_encoding == 'index' and self.class_embedding_dim is None:
+            self.class_embedding_dim = min(50, max((num_classes + 1) // 2, 1))
+    
+    def _preprocess_in_memory(self):
+        """Preprocess the whole data file at once, return the class labels in encoding order"""
+        X, y = self._split_features(self._read_data())
         
         # Keep the ranges of values of integer columns
         self.column_ranges = {}
         for col in self.integer_columns:
-            if col in X.columns:
+            if col in self.numerical_columns:
                 self.column_ranges[col] = {
                     'min': int(X[col].min()),
                     'max': int(X[col].max())
                 }
         
         # Numeric columns scaling
-        self.numerical_columns = X.columns.tolist()
-        X_scaled = self.scaler.fit_transform(X)
+        X_scaled = self.scaler.fit_transform(X[self.numerical_columns])
+        
+        # Categorical columns are stored as integer codes and expanded to one-hot per batch
+        categories = {}
+        codes = []
+        for col in self.categorical_columns:
+            categorical = pd.Categorical(X[col].astype(str))
+            categories[col] = np.asarray(categorical.categories, dtype=object)
+            codes.append(categorical.codes)
+        code_dtype = self._set_categories(categories)
+        self.categorical_codes = np.empty((len(X), len(codes)), dtype=code_dtype)
+        for i, column_codes in enumerate(codes):
+            self.categorical_codes[:, i] = column_codes
         
         # Class labels encoding
-        y_2d = y.values.reshape(-1, 1)
         self.classes_ = y.unique()
-        y_encoded = self.encoder.fit_transform(y_2d).astype(np.float32)
+        self._set_class_encoding(len(self.classes_))
         
-        # Connect the scaled features and encoded labels
-        self.preprocessed_data = np.hstack((X_scaled, y_encoded)).astype(np.float32)
-        self.num_numerical = X_scaled.shape[1]
-        self.num_classes = y_encoded.shape[1]
-        self.input_dim = self.preprocessed_data.shape[1]
+        if self.class_encoding == 'index':
+            # Integer class codes, expanded to one-hot per batch
+            class_labels, class_codes = np.unique(y.to_numpy(dtype=str), return_inverse=True)
+            self.class_codes = class_codes.astype(np.min_scalar_type(len(class_labels)))
+            self.preprocessed_data = X_scaled.astype(np.float32)
+        else:
+            y_2d = y.values.reshape(-1, 1)
+            y_encoded = self.encoder.fit_transform(y_2d).astype(np.float32)
+            class_labels = self.encoder.categories_[0]
+            self.class_codes = None
+            
+            # Connect the scaled features and encoded labels
+            self.preprocessed_data = np.hstack((X_scaled, y_encoded)).astype(np.float32)
+        return class_labels
+    
+    def _preprocess_chunked(self):
+        """
+        Preprocess the data file in two passes over chunks of preprocess_chunk_size rows
+        
+        The first pass fits the scaler with partial_fit and collects the integer ranges, the
+        category and class vocabularies and the number of complete rows. The second pass writes
+        the scaled float32 rows and the codes into memory-mapped files, so the peak memory is
+        set by the chunk size and not by the size of the data. The result is the same as that
+        of the in-memory preprocessing.
+        """
+        integer_columns = [col for col in self.integer_columns if col in self.numerical_columns]
+        lows = pd.Series(np.inf, index=integer_columns)
+        highs = pd.Series(-np.inf, index=integer_columns)
+        vocabularies = {col: set() for col in self.categorical_columns}
+        # Dictionary keys keep the order of first appearance, like y.unique() in memory
+        seen_classes = {}
+        n_rows = 0
+        for chunk in self._read_data(self.preprocess_chunk_size):
+            X, y = self._split_features(chunk)
+            if not len(X):
+                continue
+            n_rows += len(X)
+            self.scaler.partial_fit(X[self.numerical_columns])
+            lows = np.minimum(lows, X[integer_columns].min())
+            highs = np.maximum(highs, X[integer_columns].max())
+            for col, vocabulary in vocabularies.items():
+                vocabulary.update(X[col].astype(str).unique())
+            seen_classes.update(dict.fromkeys(y.unique()))
+        if n_rows == 0:
+            raise ValueError(f"{self.data_path} has no rows without missing values")
+        
+        self.column_ranges = {col: {'min': int(lows[col]), 'max': int(highs[col])} for col in integer_columns}
+        # Sorted like pd.Categorical, np.unique and OneHotEncoder sort them in memory
+        categories = {col: np.asarray(sorted(vocabulary), dtype=object) for col, vocabulary in vocabularies.items()}
+        code_dtype = self._set_categories(categories)
+        self.classes_ = np.asarray(list(seen_classes), dtype=object)
+        self._set_class_encoding(len(self.classes_))
+        class_labels = np.asarray(sorted(seen_classes), dtype=str)
+        
+        index_encoding = self.class_encoding == 'index'
+        num_numerical = len(self.numerical_columns)
+        width = num_numerical + (0 if index_encoding else self.num_classes)
+        self.preprocessed_data = self._memmap((n_rows, width), np.float32)
+        self.categorical_codes = self._memmap((n_rows, len(categories)), code_dtype)
+        self.class_codes = self._memmap((n_rows,), np.min_scalar_type(self.num_classes)) if index_encoding else None
+        if not index_encoding:
+            self.encoder.fit(class_labels.reshape(-1, 1))
+        
+        start = 0
+        for chunk in self._read_data(self.preprocess_chunk_size):
+            X, y = self._split_features(chunk)
+            if not len(X):
+                continue
+            end = start + len(X)
+            self.preprocessed_data[start:end, :num_numerical] = self.scaler.transform(X[self.numerical_columns])
+            for i, (col, labels) in enumerate(categories.items()):
+                self.categorical_codes[start:end, i] = pd.Categorical(X[col].astype(str), categories=labels).codes
+            class_codes = np.searchsorted(class_labels, y.to_numpy(dtype=str))
+            if index_encoding:
+                self.class_codes[start:end] = class_codes
+            else:
+                block = self.preprocessed_data[start:end, num_numerical:]
+                block[:] = 0
+                block[np.arange(len(block)), class_codes] = 1
+            start = end
+        print(f"Preprocessed {n_rows} rows in chunks of {self.preprocess_chunk_size}")
+        return class_labels
+    
+    def _memmap(self, shape, dtype):
+        """Zero-filled array backed by a temporary file in preprocessed_dir, which is removed with the array"""
+        if not np.prod(shape):
+            return np.zeros(shape, dtype=dtype)
+        directory = self.preprocessed_dir or os.path.dirname(os.path.abspath(self.data_path))
+        fd, path = tempfile.mkstemp(prefix=os.path.basename(self.data_path) + '.', suffix='.preprocessed', dir=directory)
+        os.close(fd)
+        array = np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+        try:
+            # The mapping stays valid, the disk space is freed once the array is gone (not possible on Windows)
+            os.remove(path)
+        except OSError:
+            pass
+        return array
         
     def _build_generator(self, hidden_layers=None):
         if hidden_layers is None:
@@ -99,9 +658,12 @@ class TabularGAN:
             x = layers.BatchNormalization()(x)
         
         numerical_output = layers.Dense(self.num_numerical, activation='tanh')(x)
+        categorical_outputs = [
+            layers.Dense(len(labels), activation='softmax')(x) for labels in self.categories.values()
+        ]
         class_output = layers.Dense(self.num_classes, activation='softmax')(x)
         
-        return models.Model(inputs, layers.concatenate([numerical_output, class_output]))
+        return models.Model(inputs, layers.concatenate([numerical_output, *categorical_outputs, class_output]))
     
     def _build_discriminator(self, hidden_layers=None):
         if hidden_layers is None:
@@ -110,6 +672,14 @@ class TabularGAN:
         inputs = layers.Input(shape=(self.input_dim,))
         x = inputs
         
+        if self.class_encoding == 'index':
+            # Project the class part onto a small embedding, for one-hot rows this is an embedding lookup
+            class_start = self.input_dim - self.num_classes
+            features = layers.Lambda(lambda t: t[:, :class_start])(inputs)
+            class_part = layers.Lambda(lambda t: t[:, class_start:])(inputs)
+            class_embedding = layers.Dense(self.class_embedding_dim, use_bias=False)(class_part)
+            x = layers.concatenate([features, class_embedding])
+        
         for units in hidden_layers:
             x = layers.Dense(units)(x)
             x = layers.LeakyReLU(alpha=0.2)(x)
@@ -121,23 +691,88 @@ class TabularGAN:
         return models.Model(inputs, outputs)
     
     def _build_gan(self):
-        # Building and compiling discriminator
-        self.discriminator = self._build_discriminator()
-        self.discriminator.compile(
+        key = self._model_key()
+        if self.model_cache is not None and key in self.model_cache:
+            # Re-insert to mark the architecture as most recently used
+            self.model_cache[key] = self.model_cache.pop(key)
+            self.generator, self.discriminator, self.gan = self.model_cache[key]
+            self.reset_models()
+            return
+        self.generator, self.discriminator, self.gan = self._compile_models(self.gen_layers, self.disc_layers)
+        if self.model_cache is not None:
+            self.model_cache[key] = (self.generator, self.discriminator, self.gan)
+            while len(self.model_cache) > self.MODEL_CACHE_SIZE:
+                del self.model_cache[next(iter(self.model_cache))]
+    
+    def _model_key(self):
+        """Everything that determines the shapes of the models"""
+        gen_layers = tuple(self.gen_layers) if self.gen_layers is not None else None
+        disc_layers = tuple(self.disc_layers) if self.disc_layers is not None else None
+        # The widths of the sections, not only input_dim: the index encoding slices the input by them
+        category_widths = tuple(len(labels) for labels in self.categories.values())
+        return (self.latent_dim, gen_layers, disc_layers, self.num_numerical, category_widths, self.num_classes,
+                self.class_encoding, self.class_embedding_dim)
+    
+    def reset_models(self):
+        """
+        Re-initialize the weights and optimizer state of the current models
+        
+        Every weight is drawn again from its layer's initializer with a new seed from np.random
+        (a Keras initializer without a seed repeats the same values), the optimizer slots and step
+        counters are zeroed and learning_rate is applied. The compiled models and their traced
+        training functions are kept, unless beta1 differs from the one they were compiled with:
+        beta1 is a constant in the traced training step, so the models are compiled again with
+        new optimizers then.
+        """
+        for model in (self.generator, self.discriminator):
+            for layer in model.layers:
+                for name in ('kernel', 'bias', 'gamma', 'beta', 'moving_mean', 'moving_variance'):
+                    variable = getattr(layer, name, None)
+                    initializer = getattr(layer, f"{name}_initializer", None)
+                    if variable is not None and initializer is not None:
+                        config = initializer.get_config()
+                        if 'seed' in config:
+                            config['seed'] = int(np.random.randint(0, 2**31 - 1))
+                            initializer = type(initializer).from_config(config)
+                        variable.assign(initializer(variable.shape, variable.dtype))
+        
+        compiled_optimizers = (self.discriminator.optimizer, self.gan.optimizer)
+        if any(float(np.asarray(optimizer.beta_1)) != self.beta1 for optimizer in compiled_optimizers):
+            self._compile(self.discriminator, self.gan)
+            return
+        for optimizer in compiled_optimizers:
+            # A method in the Keras 2 optimizers, a property in later versions
+            variables = optimizer.variables() if callable(optimizer.variables) else optimizer.variables
+            for variable in variables:
+                variable.assign(tf.zeros_like(variable))
+            optimizer.learning_rate = self.learning_rate
+        
+    def _compile_models(self, gen_layers=None, disc_layers=None):
+        """Build and compile the generator, the discriminator and the combined GAN model"""
+        discriminator = self._build_discriminator(hidden_layers=disc_layers)
+        generator = self._build_generator(hidden_layers=gen_layers)
+        
+        # Building GAN
+        gan_input = layers.Input(shape=(self.latent_dim,))
+        gan_output = discriminator(generator(gan_input))
+        gan = models.Model(gan_input, gan_output)
+        
+        self._compile(discriminator, gan)
+        return generator, discriminator, gan
+    
+    def _compile(self, discriminator, gan):
+        """Compile the discriminator and the GAN with new Adam optimizers"""
+        # Compiling discriminator
+        discriminator.trainable = True
+        discriminator.compile(
             loss='binary_crossentropy',
             optimizer=optimizers.Adam(self.learning_rate, self.beta1),
             metrics=['accuracy']
         )
         
-        # Building generator
-        self.generator = self._build_generator()
-        
-        # Building and compiling GAN
-        self.discriminator.trainable = False
-        gan_input = layers.Input(shape=(self.latent_dim,))
-        gan_output = self.discriminator(self.generator(gan_input))
-        self.gan = models.Model(gan_input, gan_output)
-        self.gan.compile(
+        # Compiling GAN, the discriminator is frozen inside it
+        discriminator.trainable = False
+        gan.compile(
             loss='binary_crossentropy',
             optimizer=optimizers.Adam(self.learning_rate, self.beta1)
         )
@@ -148,60 +783,229 @@ class TabularGAN:
             self.learning_rate = learning_rate
         if beta1 is not None:
             self.beta1 = beta1
-            
-        # Building and compiling discriminator
-        self.discriminator = self._build_discriminator(hidden_layers=disc_layers)
-        self.discriminator.compile(
-            loss='binary_crossentropy',
-            optimizer=optimizers.Adam(self.learning_rate, self.beta1),
-            metrics=['accuracy']
-        )
+        self.gen_layers = gen_layers
+        self.disc_layers = disc_layers
+        self.generator, self.discriminator, self.gan = self._compile_models(gen_layers, disc_layers)
+    
+    def set_optimizer_params(self, learning_rate=None, beta1=None):
+        """Switch to new optimizer settings, the weights are kept and the optimizer state starts over"""
+        if learning_rate is not None:
+            self.learning_rate = learning_rate
+        if beta1 is not None:
+            self.beta1 = beta1
+        self._compile(self.discriminator, self.gan)
+    
+    def fresh_copy(self, learning_rate=None, beta1=None):
+        """Copy of this GAN that shares the preprocessed data but has newly built models"""
+        clone = copy.copy(self)
+        if learning_rate is not None:
+            clone.learning_rate = learning_rate
+        if beta1 is not None:
+            clone.beta1 = beta1
+        clone.generator, clone.discriminator, clone.gan = clone._compile_models(clone.gen_layers, clone.disc_layers)
+        return clone
         
-        # Generator building
-        self.generator = self._build_generator(hidden_layers=gen_layers)
+    def stratified_row_indices(self, fraction, random_state=0):
+        """
+        Sorted indices of a subsample of the preprocessed rows with the class distribution of the full data
         
-        # Building and compiling GAN
-        self.discriminator.trainable = False
-        gan_input = layers.Input(shape=(self.latent_dim,))
-        gan_output = self.discriminator(self.generator(gan_input))
-        self.gan = models.Model(gan_input, gan_output)
-        self.gan.compile(
-            loss='binary_crossentropy',
-            optimizer=optimizers.Adam(self.learning_rate, self.beta1)
-        )
+        Every class keeps the given fraction of its rows, at least one. With the same random_state
+        the subsample of a smaller fraction is contained in the subsample of a larger one.
+        """
+        if not 0 < fraction <= 1:
+            raise ValueError(f"Fraction must be in (0, 1], got {fraction}")
+        labels = self._row_classes()
+        rng = np.random.default_rng(random_state)
+        # Group the rows by class with one sort, also with thousands of classes
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(self.num_classes + 1))
+        selected = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            rows = order[start:end]
+            if len(rows) == 0:
+                continue
+            n_rows = max(int(round(len(rows) * fraction)), 1)
+            selected.append(rng.permutation(rows)[:n_rows])
+        return np.sort(np.concatenate(selected))
         
-    def train(self, epochs, batch_size, patience=5, verbose=1, callbacks=None):
-        history = {
-            'd_loss': [],
-            'd_accuracy': [],
-            'g_loss': []
-        }
+    def _row_classes(self):
+        """Class code of every preprocessed row"""
+        if self.class_encoding == 'index':
+            return self.class_codes
+        return self.preprocessed_data[:, self.num_numerical:].argmax(axis=1)
         
-        best_loss = float('inf')
-        patience_counter = 0
-        valid = np.ones((batch_size, 1))
-        fake = np.zeros((batch_size, 1))
-    
-        for epoch in range(epochs):
-            # Discriminator training
+    def batch_sampler(self, mode='stratified', class_weight_power=0.0, row_indices=None):
+        """
+        ClassBatchSampler over the preprocessed rows, or only over row_indices
+
+        Samplers over all rows are kept and shared with fresh_copy clones, so the rows are
+        grouped by class once and not for every training run.
+        """
+        if row_indices is not None:
+            return ClassBatchSampler(self._row_classes()[row_indices], mode, class_weight_power, rows=row_indices)
+        key = (mode, class_weight_power)
+        if key not in self._batch_samplers:
+            self._batch_samplers[key] = ClassBatchSampler(self._row_classes(), mode, class_weight_power)
+        return self._batch_samplers[key]
+        
+    def _real_batch(self, idx):
+        """Training rows in generator output layout, categorical and class codes are expanded to one-hot here"""
+        batch = self.preprocessed_data[idx]
+        if not self.categorical_columns and self.class_encoding == 'onehot':
+            return batch
+        rows = np.arange(len(idx))
+        parts = [batch[:, :self.num_numerical]]
+        if self.categorical_columns:
+            onehot = np.zeros((len(idx), self.categorical_dim), dtype=np.float32)
+            positions = self.categorical_codes[idx].astype(np.intp) + self.category_offsets
+            onehot[rows[:, None], positions] = 1.0
+            parts.append(onehot)
+        if self.class_encoding == 'index':
+            classes = np.zeros((len(idx), self.num_classes), dtype=np.float32)
+            classes[rows, self.class_codes[idx]] = 1.0
+            parts.append(classes)
+        else:
+            parts.append(batch[:, self.num_numerical:])
+        return np.hstack(parts)
+        
+    def _train_step(self, batch_size, valid, fake, row_indices=None, sampler=None):
+        """One discriminator and one generator update, returns the discriminator [loss, accuracy] and generator loss"""
+        # Discriminator training
+        if sampler is not None:
+            idx = sampler.sample(batch_size)
+        elif row_indices is None:
             idx = np.random.randint(0, self.preprocessed_data.shape[0], batch_size)
-            real_data = self.preprocessed_data[idx]
+        else:
+            idx = row_indices[np.random.randint(0, len(row_indices), batch_size)]
+        real_data = self._real_batch(idx)
+    
+        noise = np.random.normal(0, 1, (batch_size, self.latent_dim))
+        fake_data = self.generator.predict(noise, verbose=0)
+    
+        d_loss_real = self.discriminator.train_on_batch(real_data, valid)
+        d_loss_fake = self.discriminator.train_on_batch(fake_data, fake)
+        d_loss = 0.5 * np.add(d_loss_real, d_loss_fake)
+    
+        # Generator training
+        noise = np.random.normal(0, 1, (batch_size, self.latent_dim))
+        g_loss = self.gan.train_on_batch(noise, valid)
+        return d_loss, g_loss
+    
+    def benchmark_batch_sizes(self, batch_sizes=None, steps=20, warmup_steps=3):
+        """
+        Measure the training step throughput of the current architecture for several batch sizes
         
-            noise = np.random.normal(0, 1, (batch_size, self.latent_dim))
-            fake_data = self.generator.predict(noise, verbose=0)
+        The benchmark trains freshly built copies of the models, the weights and optimizer
+        state of this GAN are not touched.
         
-            d_loss_real = self.discriminator.train_on_batch(real_data, valid)
-            d_loss_fake = self.discriminator.train_on_batch(fake_data, fake)
-            d_loss = 0.5 * np.add(d_loss_real, d_loss_fake)
+        Args:
+            batch_sizes: Candidate batch sizes, defaults to DEFAULT_BATCH_SIZES
+            steps: Number of timed training steps per batch size
+            warmup_steps: Untimed steps run first so graph tracing is not measured
+            
+        Returns:
+            List of dictionaries with batch_size, step_latency (seconds) and samples_per_second
+        """
+        if batch_sizes is None:
+            batch_sizes = self.DEFAULT_BATCH_SIZES
+        bench = self.fresh_copy()
         
-            # Generator training
+        results = []
+        for batch_size in batch_sizes:
+            batch_size = int(batch_size)
+            valid = np.ones((batch_size, 1))
+            fake = np.zeros((batch_size, 1))
+            for _ in range(warmup_steps):
+                bench._train_step(batch_size, valid, fake)
+            start = time.perf_counter()
+            for _ in range(steps):
+                bench._train_step(batch_size, valid, fake)
+            elapsed = time.perf_counter() - start
+            results.append({
+                'batch_size': batch_size,
+                'step_latency': elapsed / steps,
+                'samples_per_second': batch_size * steps / elapsed
+            })
+        return results
+    
+    def recommend_batch_size(self, batch_sizes=None, min_relative_throughput=0.9, steps=20):
+        """Smallest batch size whose throughput is at least min_relative_throughput of the fastest one"""
+        results = self.benchmark_batch_sizes(batch_sizes, steps=steps)
+        best_throughput = max(result['samples_per_second'] for result in results)
+        fast_enough = [result['batch_size'] for result in results
+                       if result['samples_per_second'] >= min_relative_throughput * best_throughput]
+        return min(fast_enough)
+        
+    def evaluate_losses(self, batch_size, n_batches=4, row_indices=None):
+        """
+        Losses of the current models on fresh batches, without training them
+
+        Unlike the last entries of a training history this describes the models as they are,
+        e.g. after early stopping restored the best weights.
+
+        Returns:
+            Dictionary with the mean d_loss, d_accuracy and g_loss over n_batches batches
+        """
+        valid = np.ones((batch_size, 1))
+        fake = np.zeros((batch_size, 1))
+        losses = []
+        for _ in range(n_batches):
+            if row_indices is None:
+                idx = np.random.randint(0, self.preprocessed_data.shape[0], batch_size)
+            else:
+                idx = row_indices[np.random.randint(0, len(row_indices), batch_size)]
             noise = np.random.normal(0, 1, (batch_size, self.latent_dim))
-            g_loss = self.gan.train_on_batch(noise, valid)
+            fake_data = self.generator.predict(noise, verbose=0)
+            d_real = self.discriminator.test_on_batch(self._real_batch(idx), valid)
+            d_fake = self.discriminator.test_on_batch(fake_data, fake)
+            d_loss = 0.5 * np.add(d_real, d_fake)
+            g_loss = self.gan.test_on_batch(np.random.normal(0, 1, (batch_size, self.latent_dim)), valid)
+            losses.append((d_loss[0], d_loss[1], np.ravel(g_loss)[0]))
+        d_loss, d_accuracy, g_loss = np.mean(losses, axis=0)
+        return {'d_loss': float(d_loss), 'd_accuracy': float(d_accuracy), 'g_loss': float(g_loss)}
+
+    def train(self, epochs, batch_size, patience=5, verbose=1, callbacks=None, early_stopping=None, row_indices=None,
+              history_path=None, history_stream_every=10000, batch_sampler='uniform', class_weight_power=0.0):
+        """
+        Train the GAN
+
+        Args:
+            epochs: Maximum number of training steps
+            batch_size: Number of real and generated rows per step
+            patience: Patience of the default early stopping policy, None disables early stopping
+            verbose: Print progress every 100 steps
+            callbacks: Functions called as callback(epoch, history) after every step
+            early_stopping: EarlyStopping instance overriding the default policy
+            row_indices: Train only on these rows of the preprocessed data, e.g. from stratified_row_indices
+            history_path: Also append the history to this file every history_stream_every steps
+                (read it with TrainingHistory.load)
+            history_stream_every: Number of steps between two appends to history_path
+            batch_sampler: 'uniform' draws the real rows of a batch uniformly, 'stratified' keeps the class
+                shares of the data in every batch and 'balanced' draws the classes with weights
+                count ** class_weight_power (see ClassBatchSampler)
+            class_weight_power: Exponent of the class counts for 'balanced', 0 draws all classes equally often
+
+        Returns:
+            TrainingHistory of the run
+        """
+        if batch_sampler == 'uniform':
+            sampler = None
+        else:
+            sampler = self.batch_sampler(batch_sampler, class_weight_power, row_indices)
+        history = TrainingHistory(epochs, stream_path=history_path, stream_every=history_stream_every)
+
+        if early_stopping is None and patience is not None:
+            early_stopping = EarlyStopping(patience=patience)
+        if early_stopping is not None:
+            early_stopping.reset()
+        valid = np.ones((batch_size, 1))
+        fake = np.zeros((batch_size, 1))
+    
+        for epoch in range(epochs):
+            d_loss, g_loss = self._train_step(batch_size, valid, fake, row_indices, sampler)
             
             # History update
-            history['d_loss'].append(float(d_loss[0]))
-            history['d_accuracy'].append(float(d_loss[1]))
-            history['g_loss'].append(float(g_loss))
+            history.append(d_loss[0], d_loss[1], g_loss)
         
             if verbose and (epoch + 1) % 100 == 0:
                 print(f"Epoch {epoch+1} [D loss: {d_loss[0]:.4f} | D accuracy: {100*d_loss[1]:.2f}%] [G loss: {g_loss:.4f}]")
@@ -211,69 +1015,137 @@ class TabularGAN:
                 for callback in callbacks:
                     callback(epoch, history)
         
-            if g_loss > best_loss:
-                patience_counter += 1
-            else:
-                best_loss = g_loss
-                patience_counter = 0
-            
-            if patience_counter >= patience:
-                if verbose:
-                    print(f"Early stopping at epoch {epoch+1}")
-                break
-                
+            if early_stopping is not None:
+                logs = {'d_loss': d_loss[0], 'g_loss': g_loss}
+                if early_stopping.update(epoch, logs, self.generator, self.discriminator):
+                    if verbose:
+                        print(f"Early stopping at epoch {epoch+1}")
+                    break
+        
+        # Go back to the weights with the best smoothed loss
+        if early_stopping is not None and early_stopping.restore(self.generator, self.discriminator):
+            if verbose:
+                print(f"Restored generator and discriminator weights from epoch {early_stopping.weights_epoch+1}")
+
+        history.close()
         return history
 
-    def generate_samples(self, num_samples, target_class=None):
-        generated_samples = pd.DataFrame()
+    def generate_samples(self, num_samples=None, target_class=None, class_counts=None, max_iterations=20,
+                         min_acceptance_rate=1e-3):
+        """
+        Generate synthetic samples
         
-        while len(generated_samples) < num_samples:
-            batch_size = num_samples * 2
-            noise = np.random.normal(0, 1, (batch_size, self.latent_dim))
-            generated_data = self.generator.predict(noise)
-            
-            # Split the generated data into numerical and categorical parts
-            generated_numerical = generated_data[:, :self.num_numerical]
-            generated_class = generated_data[:, self.num_numerical:]
-            
-            # Reversing the scaling of numerical features
-            generated_numerical = self.scaler.inverse_transform(generated_numerical)
-            
-            # Class labels transformation
-            class_labels = self.encoder.inverse_transform(generated_class)
-            
-            # Creating dataframe with generated samples
-            samples_df = pd.DataFrame(generated_numerical, columns=self.numerical_columns)
-            samples_df[self.class_column] = class_labels.ravel()
-
+        Args:
+            num_samples: Number of samples
+            target_class: Generate only samples of this class
+            class_counts: Dictionary mapping class labels to exact numbers of samples, replaces
+                num_samples and target_class. All quotas are filled from the same generated batches.
+            max_iterations: Maximum number of generated batches when filling class quotas
+            min_acceptance_rate: Give up once a class that still needs rows has been generated at a lower
+                rate over enough rows to measure it, must be in (0, 1]
+        """
+        if class_counts is None:
+            if num_samples is None:
+                raise ValueError("Either num_samples or class_counts must be given")
             if target_class is not None:
-                samples_df = samples_df[samples_df[self.class_column].astype(str) == str(target_class)]
-            
+                class_counts = {target_class: num_samples}
+            else:
+                noise = np.random.normal(0, 1, (num_samples, self.latent_dim))
+                return self.decoder.decode(self.generator.predict(noise))
+        elif target_class is not None:
+            raise ValueError("Use either target_class or class_counts")
+        elif num_samples is not None and num_samples != sum(class_counts.values()):
+            raise ValueError(f"num_samples ({num_samples}) does not match the sum of class_counts")
+        
+        return self.decoder.decode(self._fill_class_quotas(class_counts, max_iterations, min_acceptance_rate))
+    
+    def export_generator(self, model_dir, tflite_quantization=None):
+        """
+        Save everything needed for sampling: the generator, the sample decoder and the latent size
+        
+        Load the export with gan_sampling.SavedGenerator or generate from it in parallel with
+        gan_sampling.generate_sharded. The training data is not part of the export.
+        
+        Args:
+            model_dir: Directory for the export
+            tflite_quantization: Also write generator.tflite with this quantization ('float32', 'dynamic'
+                or 'int8', see gan_sampling.convert_to_tflite) for SavedGenerator(..., backend='tflite')
+        """
+        os.makedirs(model_dir, exist_ok=True)
+        self.generator.save(os.path.join(model_dir, GENERATOR_FILE))
+        with open(os.path.join(model_dir, DECODER_FILE), 'wb') as f:
+            pickle.dump(self.decoder, f)
+        with open(os.path.join(model_dir, METADATA_FILE), 'w') as f:
+            json.dump({
+                'latent_dim': self.latent_dim,
+                'class_column': self.class_column,
+                'columns': self.decoder.columns + [self.class_column]
+            }, f, indent=4)
+        if tflite_quantization is not None:
+            export_tflite(model_dir, tflite_quantization, model=self.generator)
+    
+    def _fill_class_quotas(self, class_counts, max_iterations, min_acceptance_rate):
+        """Generator output with exactly class_counts rows per class, in shuffled order"""
+        if not 0 < min_acceptance_rate <= 1:
+            raise ValueError(f"min_acceptance_rate must be in (0, 1], got {min_acceptance_rate}")
+        quotas = np.zeros(self.num_classes, dtype=np.int64)
+        for label, count in class_counts.items():
+            code = self.decoder.class_code(label)
+            if code < 0:
+                raise ValueError(f"Unknown class {label}, expected one of {list(self.decoder.class_labels)}")
+            if int(count) != count or count < 0:
+                raise ValueError(f"Class counts must be non-negative integers, got {count} for class {label}")
+            quotas[code] += int(count)
+        if not quotas.any():
+            raise ValueError("class_counts must request at least one sample")
+        remaining = quotas.copy()
+        seen = np.zeros(self.num_classes, dtype=np.int64)
+        total_generated = 0
+        blocks = []
+        batch_size = min(max(2 * int(remaining.sum()), 1), self.MAX_GENERATION_BATCH)
+        
+        for iteration in range(max_iterations):
+            if not remaining.any():
+                break
+            noise = np.random.normal(0, 1, (batch_size, self.latent_dim))
+            generated_data = self.generator.predict(noise, verbose=0)
+            codes = self.decoder.class_codes(generated_data)
+            total_generated += batch_size
+            seen += np.bincount(codes, minlength=self.num_classes)
             
-            # Conversion of integer columns to integers
-            for col in self.integer_columns:
-                if col in samples_df.columns:
-                    col_min = self.column_ranges.get(col, {}).get('min', 0)
-                    col_max = self.column_ranges.get(col, {}).get('max', 1)
-                    samples_df[col] = np.round(samples_df[col]).clip(col_min, col_max).astype(int)
+            # Take the rows of every class that still needs some, grouped with one sort
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(self.num_classes + 1))
+            for code in np.flatnonzero(remaining):
+                rows = order[bounds[code]:bounds[code + 1]][:remaining[code]]
+                blocks.append(generated_data[rows])
+                remaining[code] -= len(rows)
+            if not remaining.any():
+                break
             
-            # Adding generated samples to the final dataframe
-            generated_samples = pd.concat([generated_samples, samples_df])
+            # Rates below min_acceptance_rate are distinguishable from it after 3 / min_acceptance_rate rows
+            if (total_generated >= 3 / min_acceptance_rate
+                    and (seen[remaining > 0] / total_generated < min_acceptance_rate).any()):
+                break
             
-            # Limit the number of generated samples to the required amount
-            generated_samples = generated_samples.head(num_samples)
-
-            if target_class and len(generated_samples) == 0:
-                raise ValueError(f"Unable to generate samples for target class {target_class}")
-
-        # Conversion of integer columns to integers
-        if self.class_column in self.integer_columns:
-            try:
-                generated_samples[self.class_column] = generated_samples[self.class_column].astype(int)
-            except:
-                pass
-                
-        return generated_samples
+            # Size the next batch for the class that needs the most rows at its observed acceptance rate
+            rates = (seen + 1) / (total_generated + 1)
+            rows_needed = remaining / rates
+            rows_left = (max_iterations - iteration - 1) * self.MAX_GENERATION_BATCH
+            if rows_needed.max() > rows_left:
+                break
+            batch_size = int(min(max(1.2 * rows_needed.max(), 1), self.MAX_GENERATION_BATCH))
+        
+        if remaining.any():
+            stats = "; ".join(
+                f"{self.decoder.class_labels[code]}: {quotas[code] - remaining[code]}/{quotas[code]} rows, "
+                f"acceptance rate {seen[code] / total_generated:.5f}"
+                for code in np.flatnonzero(remaining)
+            )
+            raise ValueError(f"Unable to fill the class quotas after {total_generated} generated rows ({stats})")
+        
+        generated_data = np.concatenate(blocks)
+        return generated_data[np.random.permutation(len(generated_data))]
     
 '''
 if __name__ == "__main__":
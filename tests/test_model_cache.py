@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from tabular_gan_modified import TabularGAN
+
+
+def _write_data(path, n_rows=200):
+    rng = np.random.default_rng(0)
+    pd.DataFrame({
+        'age': rng.integers(18, 80, n_rows),
+        'income': rng.normal(50000, 10000, n_rows),
+        'cls': rng.integers(0, 2, n_rows)
+    }).to_csv(path, sep=';', index=False)
+
+
+def test_reset_draws_new_weights(tmp_path):
+    data_path = str(tmp_path / 'data.csv')
+    _write_data(data_path)
+    cache = {}
+    first = TabularGAN(data_path, 'cls', latent_dim=4, gen_layers=[8], disc_layers=[8], model_cache=cache)
+    initial = first.generator.get_weights()
+    first.train(2, 16, patience=None, verbose=0)
+
+    second = TabularGAN(data_path, 'cls', latent_dim=4, gen_layers=[8], disc_layers=[8], model_cache=cache)
+    assert second.generator is first.generator
+    after_first_reset = second.generator.get_weights()
+    third = TabularGAN(data_path, 'cls', latent_dim=4, gen_layers=[8], disc_layers=[8], model_cache=cache)
+    after_second_reset = third.generator.get_weights()
+
+    assert not np.allclose(initial[0], after_first_reset[0])
+    assert not np.allclose(after_first_reset[0], after_second_reset[0])
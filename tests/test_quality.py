@@ -0,0 +1,22 @@
+import numpy as np
+from scipy.stats import ks_2samp, wasserstein_distance
+
+from gan_quality import _distribution_distances
+
+
+def test_distances_match_scipy_with_out_of_range_synthetic_data():
+    rng = np.random.default_rng(0)
+    real = rng.random((500, 4))
+    real[:, 3] = 0.5
+    synthetic = np.column_stack([
+        rng.normal(0.5, 0.2, 400),
+        rng.standard_t(2, 400),
+        rng.normal(1.8, 0.5, 400),
+        rng.normal(0.5, 1.0, 400)
+    ])
+
+    ks, wasserstein = _distribution_distances(np.sort(real, axis=0), synthetic)
+
+    for col in range(real.shape[1]):
+        assert np.isclose(ks[col], ks_2samp(real[:, col], synthetic[:, col]).statistic)
+        assert np.isclose(wasserstein[col], wasserstein_distance(real[:, col], synthetic[:, col]))